@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
 application = get_asgi_application()
+
+# Map the published route graph now, so workers share it from the first request
+from flights.utils.graph import preload_route_graph  # noqa: E402
+
+preload_route_graph()
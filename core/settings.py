@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "flights.middleware.ProfilingMiddleware",
+    "flights.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -73,14 +76,85 @@ WSGI_APPLICATION = "core.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite runs in WAL mode so reads don't wait for writers, and write
+# transactions take the lock up front (BEGIN IMMEDIATE): a busy writer makes
+# the others wait up to "timeout" seconds instead of failing with "database
+# is locked". Connections stay open between requests for CONN_MAX_AGE seconds.
+#
+# Setting POSTGRES_DB (with POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST
+# and POSTGRES_PORT) switches to PostgreSQL with a connection pool per worker
+# (needs psycopg[pool]); POSTGRES_REPLICA_HOST adds a "replica" database that
+# flights.routers.PrimaryReplicaRouter sends reads to.
 
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "timeout": 20,
+            "transaction_mode": "IMMEDIATE",
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA temp_store=MEMORY;"
+                "PRAGMA cache_size=-16000;"
+                "PRAGMA mmap_size=134217728;"
+            ),
+        },
+    }
+}
+
+if os.environ.get("POSTGRES_DB"):
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ["POSTGRES_DB"],
+        "USER": os.environ.get("POSTGRES_USER", ""),
+        "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+        "HOST": os.environ.get("POSTGRES_HOST", ""),
+        "PORT": os.environ.get("POSTGRES_PORT", ""),
+        # Pooled connections replace persistent ones (CONN_MAX_AGE must stay 0)
+        "OPTIONS": {"pool": {"min_size": 2, "max_size": 10, "timeout": 10}},
+    }
+    if os.environ.get("POSTGRES_REPLICA_HOST"):
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            "HOST": os.environ["POSTGRES_REPLICA_HOST"],
+            "TEST": {"MIRROR": "default"},
+        }
+
+DATABASE_ROUTERS = ["flights.routers.PrimaryReplicaRouter"]
+
+
+# Cache
+# Two levels (flights.cache.TieredCache): a per-process LRU of L1_MAX_ENTRIES
+# kept at most L1_TIMEOUT seconds, in front of a SQLite file every worker
+# shares. Entries stored with get_or_set are served up to STALE_TIMEOUT
+# seconds past their TTL while one worker refreshes them.
+
+CACHES = {
+    "default": {
+        "BACKEND": "flights.cache.TieredCache",
+        "LOCATION": BASE_DIR / "data" / "cache.sqlite3",
+        "TIMEOUT": 300,
+        "OPTIONS": {
+            "MAX_ENTRIES": 50000,
+            "L1_MAX_ENTRIES": 1000,
+            "L1_TIMEOUT": 5,
+            "STALE_TIMEOUT": 30,
+        },
     }
 }
 
+# Seconds each type of data stays cached: the globe snapshot, route search
+# results and airport departure/arrival boards
+CACHE_TTLS = {
+    "globe": 300,
+    "routes": 3600,
+    "boards": 15,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,3 +196,100 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Startup: build the routing graph, globe snapshot and spatial indexes on a
+# background thread when a server process starts (see flights.apps: gunicorn
+# workers via gunicorn.conf.py, runserver, or any process run with FLIGHTS_SERVING=1)
+WARM_CACHES_ON_STARTUP = True
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "flights": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
+# Request profiling (flights.middleware.ProfilingMiddleware): Server-Timing
+# headers and a JSON log line per request. A sampled share of requests is
+# stack-sampled every REQUEST_PROFILE_INTERVAL_MS, and the samples of those
+# slower than REQUEST_PROFILE_SLOW_MS are written to REQUEST_PROFILE_DIR.
+# With DEBUG on, an "X-Profile: 1" request header forces a profile.
+REQUEST_PROFILING = False
+REQUEST_PROFILE_SAMPLE_RATE = 0.01
+REQUEST_PROFILE_INTERVAL_MS = 5
+REQUEST_PROFILE_SLOW_MS = 500
+REQUEST_PROFILE_DIR = BASE_DIR / "data" / "profiles"
+
+# Metrics served at /metrics in the Prometheus text format. Each worker
+# writes its counters to METRICS_DIR/<pid>.json at most every
+# METRICS_FLUSH_INTERVAL seconds, and a scrape of any worker adds them up.
+# Clear METRICS_DIR before starting the server to reset the counters.
+METRICS_ENABLED = True
+METRICS_DIR = BASE_DIR / "data" / "metrics"
+METRICS_FLUSH_INTERVAL = 1.0
+
+# Routing
+# Search used by compute_trip: "astar", "bidirectional" or "ch"
+# ("ch" needs `python manage.py build_hierarchy` after every route import)
+
+ROUTING_ENGINE = "astar"
+
+ROUTE_HIERARCHY_PATH = BASE_DIR / "data" / "route_hierarchy.npz"
+
+# Memory-mapped route graph snapshots (one directory per dataset version plus a
+# CURRENT pointer), published by the loaders and `build_graph`
+ROUTE_GRAPH_DIR = BASE_DIR / "data" / "graph"
+
+# Route result cache: in-process LRU size, plus the CACHES alias shared
+# between workers (None to keep results per process)
+ROUTE_CACHE_SIZE = 10000
+ROUTE_CACHE_BACKEND = "default"
+
+# Async routing/search views offload searches to a pool of this many threads;
+# beyond SEARCH_POOL_MAX_PENDING distinct queued searches they answer 503
+SEARCH_POOL_WORKERS = 4
+SEARCH_POOL_MAX_PENDING = 64
+
+# Minimum time between connecting flights for {"mode": "schedule"} trips
+MIN_CONNECTION_MINUTES = 30
+
+# Largest number of O/D pairs accepted by /api/compute_trips/
+TRIP_BATCH_MAX_SIZE = 500
+
+# Globe snapshot served by /api/globe-data/, rebuilt by `build_globe` and
+# the data loaders (cached under the file's mtime, see CACHE_TTLS)
+GLOBE_SNAPSHOT_PATH = BASE_DIR / "data" / "globe.json.gz"
+
+# Caps on a single /api/globe-lod/ response
+GLOBE_LOD_MAX_AIRPORTS = 500
+GLOBE_LOD_MAX_ROUTES = 2000
+
+# Caps for /api/airports/nearest/ and /api/airports/within/: airports per
+# point, and points per POSTed batch
+AIRPORT_SEARCH_MAX_RESULTS = 500
+AIRPORT_SEARCH_MAX_BATCH = 1000
+
+# Results `manage.py benchmark` compares against (--save-baseline records them)
+BENCHMARK_BASELINE_PATH = BASE_DIR / "data" / "benchmark_baseline.json"
+
+# Largest ?hours= and ?hops= accepted by /api/airport/<code>/isochrone/
+ISOCHRONE_MAX_HOURS = 72
+ISOCHRONE_MAX_HOPS = 12
+
+# Most components listed by /api/components/?limit=
+COMPONENTS_MAX_RESULTS = 1000
+
+# Upper bound on origins x destinations for /api/airports/distances/
+DISTANCE_MATRIX_MAX_CELLS = 250000
+
+# Largest page /api/trips/?limit= will return
+TRIP_LIST_MAX_PAGE_SIZE = 100
+
+# /api/airport/<code>/departures/ and arrivals/: largest page and widest window
+AIRPORT_BOARD_MAX_PAGE_SIZE = 100
+AIRPORT_BOARD_MAX_HOURS = 168
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
 application = get_wsgi_application()
+
+# Map the published route graph now, so workers share it from the first request
+from flights.utils.graph import preload_route_graph  # noqa: E402
+
+preload_route_graph()
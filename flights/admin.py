@@ -1,8 +1,9 @@
 from django.contrib import admin
 
-from flights.models import Airport, Flight, Route, Trip, TripFlight
+from flights.models import Airport, DataImport, Flight, Route, Trip, TripFlight
 
 admin.site.register(Airport)
+admin.site.register(DataImport)
 admin.site.register(Flight)
 admin.site.register(Route)
 admin.site.register(Trip)
@@ -1,6 +1,43 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+_serving = False
+
+
+def serving_requests():
+    """
+    True in processes that serve HTTP: the runserver child process, workers
+    that called start_serving() (gunicorn.conf.py does, after each fork) and
+    processes started with FLIGHTS_SERVING=1 (for single-process servers
+    such as uvicorn). Management commands, test runners and scripts return False.
+    """
+    if _serving or os.environ.get("FLIGHTS_SERVING") == "1":
+        return True
+    return sys.argv[1:2] == ["runserver"] and (os.environ.get("RUN_MAIN") == "true" or "--noreload" in sys.argv)
+
+
+def start_serving():
+    """
+    Marks this process as a server and starts warming its caches. Call it in
+    each worker after fork: threads started before a fork don't run in the child.
+    """
+    global _serving
+
+    _serving = True
+    # Build the routing graph, globe snapshot and indexes ahead of traffic
+    if getattr(settings, "WARM_CACHES_ON_STARTUP", True):
+        from flights.utils.warmup import start_background_warmup
+
+        start_background_warmup()
 
 
 class FlightsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "flights"
+
+    def ready(self):
+        if serving_requests():
+            start_serving()
@@ -0,0 +1,266 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Stored in place of "never expires"
+FOREVER = float("inf")
+
+
+def cache_ttl(kind):
+    """
+    Timeout in seconds for one type of cached data ("globe", "routes", "boards"), from settings.CACHE_TTLS.
+    """
+    return getattr(settings, "CACHE_TTLS", {}).get(kind, 300)
+
+
+class SQLiteStore:
+    """
+    Pickled cache entries in one SQLite file shared by every worker process.
+    WAL mode lets readers proceed while another process writes.
+    """
+
+    def __init__(self, path, max_entries=10000, cull_frequency=3):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.cull_frequency = cull_frequency
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        # One connection per thread, reopened in forked children
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL, refresh_at REAL NOT NULL)"
+            )
+            self._local.connection, self._local.pid = connection, pid
+        return self._local.connection
+
+    def get(self, key, now):
+        """
+        Returns (value, refresh_at, expires) for an unexpired entry, else None.
+        """
+        row = self._connection().execute(
+            "SELECT value, refresh_at, expires FROM cache_entries WHERE key = ? AND expires > ?", (key, now)
+        ).fetchone()
+        return (pickle.loads(row[0]), row[1], row[2]) if row else None
+
+    def set(self, key, value, expires, refresh_at, only_if_absent=False, now=None):
+        """
+        Stores an entry; with ``only_if_absent``, only if no unexpired entry
+        exists, atomically across processes. Returns whether it was stored.
+        """
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        connection = self._connection()
+        if only_if_absent:
+            cursor = connection.execute(
+                "INSERT INTO cache_entries (key, value, expires, refresh_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires, "
+                "refresh_at = excluded.refresh_at WHERE cache_entries.expires <= ?",
+                (key, blob, expires, refresh_at, now),
+            )
+        else:
+            cursor = connection.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires, refresh_at) VALUES (?, ?, ?, ?)",
+                (key, blob, expires, refresh_at),
+            )
+        self._writes += 1
+        if self._writes % 256 == 0:
+            self.cull(time.time())
+        return cursor.rowcount > 0
+
+    def touch(self, key, expires, now):
+        cursor = self._connection().execute(
+            "UPDATE cache_entries SET expires = ?, refresh_at = ? WHERE key = ? AND expires > ?",
+            (expires, expires, key, now),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key):
+        return self._connection().execute("DELETE FROM cache_entries WHERE key = ?", (key,)).rowcount > 0
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache_entries")
+
+    def cull(self, now):
+        connection = self._connection()
+        connection.execute("DELETE FROM cache_entries WHERE expires <= ?", (now,))
+        (count,) = connection.execute("SELECT COUNT(*) FROM cache_entries").fetchone()
+        if count > self.max_entries:
+            # Drop the entries closest to expiring
+            connection.execute(
+                "DELETE FROM cache_entries WHERE key IN "
+                "(SELECT key FROM cache_entries ORDER BY expires LIMIT ?)",
+                (count - self.max_entries + self.max_entries // self.cull_frequency,),
+            )
+
+
+class TieredCache(BaseCache):
+    """
+    Two-level cache backend: a small per-process LRU (L1) in front of a
+    SQLite file shared by all workers (L2, at LOCATION).
+
+    L1 entries live at most OPTIONS["L1_TIMEOUT"] seconds, which bounds how
+    long a worker can keep serving a value another worker replaced; values
+    come back as the same object while they are in L1, so don't mutate them.
+
+    get_or_set() protects against stampedes: an entry it stores stays
+    readable OPTIONS["STALE_TIMEOUT"] seconds past its timeout, and once the
+    timeout passes one caller (across processes) recomputes it while the
+    others keep getting the stale value. Callers only wait when there is no
+    value at all.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.l1_max_entries = options.get("L1_MAX_ENTRIES", 1000)
+        self.l1_timeout = options.get("L1_TIMEOUT", 5)
+        self.stale_timeout = options.get("STALE_TIMEOUT", 30)
+        self.lock_timeout = options.get("LOCK_TIMEOUT", 30)
+        self.store = SQLiteStore(location, self._max_entries, self._cull_frequency)
+        self._l1 = OrderedDict()
+        self._l1_lock = threading.Lock()
+        self._refresh_locks = {}
+
+    def _expiry(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return FOREVER if expires is None else expires
+
+    def _l1_get(self, key, now):
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return entry[1], entry[2], entry[0]
+
+    def _l1_set(self, key, value, refresh_at, expires, now):
+        with self._l1_lock:
+            self._l1[key] = (min(expires, now + self.l1_timeout), value, refresh_at)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key):
+        with self._l1_lock:
+            self._l1.pop(key, None)
+
+    def _get_entry(self, key, now):
+        # (value, refresh_at, expires) from L1, else L2 (copied into L1)
+        entry = self._l1_get(key, now)
+        if entry is None:
+            entry = self.store.get(key, now)
+            if entry is not None:
+                self._l1_set(key, *entry, now)
+        return entry
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        entry = self._get_entry(key, now)
+        # Entries kept past their timeout for get_or_set only count as misses here
+        if entry is None or entry[1] <= now:
+            return default
+        return entry[0]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        expires = self._expiry(timeout)
+        self.store.set(key, value, expires, expires)
+        self._l1_set(key, value, expires, expires, now)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        expires = self._expiry(timeout)
+        if not self.store.set(key, value, expires, expires, only_if_absent=True, now=now):
+            return False
+        self._l1_set(key, value, expires, expires, now)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._l1_delete(key)
+        now = time.time()
+        return self.store.touch(key, self._expiry(timeout), now)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._l1_delete(key)
+        return self.store.delete(key)
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        with self._l1_lock:
+            self._l1.clear()
+        self.store.clear()
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        entry = self._get_entry(key, now)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        with self._l1_lock:
+            local = self._refresh_locks.setdefault(key, threading.Lock())
+        # Threads of this process that can serve a stale value don't queue up behind the refresh
+        if not local.acquire(blocking=entry is None):
+            return entry[0]
+        try:
+            now = time.time()
+            entry = self._get_entry(key, now)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+
+            lock_key = key + ":refresh"
+            deadline = now + self.lock_timeout
+            while not self.store.set(lock_key, True, now + self.lock_timeout, now + self.lock_timeout,
+                                     only_if_absent=True, now=now):
+                # Another process is refreshing it: serve stale, or wait for the new value
+                if entry is not None:
+                    return entry[0]
+                time.sleep(0.05)
+                now = time.time()
+                entry = self.store.get(key, now)
+                if entry is not None:
+                    self._l1_set(key, *entry, now)
+                    return entry[0]
+                if now >= deadline:
+                    # The refresher seems stuck; compute without the lock
+                    lock_key = None
+                    break
+
+            try:
+                value = default() if callable(default) else default
+                now = time.time()
+                refresh_at = self._expiry(timeout)
+                self.store.set(key, value, refresh_at + self.stale_timeout, refresh_at)
+                self._l1_set(key, value, refresh_at, refresh_at + self.stale_timeout, now)
+                return value
+            finally:
+                if lock_key is not None:
+                    self.store.delete(lock_key)
+        finally:
+            local.release()
+            with self._l1_lock:
+                if self._refresh_locks.get(key) is local and not local.locked():
+                    del self._refresh_locks[key]
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+
+from flights.utils.geodesy import EARTH_RADIUS_KM, distance_matrix, pairwise_distances
+from flights.utils.graph import build_route_graph
+
+import time
+from math import asin, cos, radians, sin, sqrt
+
+import numpy as np
+
+def scalar_haversine(lat1, lon1, lat2, lon2):
+    """
+    One pair at a time with the math module, as load_routes used to do it.
+    """
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    a = sin((lat2 - lat1) / 2)**2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(min(max(a, 0), 1)))
+
+class Command(BaseCommand):
+    help = "Benchmarks the vectorized haversine kernel against the scalar formula on airport pairs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pairs", type=int, default=200000, help="Random airport pairs to measure")
+        parser.add_argument("--matrix", type=int, default=1000, help="Side of the N x N distance matrix to time")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        graph = build_route_graph()
+        if not len(graph):
+            self.stdout.write(self.style.ERROR("No airports loaded"))
+            return
+        rng = np.random.default_rng(options["seed"])
+        sources = rng.integers(0, len(graph), options["pairs"])
+        targets = rng.integers(0, len(graph), options["pairs"])
+
+        lat, lon = graph.lat.tolist(), graph.lon.tolist()
+        started = time.perf_counter()
+        scalar = [
+            scalar_haversine(lat[source], lon[source], lat[target], lon[target])
+            for source, target in zip(sources.tolist(), targets.tolist())
+        ]
+        scalar_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        vectorized = pairwise_distances(graph, sources, targets)
+        vector_seconds = time.perf_counter() - started
+
+        error = float(np.max(np.abs(vectorized - np.array(scalar)))) if len(scalar) else 0.0
+        self.stdout.write(
+            f"{options['pairs']} pairs: scalar {scalar_seconds * 1000:.1f} ms, "
+            f"vectorized {vector_seconds * 1000:.1f} ms ({scalar_seconds / max(vector_seconds, 1e-9):.0f}x), "
+            f"max difference {error:.2e} km"
+        )
+
+        side = min(options["matrix"], len(graph))
+        nodes = rng.choice(len(graph), side, replace=False)
+        started = time.perf_counter()
+        distance_matrix(graph, nodes, nodes)
+        self.stdout.write(f"{side} x {side} matrix: {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from flights.models import Airport, Route
+from flights.utils.benchmarks import ENGINES, bench_api, bench_routing, find_regressions, od_pairs
+from flights.utils.graph import get_route_graph
+
+import io
+import json
+import os
+import platform
+import tempfile
+
+import numpy as np
+
+class Command(BaseCommand):
+    help = (
+        "Loads the bundled airports/routes into a throwaway test database, times routing and the main "
+        "API endpoints, and fails when a result regresses past the stored baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--airports", default="data/airports.dat", help="OpenFlights airports.dat to load")
+        parser.add_argument("--routes", default="data/routes.dat", help="OpenFlights routes.dat to load")
+        parser.add_argument("--pairs", type=int, default=100, help="Seeded origin/destination pairs to route")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=20, help="Requests per read-only endpoint")
+        parser.add_argument(
+            "--engines", nargs="+", choices=ENGINES, default=["astar", "bidirectional"],
+            help="Routing engines to time ('ch' contracts the full graph first, which takes a while)",
+        )
+        parser.add_argument("--output", help="Also write the results JSON here")
+        parser.add_argument("--baseline", default=str(settings.BENCHMARK_BASELINE_PATH), help="Baseline JSON to compare against")
+        parser.add_argument("--save-baseline", action="store_true", help="Record these results as the new baseline")
+        parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown of a median (0.5 = 50%%) before it fails")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # Artifacts the loaders publish go to scratch space, not data/
+        scratch = tempfile.TemporaryDirectory()
+        artifacts = override_settings(
+            ROUTE_GRAPH_DIR=os.path.join(scratch.name, "graph"),
+            GLOBE_SNAPSHOT_PATH=os.path.join(scratch.name, "globe.json.gz"),
+            ROUTE_HIERARCHY_PATH=os.path.join(scratch.name, "route_hierarchy.npz"),
+            METRICS_DIR=os.path.join(scratch.name, "metrics"),
+            CACHES={
+                **settings.CACHES,
+                "default": {**settings.CACHES["default"], "LOCATION": os.path.join(scratch.name, "cache.sqlite3")},
+            },
+        )
+        artifacts.enable()
+        try:
+            cache.clear()
+            call_command("load_airports", file=options["airports"], stdout=io.StringIO())
+            call_command("load_routes", file=options["routes"], stdout=io.StringIO())
+            report = self.run_benchmarks(options)
+        finally:
+            artifacts.disable()
+            scratch.cleanup()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in report["results"].items():
+            extra = "".join(f", {metric} {result[metric]}" for metric in ("queries", "expanded") if metric in result)
+            self.stdout.write(f"{name:24} median {result['median_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f} ms{extra}")
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+
+        baseline_path = options["baseline"]
+        if options["save_baseline"]:
+            os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+            with open(baseline_path, "w") as f:
+                f.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {baseline_path}"))
+            return
+
+        if not os.path.exists(baseline_path):
+            self.stdout.write(self.style.WARNING(f"No baseline at {baseline_path}; run with --save-baseline to record one"))
+            return
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["dataset"] != report["meta"]["dataset"]:
+            self.stdout.write(self.style.WARNING("Baseline was recorded on a different dataset or pair set"))
+
+        regressions = find_regressions(report["results"], baseline["results"], tolerance=options["tolerance"])
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(regression))
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed past {baseline_path}")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def run_benchmarks(self, options):
+        graph = get_route_graph()
+        pairs = od_pairs(graph, options["pairs"], options["seed"])
+        if not pairs:
+            raise CommandError("No connected airport pairs to benchmark")
+
+        results = bench_routing(graph, pairs, options["engines"])
+        results.update(bench_api(pairs, options["repeat"]))
+        return {
+            "meta": {
+                "dataset": {
+                    "airports": Airport.objects.count(),
+                    "routes": Route.objects.count(),
+                    "pairs": len(pairs),
+                    "seed": options["seed"],
+                },
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+            },
+            "results": results,
+        }
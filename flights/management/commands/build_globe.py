@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from flights.utils.globe import publish_globe_snapshot, snapshot_path
+
+class Command(BaseCommand): 
+    help = "Rebuilds the precompressed globe snapshot served by /api/globe-data/"
+    
+    def handle(self, *args, **kwargs): 
+        snapshot = publish_globe_snapshot()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Published globe snapshot {snapshot.etag} ({len(snapshot.body)} bytes, {len(snapshot.gzip)} gzipped) to {snapshot_path()}"
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from flights.utils.graph import build_route_graph, publish_route_graph
+
+import time
+
+class Command(BaseCommand): 
+    help = "Publishes the memory-mapped route graph snapshot that workers share"
+    
+    def handle(self, *args, **kwargs): 
+        started = time.perf_counter()
+        graph = build_route_graph()
+        directory = publish_route_graph(graph)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {len(graph)} airports / {graph.num_edges} routes (version {graph.version}) "
+            f"in {time.perf_counter() - started:.2f}s -> {directory}"
+        ))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from flights.utils.graph import build_route_graph
+from flights.utils.hierarchy import contract_graph
+
+import time
+
+class Command(BaseCommand): 
+    help = "Contracts the Route graph into a contraction hierarchy for ROUTING_ENGINE = 'ch'"
+    
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=str(settings.ROUTE_HIERARCHY_PATH), help="Where to save the hierarchy (.npz)")
+    
+    def handle(self, *args, **options): 
+        started = time.perf_counter()
+        graph = build_route_graph()
+        hierarchy = contract_graph(graph)
+        hierarchy.save(options["output"])
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Contracted {len(graph)} airports / {graph.num_edges} routes into {hierarchy.num_edges} hierarchy edges "
+            f"in {time.perf_counter() - started:.1f}s -> {options['output']}"
+        ))
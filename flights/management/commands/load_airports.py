@@ -1,16 +1,30 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from flights.models import Airport
+from flights.utils.globe import publish_globe_snapshot
+from flights.utils.graph import publish_route_graph
+from flights.utils.imports import file_checksum, get_import, record_import
 
 import csv
 
-class Command(BaseCommand): 
-    help = "Loads airport data into the Airport model"
-    
-    def handle(self, *args, **kwargs): 
-        with open("data/airports.dat", encoding="utf-8") as f: 
+class Command(BaseCommand):
+    help = "Syncs airport data into the Airport model, applying only what changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", default="data/airports.dat", help="OpenFlights airports.dat to import")
+        parser.add_argument("--force", action="store_true", help="Diff against the tables even if the file is unchanged")
+
+    def handle(self, *args, **options):
+        checksum = file_checksum(options["file"])
+        state = get_import("airports")
+        if state.checksum == checksum and not options["force"]:
+            self.stdout.write("Airport data unchanged, nothing to do")
+            return
+
+        airports = {}
+        with open(options["file"], encoding="utf-8") as f:
             reader = csv.reader(f)
-            airports = []
 
             for row in reader:
                 code = row[4]
@@ -20,16 +34,39 @@ class Command(BaseCommand):
                 lat = float(row[6])
                 lon = float(row[7])
 
-                airports.append(
-                    Airport(
-                        code=code,
-                        name=name,
-                        latitude=lat,
-                        longitude=lon,
-                    )
-                )
-                
-            Airport.objects.all().delete()
-            Airport.objects.bulk_create(airports)
-                
-        self.stdout.write(self.style.SUCCESS(f"Imported {len(airports)} airports in bulk"))
\ No newline at end of file
+                airports.setdefault(code, (name, lat, lon))
+
+        current = {airport.code: airport for airport in Airport.objects.only("id", "code", "name", "latitude", "longitude")}
+
+        added = [
+            Airport(code=code, name=name, latitude=lat, longitude=lon)
+            for code, (name, lat, lon) in airports.items()
+            if code not in current
+        ]
+        changed = []
+        moved = False
+        for code, (name, lat, lon) in airports.items():
+            airport = current.get(code)
+            if airport is not None and (airport.name, airport.latitude, airport.longitude) != (name, lat, lon):
+                moved = moved or (airport.latitude, airport.longitude) != (lat, lon)
+                airport.name, airport.latitude, airport.longitude = name, lat, lon
+                changed.append(airport)
+        # Removing an airport cascades to its routes, flights and trips; everything else is kept
+        removed = [airport.id for code, airport in current.items() if code not in airports]
+
+        with transaction.atomic():
+            Airport.objects.bulk_create(added, batch_size=1000)
+            Airport.objects.bulk_update(changed, ["name", "latitude", "longitude"], batch_size=1000)
+            for start in range(0, len(removed), 1000):
+                Airport.objects.filter(id__in=removed[start:start + 1000]).delete()
+            record_import(state, checksum, changed=bool(added or changed or removed))
+
+        if added or changed or removed:
+            publish_globe_snapshot()
+            publish_route_graph()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Airports added: {len(added)}, changed: {len(changed)}, removed: {len(removed)}"
+        ))
+        if moved or removed:
+            self.stdout.write(self.style.WARNING("Run load_routes to refresh route distances and connection counts"))
@@ -1,45 +1,60 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from flights.models import Route, Airport
+from flights.utils.geodesy import haversine
+from flights.utils.globe import publish_globe_snapshot
+from flights.utils.graph import publish_route_graph
+from flights.utils.imports import file_checksum, get_import, record_import
 
 import csv
+import hashlib
+import time
 from collections import defaultdict
-from math import radians, cos, sin, sqrt, atan2
-
-class Command(BaseCommand): 
-    help = "Loads route data into the Route model"
-    
-    def haversine(self, lat1, lon1, lat2, lon2): 
-        """
-        Computes great-circle distance between two points using the Haversine formula.
-        Inputs are in degrees. Output is in kilometers.
-        """
-        
-        R = 6371 # Radius of Earth in km
-        
-        # Convert degrees to radians
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-        
-        delta_lat = lat2 - lat1
-        delta_lon = lon2 - lon1
-        
-        # Haversine formula
-        a = sin(delta_lat / 2)**2 + cos(lat1) * cos(lat2) * sin(delta_lon / 2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        
-        return R * c
-    
-    def handle(self, *args, **kwargs):
-        route_objs = []
+
+import numpy as np
+
+class Command(BaseCommand):
+    help = "Syncs route data into the Route model, applying only what changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Routes per INSERT batch")
+        parser.add_argument("--file", default="data/routes.dat", help="OpenFlights routes.dat to import")
+        parser.add_argument("--force", action="store_true", help="Diff against the tables even if the file is unchanged")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        started = time.perf_counter()
+
+        # Distances depend on airport coordinates, so an airport sync also invalidates routes
+        # (hashed together so it fits DataImport.checksum)
+        checksum = hashlib.sha256(
+            "{}:{}".format(file_checksum(options["file"]), get_import("airports").checksum).encode()
+        ).hexdigest()
+        state = get_import("routes")
+        if state.checksum == checksum and not options["force"]:
+            self.stdout.write("Route data unchanged, nothing to do")
+            return
+
+        rows = 0
         skipped = 0
         duplicates = 0
+        seen = set()
+        pairs = []  # (origin pk, lat, lon, destination pk, lat, lon)
         outbound_counts = defaultdict(int)
         inbound_counts = defaultdict(int)
-        
-        with open("data/routes.dat", encoding="utf-8") as f:
+
+        # code -> (pk, latitude, longitude), loaded once instead of two lookups per row
+        airports = {
+            code: (pk, lat, lon)
+            for pk, code, lat, lon in Airport.objects.values_list("id", "code", "latitude", "longitude")
+        }
+
+        with open(options["file"], encoding="utf-8") as f:
             reader = csv.reader(f)
-            
+
             for row in reader:
+                rows += 1
                 try:
                     source_code = row[2].strip().upper()
                     dest_code = row[4].strip().upper()
@@ -49,47 +64,83 @@ class Command(BaseCommand):
                         skipped += 1
                         continue
 
-                    try:
-                        origin = Airport.objects.get(code=source_code)
-                        destination = Airport.objects.get(code=dest_code)
-                    except Airport.DoesNotExist:
+                    origin = airports.get(source_code)
+                    destination = airports.get(dest_code)
+                    if origin is None or destination is None:
                         skipped += 1
                         continue
 
-                    # Calculate distance between airports
-                    distance = self.haversine(
-                        origin.latitude, origin.longitude,
-                        destination.latitude, destination.longitude
-                    )
-
-                    # Check for duplicate before adding
-                    if Route.objects.filter(origin=origin, destination=destination).exists():
+                    # Several airlines fly the same pair; keep one route per pair
+                    if (source_code, dest_code) in seen:
                         duplicates += 1
                         continue
+                    seen.add((source_code, dest_code))
+
+                    pairs.append((*origin, *destination))
 
-                    route_objs.append(
-                        Route(origin=origin, destination=destination, distance=distance)
-                    )
-                    
-                    outbound_counts[origin.code] += 1
-                    inbound_counts[destination.code] += 1
+                    outbound_counts[origin[0]] += 1
+                    inbound_counts[destination[0]] += 1
 
                 except Exception as e:
                     self.stdout.write(self.style.ERROR(f"Error processing row: {row}"))
                     self.stdout.write(self.style.ERROR(str(e)))
                     skipped += 1
 
-        # Bulk create all Route objects at once
-        Route.objects.all().delete()
-        Route.objects.bulk_create(route_objs)
-        
-        # Update airports with connection counts
-        airports = Airport.objects.all()
-        for airport in airports:
-            airport.outbound_connections = outbound_counts[airport.code]
-            airport.inbound_connections = inbound_counts[airport.code]
-        Airport.objects.bulk_update(airports, ['outbound_connections', 'inbound_connections'])
-
-        self.stdout.write(self.style.SUCCESS(f"Routes created: {len(route_objs)}"))
+        # Calculate every distance in one pass
+        pairs = np.array(pairs, dtype=np.float64).reshape(-1, 6)
+        distances = haversine(pairs[:, 1], pairs[:, 2], pairs[:, 4], pairs[:, 5])
+        routes = {
+            (origin_id, destination_id): distance
+            for origin_id, destination_id, distance in zip(
+                pairs[:, 0].astype(int).tolist(), pairs[:, 3].astype(int).tolist(), distances.tolist()
+            )
+        }
+
+        # Diff against the current table
+        current = {
+            (origin_id, destination_id): (pk, distance)
+            for pk, origin_id, destination_id, distance in Route.objects.values_list(
+                "id", "origin_id", "destination_id", "distance"
+            ).iterator(chunk_size=batch_size)
+        }
+        added = [
+            Route(origin_id=origin_id, destination_id=destination_id, distance=distance)
+            for (origin_id, destination_id), distance in routes.items()
+            if (origin_id, destination_id) not in current
+        ]
+        changed = [
+            Route(id=pk, distance=routes[pair])
+            for pair, (pk, distance) in current.items()
+            if pair in routes and abs(routes[pair] - distance) > 1e-6
+        ]
+        removed = [pk for pair, (pk, _) in current.items() if pair not in routes]
+
+        # Only airports whose connection counts moved are written
+        counted = []
+        for airport in Airport.objects.only("id", "outbound_connections", "inbound_connections"):
+            counts = (outbound_counts[airport.id], inbound_counts[airport.id])
+            if (airport.outbound_connections, airport.inbound_connections) != counts:
+                airport.outbound_connections, airport.inbound_connections = counts
+                counted.append(airport)
+
+        with transaction.atomic():
+            for start in range(0, len(removed), batch_size):
+                Route.objects.filter(id__in=removed[start:start + batch_size]).delete()
+            Route.objects.bulk_create(added, batch_size=batch_size)
+            Route.objects.bulk_update(changed, ["distance"], batch_size=batch_size)
+            Airport.objects.bulk_update(counted, ["outbound_connections", "inbound_connections"], batch_size=batch_size)
+            record_import(state, checksum, changed=bool(added or changed or removed))
+
+        elapsed = time.perf_counter() - started
+
+        if added or changed or removed:
+            publish_globe_snapshot()
+            publish_route_graph()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Routes added: {len(added)}, changed: {len(changed)}, removed: {len(removed)}"
+        ))
+        self.stdout.write(f"Airport connection counts updated: {len(counted)}")
         self.stdout.write(self.style.WARNING(f"Routes skipped (invalid/missing): {skipped}"))
-        self.stdout.write(self.style.WARNING(f"Routes skipped (duplicates): {duplicates}"))
\ No newline at end of file
+        self.stdout.write(self.style.WARNING(f"Routes skipped (duplicates): {duplicates}"))
+        self.stdout.write(f"Imported {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/sec)")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from flights.utils.warmup import ARTIFACTS, warm_caches
+
+class Command(BaseCommand): 
+    help = "Builds the routing graph, globe snapshot and spatial indexes ahead of traffic, rebuilding any that are missing"
+    
+    def add_arguments(self, parser):
+        parser.add_argument("--only", nargs="+", choices=list(ARTIFACTS), help="Warm just these artifacts")
+    
+    def handle(self, *args, **options): 
+        timings = warm_caches(options["only"], trace_memory=True)
+        
+        for name, seconds, allocated in timings:
+            self.stdout.write(f"{name:<16} {seconds * 1000:9.1f} ms {allocated / 2**20:9.1f} MiB")
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {len(timings)} artifacts in {sum(seconds for _, seconds, _ in timings):.2f}s"
+        ))
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import random
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.timezone import now
+
+from flights.utils.metrics import inc, observe
+from flights.utils.profiling import RequestProfile, StackSampler, current_profile, install_query_counter, profile_request
+
+logger = logging.getLogger("flights.profiling")
+
+
+def server_timing(profile, total_seconds):
+    """
+    Server-Timing header value: each phase, the SQL total and the whole request, in ms.
+    """
+    metrics = ["{};dur={:.2f}".format(name, seconds * 1000) for name, seconds in profile.phases.items()]
+    metrics.append('db;dur={:.2f};desc="{} queries"'.format(profile.query_seconds * 1000, profile.queries))
+    metrics.append("total;dur={:.2f}".format(total_seconds * 1000))
+    return ", ".join(metrics)
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in (settings.REQUEST_PROFILING) per-request instrumentation: phase
+    timings recorded with flights.utils.profiling.phase(), SQL query counts
+    and time, reported in a Server-Timing header and one JSON log line per
+    request on the "flights.profiling" logger.
+
+    A REQUEST_PROFILE_SAMPLE_RATE share of requests (and, with DEBUG on,
+    any request sent with an "X-Profile: 1" header) is stack-sampled; samples of
+    requests slower than REQUEST_PROFILE_SLOW_MS, or explicitly asked for, are
+    written to REQUEST_PROFILE_DIR as folded stacks.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REQUEST_PROFILING", False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        install_query_counter()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile, sampler, forced, started = self.start(request)
+        with profile_request(profile):
+            response = self.get_response(request)
+        return self.finish(request, response, profile, sampler, forced, started)
+
+    async def __acall__(self, request):
+        profile, sampler, forced, started = self.start(request)
+        with profile_request(profile):
+            response = await self.get_response(request)
+        return self.finish(request, response, profile, sampler, forced, started)
+
+    def start(self, request):
+        forced = settings.DEBUG and request.headers.get("X-Profile") == "1"
+        sampled = forced or random.random() < getattr(settings, "REQUEST_PROFILE_SAMPLE_RATE", 0.0)
+        sampler = StackSampler(getattr(settings, "REQUEST_PROFILE_INTERVAL_MS", 5) / 1000).start() if sampled else None
+        return RequestProfile(), sampler, forced, time.perf_counter()
+
+    def finish(self, request, response, profile, sampler, forced, started):
+        elapsed = time.perf_counter() - started
+        saved = None
+        if sampler is not None:
+            sampler.stop()
+            if forced or elapsed * 1000 >= getattr(settings, "REQUEST_PROFILE_SLOW_MS", 500):
+                saved = self.save_samples(request, sampler, elapsed)
+
+        response["Server-Timing"] = server_timing(profile, elapsed)
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(elapsed * 1000, 2),
+            "db_queries": profile.queries,
+            "db_ms": round(profile.query_seconds * 1000, 2),
+            "phases": {name: round(seconds * 1000, 2) for name, seconds in profile.phases.items()},
+            "profile": saved,
+        }))
+        return response
+
+    def save_samples(self, request, sampler, elapsed):
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", request.path).strip("-") or "root"
+        name = "{}-{}-{}-{:.0f}ms.folded".format(now().strftime("%Y%m%dT%H%M%S%f"), request.method, slug, elapsed * 1000)
+        path = os.path.join(settings.REQUEST_PROFILE_DIR, name)
+        sampler.write(path)
+        return path
+
+
+class MetricsMiddleware:
+    """
+    Records every request's latency, status and SQL query count in the
+    metrics store served at /metrics (settings.METRICS_ENABLED). Endpoints
+    are labelled by URL name, so label values stay bounded.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "METRICS_ENABLED", True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        install_query_counter()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Share the profile when ProfilingMiddleware already started one
+        profile, started = current_profile() or RequestProfile(), time.perf_counter()
+        with profile_request(profile):
+            response = self.get_response(request)
+        self.record(request, response, profile, started)
+        return response
+
+    async def __acall__(self, request):
+        profile, started = current_profile() or RequestProfile(), time.perf_counter()
+        with profile_request(profile):
+            response = await self.get_response(request)
+        self.record(request, response, profile, started)
+        return response
+
+    def record(self, request, response, profile, started):
+        match = getattr(request, "resolver_match", None)
+        endpoint = match.view_name if match is not None else "unmatched"
+        inc("flights_http_requests_total", endpoint=endpoint, method=request.method, status=str(response.status_code))
+        observe("flights_http_request_duration_seconds", time.perf_counter() - started, endpoint=endpoint)
+        observe("flights_db_queries_per_request", profile.queries, endpoint=endpoint)
+
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 08:49
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def backfill_trip_summary(apps, schema_editor):
+    Trip = apps.get_model("flights", "Trip")
+
+    trips = list(
+        Trip.objects.annotate(
+            summary_departure=Min("flights__flight__departure_time"),
+            summary_arrival=Max("flights__flight__arrival_time"),
+            summary_flights=Count("flights"),
+        )
+    )
+    for trip in trips:
+        trip.first_departure_time = trip.summary_departure
+        trip.arrival_time = trip.summary_arrival
+        trip.num_flights = trip.summary_flights
+    Trip.objects.bulk_update(
+        trips, ["first_departure_time", "arrival_time", "num_flights"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("flights", "0004_trip_tripflight"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="arrival_time",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="first_departure_time",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="num_flights",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="trip",
+            index=models.Index(fields=["-created_at", "-id"], name="trip_created_idx"),
+        ),
+        migrations.RunPython(backfill_trip_summary, migrations.RunPython.noop),
+    ]
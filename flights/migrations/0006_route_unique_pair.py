@@ -0,0 +1,39 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def dedupe_routes(apps, schema_editor):
+    """
+    Older imports could store the same origin/destination pair more than
+    once; keep the first route of each pair and recount connections.
+    """
+    Airport = apps.get_model("flights", "Airport")
+    Route = apps.get_model("flights", "Route")
+
+    first_ids = Route.objects.values("origin", "destination").annotate(first=Min("id")).values("first")
+    deleted, _ = Route.objects.exclude(id__in=first_ids).delete()
+    if not deleted:
+        return
+
+    outbound = dict(Route.objects.values_list("origin").annotate(total=Count("id")))
+    inbound = dict(Route.objects.values_list("destination").annotate(total=Count("id")))
+    airports = list(Airport.objects.only("id"))
+    for airport in airports:
+        airport.outbound_connections = outbound.get(airport.id, 0)
+        airport.inbound_connections = inbound.get(airport.id, 0)
+    Airport.objects.bulk_update(airports, ["outbound_connections", "inbound_connections"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("flights", "0005_trip_summary"),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_routes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="route",
+            unique_together={("origin", "destination")},
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0006_route_unique_pair'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True)),
+                ('checksum', models.CharField(max_length=64)),
+                ('revision', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0007_dataimport'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['origin', 'departure_time'], name='flight_origin_dep_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['destination', 'arrival_time'], name='flight_dest_arr_idx'),
+        ),
+    ]
@@ -37,6 +37,13 @@ class Flight(models.Model):
         
     status = models.CharField(max_length=3, choices=Statuses.choices)
     
+    class Meta: 
+        # Departure/arrival boards: one airport's flights in time order
+        indexes = [
+            models.Index(fields=["origin", "departure_time"], name="flight_origin_dep_idx"),
+            models.Index(fields=["destination", "arrival_time"], name="flight_dest_arr_idx"),
+        ]
+    
     def __str__(self): 
         return f"{self.flight_number}: {self.origin.code} -> {self.destination.code}"
     
@@ -46,6 +53,16 @@ class Trip(models.Model):
     departure_time = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Summary of the trip's flights, written together with them so listings need no joins
+    first_departure_time = models.DateTimeField(null=True, blank=True)
+    arrival_time = models.DateTimeField(null=True, blank=True)
+    num_flights = models.PositiveIntegerField(default=0)
+    
+    class Meta: 
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="trip_created_idx"),
+        ]
+    
     def __str__(self):
         return f"Trip from {self.origin.code} to {self.destination.code} at {self.departure_time.isoformat()}"
     
@@ -55,3 +72,13 @@ class TripFlight(models.Model):
 
     def __str__(self):
         return f"{self.trip} includes {self.flight}"
+
+class DataImport(models.Model):
+    name = models.CharField(max_length=20, unique=True) # Import command, e.g. airports
+    checksum = models.CharField(max_length=64)
+    # Bumped whenever an import changes rows, so in-place edits still change the dataset version
+    revision = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} r{self.revision} ({self.checksum[:12]})"
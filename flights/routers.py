@@ -0,0 +1,27 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = "replica"
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to the primary ("default") database and reads to "replica"
+    when one is configured. Reads made inside a transaction on the primary
+    stay on it, so a view always sees its own writes; other requests may
+    read slightly stale data while the replica catches up.
+    """
+
+    def db_for_read(self, model, **hints):
+        if REPLICA_DB_ALIAS not in connections.settings or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -1,3 +1,1385 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import heapq
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from math import inf
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from flights.apps import serving_requests
+from flights.cache import TieredCache
+from flights.models import Airport, DataImport, Flight, Route, Trip, TripFlight
+from flights.routers import PrimaryReplicaRouter
+from flights.utils.benchmarks import bench_api, bench_routing, find_regressions, od_pairs
+from flights.utils.components import ReachabilityIndex
+from flights.utils.concurrency import Overloaded, SearchPool
+from flights.utils.geodesy import distance_matrix, haversine, initial_bearing, pairwise_distances
+from flights.utils.globe import publish_globe_snapshot
+from flights.utils.graph import (
+    RouteGraph,
+    bootstrap_route_graph,
+    current_snapshot,
+    dataset_version,
+    get_route_graph,
+    load_route_graph_snapshot,
+    publish_route_graph,
+)
+from flights.utils.hierarchy import ContractionHierarchy, contract_graph
+from flights.utils.metrics import MetricsStore, exposition, get_metrics, inc
+from flights.utils.route_cache import RouteCache, async_cached_find_route, cached_find_route, get_route_cache
+from flights.utils.routing import a_star_routing, isochrone
+from flights.utils.schedule import Timetable, get_timetable
+from flights.utils.warmup import warm_caches
+
+
+def create_network():
+    """
+    Small directed network: JFK -> LHR -> CDG plus a longer JFK -> CDG hop
+    and an island airport (HNL) with no routes.
+    """
+    airports = {
+        code: Airport.objects.create(code=code, name=code, latitude=lat, longitude=lon)
+        for code, lat, lon in [
+            ("JFK", 40.6398, -73.7789),
+            ("LHR", 51.4706, -0.461941),
+            ("CDG", 49.0128, 2.55),
+            ("HNL", 21.3187, -157.9225),
+        ]
+    }
+    for origin, destination, distance in [
+        ("JFK", "LHR", 5540.0),
+        ("LHR", "JFK", 5540.0),
+        ("LHR", "CDG", 348.0),
+        ("CDG", "LHR", 348.0),
+        ("JFK", "CDG", 9000.0),
+    ]:
+        Route.objects.create(origin=airports[origin], destination=airports[destination], distance=distance)
+    return airports
+
+
+# Published artifacts (graph snapshots), metrics and the shared cache go to a scratch directory, not data/
+_artifacts = tempfile.TemporaryDirectory()
+_artifact_settings = override_settings(
+    ROUTE_GRAPH_DIR=os.path.join(_artifacts.name, "graph"),
+    METRICS_DIR=os.path.join(_artifacts.name, "metrics"),
+    CACHES={
+        "default": {
+            **settings.CACHES["default"],
+            "LOCATION": os.path.join(_artifacts.name, "cache.sqlite3"),
+        },
+    },
+)
+
+
+def setUpModule():
+    _artifact_settings.enable()
+
+
+def tearDownModule():
+    _artifact_settings.disable()
+    _artifacts.cleanup()
+
+
+def random_graph(seed, nodes=200, edges=900):
+    rng = random.Random(seed)
+    sources = [rng.randrange(nodes) for _ in range(edges)]
+    targets = [rng.randrange(nodes) for _ in range(edges)]
+    weights = [rng.uniform(50, 5000) for _ in range(edges)]
+    return RouteGraph.from_edges(
+        ["A{:03d}".format(i) for i in range(nodes)],
+        [rng.uniform(-60, 60) for _ in range(nodes)],
+        [rng.uniform(-180, 180) for _ in range(nodes)],
+        sources,
+        targets,
+        weights,
+        version="random-{}".format(seed),
+    )
+
+
+def dijkstra_distance(graph, start, goal):
+    dist = {start: 0.0}
+    frontier = [(0.0, start)]
+    while frontier:
+        cost, current = heapq.heappop(frontier)
+        if current == goal:
+            return cost
+        if cost > dist[current]:
+            continue
+        neighbors, weights = graph.out_edges(current)
+        for neighbor, weight in zip(neighbors.tolist(), weights.tolist()):
+            if cost + weight < dist.get(neighbor, inf):
+                dist[neighbor] = cost + weight
+                heapq.heappush(frontier, (cost + weight, neighbor))
+    return inf
+
+
+class RouteGraphTests(TestCase):
+    def setUp(self):
+        self.airports = create_network()
+
+    def test_csr_layout(self):
+        graph = get_route_graph()
+        jfk = graph.index["JFK"]
+        neighbors, weights = graph.out_edges(jfk)
+
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.num_edges, 5)
+        self.assertEqual(sorted(graph.codes[n] for n in neighbors), ["CDG", "LHR"])
+        self.assertEqual(graph.edge_weight(jfk, graph.index["LHR"]), 5540.0)
+        self.assertIsNone(graph.edge_weight(graph.index["CDG"], jfk))
+        self.assertFalse(graph.weights.flags.writeable)
+
+    def test_graph_is_reused_until_routes_change(self):
+        graph = get_route_graph()
+        self.assertIs(get_route_graph(), graph)
+
+        Route.objects.create(origin=self.airports["CDG"], destination=self.airports["JFK"], distance=5840.0)
+        rebuilt = get_route_graph()
+        self.assertIsNot(rebuilt, graph)
+        self.assertEqual(rebuilt.num_edges, 6)
+
+    def test_a_star_routing(self):
+        graph = get_route_graph()
+        for bidirectional in (False, True):
+            result = a_star_routing("JFK", "CDG", graph, bidirectional=bidirectional)
+            self.assertEqual(result.path, ["JFK", "LHR", "CDG"])
+            self.assertAlmostEqual(result.distance, 5888.0)
+            self.assertGreater(result.expanded, 0)
+
+            self.assertIsNone(a_star_routing("JFK", "HNL", graph, bidirectional=bidirectional).path)
+            self.assertIsNone(a_star_routing("CDG", "XXX", graph, bidirectional=bidirectional).path)
+
+    def use_snapshot_dir(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(ROUTE_GRAPH_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_workers_map_the_published_snapshot(self):
+        self.use_snapshot_dir()
+        built = get_route_graph()
+        publish_route_graph(built)
+
+        with mock.patch("flights.utils.graph._graph", None), \
+                mock.patch("flights.utils.graph.build_route_graph", side_effect=AssertionError("built from tables")):
+            graph = get_route_graph()
+
+        self.assertIsInstance(graph.neighbors.base, np.memmap)
+        self.assertFalse(graph.neighbors.flags.writeable)
+        self.assertEqual((graph.codes, graph.version), (built.codes, built.version))
+        self.assertEqual(graph.airport_pks(), built.airport_pks())
+        self.assertEqual(a_star_routing("JFK", "CDG", graph), a_star_routing("JFK", "CDG", built))
+
+    def test_publish_swaps_current_and_keeps_previous(self):
+        self.use_snapshot_dir()
+        for seed in range(3):
+            publish_route_graph(random_graph(seed, nodes=20, edges=60))
+
+        self.assertEqual(load_route_graph_snapshot().version, "random-2")
+        # Readable by workers running as other users
+        self.assertEqual(os.stat(os.path.join(settings.ROUTE_GRAPH_DIR, "vrandom-2")).st_mode & 0o777, 0o755)
+        self.assertEqual(
+            sorted(entry for entry in os.listdir(settings.ROUTE_GRAPH_DIR) if entry.startswith("v")),
+            ["vrandom-1", "vrandom-2"],
+        )
+        self.assertTrue(current_snapshot().endswith("vrandom-2"))
+
+
+class RouteCacheTests(TestCase):
+    def setUp(self):
+        self.airports = create_network()
+        get_route_cache().clear()
+        cache.clear()
+
+    def test_repeated_searches_hit_the_cache(self):
+        graph = get_route_graph()
+        first = cached_find_route("JFK", "CDG", graph)
+        second = cached_find_route("JFK", "CDG", graph)
+
+        self.assertIs(first, second)
+        self.assertEqual(get_route_cache().stats()["hits"], 1)
+        self.assertEqual(get_route_cache().stats()["misses"], 1)
+
+    def test_route_reload_invalidates_entries(self):
+        self.assertEqual(cached_find_route("JFK", "CDG", get_route_graph()).path, ["JFK", "LHR", "CDG"])
+
+        Route.objects.filter(origin__code="JFK", destination__code="CDG").delete()
+        Route.objects.create(origin=self.airports["JFK"], destination=self.airports["CDG"], distance=5800.0)
+
+        self.assertEqual(cached_find_route("JFK", "CDG", get_route_graph()).path, ["JFK", "CDG"])
+
+    def test_lru_eviction_and_shared_backend(self):
+        shared = caches["default"]
+        route_cache = RouteCache(max_size=2, backend=shared)
+        result = a_star_routing("JFK", "CDG", get_route_graph())
+        for destination in ("AAA", "BBB", "CCC"):
+            route_cache.set(("JFK", destination, "astar", "v1"), result)
+
+        self.assertEqual(len(route_cache), 2)
+        self.assertEqual(RouteCache(backend=shared).get(("JFK", "AAA", "astar", "v1")), result)
+
+    def test_async_hits_skip_the_search_pool(self):
+        graph = get_route_graph()
+        first = cached_find_route("JFK", "CDG", graph)
+        with mock.patch("flights.utils.route_cache.get_search_pool", side_effect=Overloaded):
+            self.assertIs(asyncio.run(async_cached_find_route("JFK", "CDG", graph)), first)
+
+
+class SearchPoolTests(SimpleTestCase):
+    def test_identical_searches_share_one_run(self):
+        pool = SearchPool(workers=2, max_pending=1)
+        release = threading.Event()
+        calls = []
+
+        def search(value):
+            calls.append(value)
+            release.wait(5)
+            return value * 2
+
+        first = pool.submit("key", search, 21)
+        second = pool.submit("key", search, 21)
+        with self.assertRaises(Overloaded):
+            pool.submit("other", search, 1)
+        release.set()
+
+        self.assertIs(first, second)
+        self.assertEqual(first.result(5), 42)
+        self.assertEqual(calls, [21])
+        # The slot is released once the search finishes
+        self.assertEqual(pool.submit("other", search, 1).result(5), 2)
+        self.assertEqual(pool.stats()["coalesced"], 1)
+
+    async def test_cancelled_waiter_leaves_the_search_running(self):
+        pool = SearchPool(workers=1, max_pending=2)
+        release = threading.Event()
+        # Occupies the only worker, so the shared search below is still queued when a waiter goes
+        blocker = pool.submit(None, release.wait, 5)
+
+        first = asyncio.create_task(pool.run("key", lambda: 42))
+        second = asyncio.create_task(pool.run("key", lambda: 42))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+
+        self.assertEqual(await second, 42)
+        self.assertTrue(first.cancelled())
+        self.assertTrue(blocker.result(5))
+        self.assertEqual(pool.stats()["coalesced"], 1)
+
+    async def test_concurrent_requests_coalesce(self):
+        graph = random_graph(5)
+        get_route_cache().clear()
+        cache.clear()
+        calls = []
+
+        def slow_find_route(start, goal, graph, engine=None):
+            calls.append((start, goal))
+            time.sleep(0.05)
+            return a_star_routing(start, goal, graph)
+
+        with mock.patch("flights.utils.route_cache.find_route", slow_find_route):
+            results = await asyncio.gather(*[async_cached_find_route("A000", "A001", graph) for _ in range(5)])
+
+        self.assertEqual(calls, [("A000", "A001")])
+        self.assertEqual(len({result.distance for result in results}), 1)
+
+
+class ComputeTripTests(TestCase):
+    def setUp(self):
+        create_network()
+        get_route_graph()
+
+    def post(self, origin, destination):
+        body = {"origin_id": origin, "destination_id": destination, "departure_time": "2025-05-01T10:00:00"}
+        return self.client.post("/api/compute_trip/", json.dumps(body), content_type="application/json")
+
+    def test_write_cost_does_not_grow_with_legs(self):
+        # 2 version checks + SAVEPOINT + Trip/Flight/TripFlight INSERTs + RELEASE
+        with self.assertNumQueries(7):
+            one_leg = self.post("JFK", "LHR")
+        with self.assertNumQueries(7):
+            two_legs = self.post("JFK", "CDG")
+
+        self.assertEqual(len(one_leg.json()["route"]), 1)
+        self.assertEqual([leg["destination"] for leg in two_legs.json()["route"]], ["LHR", "CDG"])
+        self.assertEqual(TripFlight.objects.filter(trip_id=two_legs.json()["trip_id"]).count(), 2)
+
+    def test_errors(self):
+        self.assertEqual(self.post("JFK", "ZZZ").status_code, 404)
+        self.assertEqual(self.post("JFK", "HNL").status_code, 404)
+        self.assertEqual(Trip.objects.count(), 0)
+
+    def test_failed_write_leaves_nothing_behind(self):
+        with mock.patch("flights.models.TripFlight.objects.bulk_create", side_effect=RuntimeError("boom")):
+            response = self.post("JFK", "CDG")
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(Trip.objects.count(), 0)
+        self.assertEqual(Flight.objects.count(), 0)
+
+    def test_rejects_excess_load(self):
+        get_route_cache().clear()
+        cache.clear()
+        with mock.patch.object(SearchPool, "submit", side_effect=Overloaded):
+            response = self.post("JFK", "CDG")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(Trip.objects.count(), 0)
+
+
+class TripListTests(TestCase):
+    def setUp(self):
+        create_network()
+        for day in range(1, 6):
+            body = {"origin_id": "JFK", "destination_id": "CDG", "departure_time": f"2025-05-0{day}T10:00:00"}
+            self.client.post("/api/compute_trip/", json.dumps(body), content_type="application/json")
+
+    def test_pages_with_one_query_each(self):
+        seen = []
+        cursor = None
+        while True:
+            url = "/api/trips/?limit=2" + (f"&cursor={cursor}" if cursor else "")
+            with self.assertNumQueries(1):
+                page = self.client.get(url).json()
+            seen.extend(trip["id"] for trip in page["trips"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, sorted(Trip.objects.values_list("id", flat=True), reverse=True))
+
+    def test_summary_matches_flights(self):
+        trip = self.client.get("/api/trips/").json()["trips"][0]
+        flights = Flight.objects.filter(tripflight__trip_id=trip["id"]).order_by("departure_time")
+
+        self.assertEqual(trip["num_flights"], 2)
+        self.assertEqual(trip["departure_time"], flights.first().departure_time.isoformat())
+        self.assertEqual(trip["arrival_time"], flights.last().arrival_time.isoformat())
+
+    def test_rejects_bad_cursor(self):
+        self.assertEqual(self.client.get("/api/trips/?cursor=not-a-cursor").status_code, 400)
+
+
+class AirportBoardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        airports = create_network()
+        start = datetime.now(timezone.utc).replace(microsecond=0)
+        for number, hours in [("P1", -2), ("U1", 1), ("U2", 2), ("U3", 2), ("U4", 5), ("F1", 48)]:
+            Flight.objects.create(
+                flight_number=number,
+                origin=airports["JFK"],
+                destination=airports["LHR"],
+                departure_time=start + timedelta(hours=hours),
+                arrival_time=start + timedelta(hours=hours + 7),
+                status=Flight.Statuses.scheduled,
+            )
+
+    def test_upcoming_pages_with_fixed_queries(self):
+        seen = []
+        cursor = None
+        while True:
+            url = "/api/airport/JFK/departures/?limit=2" + (f"&cursor={cursor}" if cursor else "")
+            # airport lookup + one board query, however many flights are on the page
+            with self.assertNumQueries(2):
+                page = self.client.get(url).json()
+            seen.extend(flight["flight_number"] for flight in page["flights"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, ["U1", "U2", "U3", "U4"])
+        arrivals = self.client.get("/api/airport/lhr/arrivals/?hours=72").json()["flights"]
+        self.assertEqual([flight["flight_number"] for flight in arrivals], ["P1", "U1", "U2", "U3", "U4", "F1"])
+
+    def test_detail_shows_upcoming_flights(self):
+        with self.assertNumQueries(3):
+            data = self.client.get("/api/airport/JFK/").json()
+        self.assertEqual([flight["flight_number"] for flight in data["departures"]], ["U1", "U2", "U3", "U4", "F1"])
+
+    def test_board_queries_use_indexes(self):
+        for url, index in [
+            ("/api/airport/JFK/departures/", "flight_origin_dep_idx"),
+            ("/api/airport/LHR/arrivals/", "flight_dest_arr_idx"),
+        ]:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + queries[-1]["sql"])
+                plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn(index, plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_pages_are_cached(self):
+        url = "/api/airport/JFK/departures/?limit=2"
+        first = self.client.get(url).json()
+        Flight.objects.filter(flight_number="U1").delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json(), first)
+        cache.clear()
+        flights = self.client.get(url).json()["flights"]
+        self.assertEqual([flight["flight_number"] for flight in flights], ["U2", "U3"])
+
+        # A zero TTL turns caching off
+        with self.settings(CACHE_TTLS={"boards": 0}):
+            for _ in range(2):
+                with self.assertNumQueries(2):
+                    self.client.get(url + "&hours=12")
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get("/api/airport/JFK/departures/?cursor=bad").status_code, 400)
+        self.assertEqual(self.client.get("/api/airport/JFK/departures/?hours=0").status_code, 400)
+        self.assertEqual(self.client.get("/api/airport/XXX/departures/").status_code, 404)
+
+
+class GlobeDataTests(TestCase):
+    def setUp(self):
+        create_network()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(GLOBE_SNAPSHOT_PATH=os.path.join(directory.name, "globe.json.gz"))
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+
+    def test_first_request_publishes_snapshot(self):
+        data = self.client.get("/api/globe-data/").json()
+
+        self.assertEqual(len(data["links"]), 5)
+        self.assertEqual({node["id"] for node in data["nodes"]}, {"JFK", "LHR", "CDG"})
+        self.assertTrue(os.path.exists(settings.GLOBE_SNAPSHOT_PATH))
+
+    def test_served_without_queries_and_revalidated(self):
+        snapshot = publish_globe_snapshot()
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/globe-data/", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["ETag"], snapshot.etag)
+        self.assertEqual(json.loads(gzip.decompress(response.content))["links"][0]["source"], "JFK")
+
+        response = self.client.get("/api/globe-data/", HTTP_IF_NONE_MATCH=snapshot.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_falls_back_to_published_file(self):
+        snapshot = publish_globe_snapshot()
+        cache.clear()
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/globe-data/")
+        self.assertEqual(response["ETag"], snapshot.etag)
+
+    def test_concurrent_publishes_each_write_their_own_file(self):
+        errors = []
+
+        def publish():
+            try:
+                publish_globe_snapshot()
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch("flights.utils.globe.build_globe_payload", return_value={"nodes": [], "links": []}):
+            threads = [threading.Thread(target=publish) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(os.path.dirname(settings.GLOBE_SNAPSHOT_PATH)), ["globe.json.gz"])
+        self.assertEqual(os.stat(settings.GLOBE_SNAPSHOT_PATH).st_mode & 0o777, 0o644)
+
+
+class WarmupTests(TestCase):
+    def setUp(self):
+        create_network()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(
+            GLOBE_SNAPSHOT_PATH=os.path.join(directory.name, "globe.json.gz"),
+            ROUTE_GRAPH_DIR=os.path.join(directory.name, "graph"),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+
+    def test_builds_missing_artifacts_and_logs_them(self):
+        with self.assertLogs("flights.utils.warmup", "INFO") as logs:
+            timings = warm_caches()
+
+        self.assertEqual([name for name, _, _ in timings], ["route_graph", "reachability", "globe_snapshot", "airport_index", "timetable"])
+        self.assertEqual(len(logs.output), 5)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual({allocated for _, _, allocated in timings}, {None})
+        self.assertTrue(os.path.exists(settings.GLOBE_SNAPSHOT_PATH))
+        self.assertEqual(load_route_graph_snapshot().version, dataset_version())
+        self.assertIsInstance(get_route_graph().neighbors.base, np.memmap)
+
+    def test_republishes_stale_graph(self):
+        with self.assertLogs("flights.utils.warmup", "INFO"):
+            warm_caches(["route_graph"])
+            Route.objects.filter(origin__code="JFK", destination__code="CDG").delete()
+            warm_caches(["route_graph"])
+
+        self.assertEqual(load_route_graph_snapshot().num_edges, 4)
+
+    def test_only_serving_processes_warm_up(self):
+        for argv, environ, expected in [
+            (["gunicorn", "core.wsgi"], {}, False),
+            (["uvicorn", "core.asgi:application"], {"FLIGHTS_SERVING": "1"}, True),
+            (["manage.py", "runserver"], {"RUN_MAIN": "true"}, True),
+            (["manage.py", "runserver"], {}, False),
+            (["manage.py", "migrate"], {}, False),
+            (["python", "-m", "django", "migrate"], {}, False),
+            (["pytest"], {}, False),
+        ]:
+            environ = {
+                **{key: value for key, value in os.environ.items() if key not in ("RUN_MAIN", "FLIGHTS_SERVING")},
+                **environ,
+            }
+            with mock.patch("sys.argv", argv), mock.patch.dict(os.environ, environ, clear=True):
+                self.assertEqual(serving_requests(), expected, argv)
+
+
+class LoadRoutesTests(TestCase):
+    ROUTES = [
+        "BA,1355,JFK,3797,LHR,507,,0,744",
+        "AA,24,JFK,3797,LHR,507,,0,777",
+        "BA,1355,LHR,507,JFK,3797,,0,744",
+        "AF,137,LHR,507,CDG,1382,,0,320",
+        "ZZ,1,LHR,507,\\N,\\N,,0,320",
+        "ZZ,2,LHR,507,XXX,9999,,0,320",
+    ]
+
+    def setUp(self):
+        for code, lat, lon in [("JFK", 40.6398, -73.7789), ("LHR", 51.4706, -0.461941), ("CDG", 49.0128, 2.55)]:
+            Airport.objects.create(code=code, name=code, latitude=lat, longitude=lon)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "routes.dat")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.ROUTES) + "\n")
+        override = self.settings(
+            GLOBE_SNAPSHOT_PATH=os.path.join(directory.name, "globe.json.gz"),
+            ROUTE_GRAPH_DIR=os.path.join(directory.name, "graph"),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_reload_replaces_routes_and_counts(self):
+        for _ in range(2):
+            call_command("load_routes", file=self.path, batch_size=2, stdout=io.StringIO())
+
+        routes = {
+            (origin, destination): distance
+            for origin, destination, distance in Route.objects.values_list("origin__code", "destination__code", "distance")
+        }
+        self.assertEqual(set(routes), {("JFK", "LHR"), ("LHR", "JFK"), ("LHR", "CDG")})
+        self.assertAlmostEqual(routes[("JFK", "LHR")], 5540, delta=1)
+
+        lhr = Airport.objects.get(code="LHR")
+        self.assertEqual((lhr.outbound_connections, lhr.inbound_connections), (2, 1))
+
+    def test_sync_applies_only_the_diff(self):
+        call_command("load_routes", file=self.path, stdout=io.StringIO())
+        kept = Route.objects.get(origin__code="JFK", destination__code="LHR").id
+        version = dataset_version()
+
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.ROUTES[:3] + ["AF,7,JFK,3797,CDG,1382,,0,777"]) + "\n")
+        call_command("load_routes", file=self.path, stdout=io.StringIO())
+
+        self.assertEqual(Route.objects.get(origin__code="JFK", destination__code="LHR").id, kept)
+        self.assertFalse(Route.objects.filter(origin__code="LHR", destination__code="CDG").exists())
+        self.assertEqual(Airport.objects.get(code="JFK").outbound_connections, 2)
+        self.assertNotEqual(dataset_version(), version)
+
+    def test_unchanged_file_exits_early(self):
+        call_command("load_routes", file=self.path, stdout=io.StringIO())
+        self.assertEqual(len(DataImport.objects.get(name="routes").checksum), 64)
+
+        stdout = io.StringIO()
+        with self.assertNumQueries(2):
+            call_command("load_routes", file=self.path, stdout=stdout)
+        self.assertIn("unchanged", stdout.getvalue())
+
+
+class LoadAirportsTests(TestCase):
+    def write(self, rows):
+        with open(self.path, "w", encoding="utf-8") as f:
+            for code, name, lat, lon in rows:
+                f.write(f'1,"{name}","City","Country","{code}","XXXX",{lat},{lon},0,0,"U","Zone","airport","OurAirports"\n')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "airports.dat")
+        override = self.settings(
+            GLOBE_SNAPSHOT_PATH=os.path.join(directory.name, "globe.json.gz"),
+            ROUTE_GRAPH_DIR=os.path.join(directory.name, "graph"),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_sync_keeps_trips_on_unchanged_airports(self):
+        self.write([("JFK", "Kennedy", 40.6398, -73.7789), ("LHR", "Heathrow", 51.4706, -0.461941), ("CDG", "De Gaulle", 49.0128, 2.55)])
+        call_command("load_airports", file=self.path, stdout=io.StringIO())
+        jfk, lhr = Airport.objects.get(code="JFK"), Airport.objects.get(code="LHR")
+        trip = Trip.objects.create(origin=jfk, destination=lhr, departure_time=datetime(2030, 1, 1, tzinfo=timezone.utc))
+
+        self.write([("JFK", "John F Kennedy", 40.6398, -73.7789), ("LHR", "Heathrow", 51.4706, -0.461941)])
+        call_command("load_airports", file=self.path, stdout=io.StringIO())
+
+        self.assertTrue(Trip.objects.filter(id=trip.id).exists())
+        self.assertEqual(Airport.objects.get(id=jfk.id).name, "John F Kennedy")
+        self.assertEqual(set(Airport.objects.values_list("code", flat=True)), {"JFK", "LHR"})
+
+
+class GlobeLodTests(TestCase):
+    def setUp(self):
+        create_network()
+
+    def test_viewport_returns_ranked_airports_and_links(self):
+        data = self.client.get("/api/globe-lod/?bbox=45,-10,55,10&zoom=4").json()
+
+        self.assertEqual([node["id"] for node in data["nodes"]], ["LHR", "CDG"])
+        self.assertEqual(len(data["links"]), 1)
+        self.assertEqual({data["links"][0]["source"], data["links"][0]["target"]}, {"LHR", "CDG"})
+
+    def test_caps_and_antimeridian(self):
+        data = self.client.get("/api/globe-lod/?lat=0&lon=0&zoom=0&max_airports=1").json()
+        self.assertEqual([node["id"] for node in data["nodes"]], ["LHR"])
+        self.assertEqual(data["links"], [])
+
+        data = self.client.get("/api/globe-lod/?bbox=0,170,40,-150&zoom=3").json()
+        self.assertEqual([node["id"] for node in data["nodes"]], ["HNL"])
+
+    def test_requires_a_viewport(self):
+        self.assertEqual(self.client.get("/api/globe-lod/?zoom=2").status_code, 400)
+
+    def test_rejects_non_finite_viewports_and_clamps_zoom(self):
+        for query in ["bbox=nan,-10,55,10", "bbox=45,-inf,55,10", "lat=inf&lon=0"]:
+            self.assertEqual(self.client.get("/api/globe-lod/?" + query).status_code, 400, query)
+        response = self.client.get("/api/globe-lod/?lat=51.47&lon=-0.46&zoom=2000")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([node["id"] for node in response.json()["nodes"]], ["LHR"])
+
+
+class AirportSearchTests(TestCase):
+    def setUp(self):
+        self.airports = create_network()
+
+    def test_nearest(self):
+        airports = self.client.get("/api/airports/nearest/?lat=48.9&lon=2.4&k=2").json()["airports"]
+
+        self.assertEqual([airport["code"] for airport in airports], ["CDG", "LHR"])
+        self.assertLess(airports[0]["distance_km"], 20)
+
+    def test_within_radius_and_batch(self):
+        airports = self.client.get("/api/airports/within/?lat=51.47&lon=-0.46&radius_km=400").json()["airports"]
+        self.assertEqual([airport["code"] for airport in airports], ["LHR", "CDG"])
+
+        body = {"points": [[21.3, -157.9], [40.6, -73.8]], "k": 1}
+        results = self.client.post("/api/airports/nearest/", json.dumps(body), content_type="application/json").json()["results"]
+        self.assertEqual([result[0]["code"] for result in results], ["HNL", "JFK"])
+
+    def test_index_rebuilds_after_airport_reload(self):
+        self.client.get("/api/airports/nearest/?lat=0&lon=0&k=1")
+        Airport.objects.create(code="LOS", name="LOS", latitude=6.577, longitude=3.321)
+
+        airports = self.client.get("/api/airports/nearest/?lat=0&lon=0&k=1").json()["airports"]
+        self.assertEqual(airports[0]["code"], "LOS")
+
+    def test_invalid_coordinates(self):
+        self.assertEqual(self.client.get("/api/airports/nearest/?lat=95&lon=0").status_code, 400)
+        self.assertEqual(self.client.get("/api/airports/within/?lat=0&lon=0").status_code, 400)
+
+    def test_rejects_k_below_one(self):
+        for k in ["0", "-3"]:
+            response = self.client.get("/api/airports/nearest/?lat=0&lon=0&k=" + k)
+            self.assertEqual(response.status_code, 400, k)
+            self.assertEqual(response.json()["error"], "k must be at least 1")
+
+    def test_rejects_negative_and_non_finite_radius(self):
+        for radius in ["-500", "nan", "inf"]:
+            response = self.client.get("/api/airports/within/?lat=51.47&lon=-0.46&radius_km=" + radius)
+            self.assertEqual(response.status_code, 400, radius)
+        airports = self.client.get("/api/airports/within/?lat=51.47&lon=-0.46&radius_km=0").json()["airports"]
+        self.assertEqual(airports, [])
+
+
+class GeodesyTests(SimpleTestCase):
+    def test_kernels_broadcast(self):
+        graph = random_graph(3, nodes=40, edges=0)
+        matrix = distance_matrix(graph, range(40), range(40))
+        sources, targets = np.divmod(np.arange(1600), 40)
+
+        self.assertEqual(matrix.shape, (40, 40))
+        np.testing.assert_allclose(matrix.ravel(), pairwise_distances(graph, sources, targets))
+        np.testing.assert_allclose(np.diag(matrix), 0, atol=1e-9)
+        np.testing.assert_allclose(matrix, matrix.T)
+
+    def test_known_values(self):
+        self.assertAlmostEqual(float(haversine(0, 0, 0, 90)), 6371 * np.pi / 2, places=6)
+        np.testing.assert_allclose(initial_bearing(0, 0, [10, 0, -10, 0], [0, 10, 0, -10]), [0, 90, 180, 270])
+
+
+class AirportDistancesTests(TestCase):
+    def setUp(self):
+        create_network()
+
+    def test_matrix(self):
+        data = self.client.get("/api/airports/distances/?origins=jfk,LHR&destinations=LHR,CDG,HNL").json()
+
+        self.assertEqual(data["destinations"], ["LHR", "CDG", "HNL"])
+        self.assertEqual(len(data["distances"]), 2)
+        self.assertAlmostEqual(data["distances"][0][0], 5540, delta=1)
+        self.assertEqual(data["distances"][1][0], 0)
+        self.assertAlmostEqual(data["bearings"][0][0], 51.4, delta=0.1)
+
+        body = {"origins": ["CDG", "HNL"]}
+        data = self.client.post("/api/airports/distances/", json.dumps(body), content_type="application/json").json()
+        self.assertEqual(data["distances"][0][1], data["distances"][1][0])
+
+    def test_rejects_unknown_and_oversized(self):
+        response = self.client.get("/api/airports/distances/?origins=JFK,XXX")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["codes"], ["XXX"])
+
+        with self.settings(DISTANCE_MATRIX_MAX_CELLS=4):
+            self.assertEqual(self.client.get("/api/airports/distances/?origins=JFK,LHR,CDG").status_code, 400)
+        self.assertEqual(self.client.get("/api/airports/distances/").status_code, 400)
+
+
+class ComputeTripsTests(TestCase):
+    def setUp(self):
+        create_network()
+
+    def test_batch_returns_results_in_request_order(self):
+        trips = [
+            {"origin_id": "jfk", "destination_id": "cdg", "departure_time": "2025-05-01T10:00:00"},
+            {"origin_id": "JFK", "destination_id": "HNL", "departure_time": "2025-05-01T10:00:00"},
+            {"origin_id": "LHR", "destination_id": "JFK", "departure_time": "2025-05-01T12:00:00Z"},
+            {"origin_id": "ZZZ", "destination_id": "JFK", "departure_time": "2025-05-01T10:00:00"},
+            {"origin_id": "JFK", "destination_id": "LHR"},
+        ]
+        response = self.client.post("/api/compute_trips/", json.dumps({"trips": trips}), content_type="application/json")
+        results = response.json()["results"]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([leg["destination"] for leg in results[0]["route"]], ["LHR", "CDG"])
+        self.assertEqual(results[1], {"error": "No route found", "status": 404})
+        self.assertEqual(results[2]["route"][0]["origin"], "LHR")
+        self.assertEqual(results[3]["status"], 404)
+        self.assertEqual(results[4]["status"], 400)
+
+        self.assertEqual(Trip.objects.count(), 2)
+        self.assertEqual(TripFlight.objects.filter(trip_id=results[0]["trip_id"]).count(), 2)
+
+    def test_batch_with_nothing_to_save_opens_no_transaction(self):
+        trips = [{"origin_id": "JFK", "destination_id": "HNL", "departure_time": "2025-05-01T10:00:00"}]
+        # Just the route graph's version checks
+        with self.assertNumQueries(2):
+            response = self.client.post("/api/compute_trips/", json.dumps({"trips": trips}), content_type="application/json")
+        self.assertEqual(response.json()["results"], [{"error": "No route found", "status": 404}])
+
+    def test_rejects_oversized_batch(self):
+        with self.settings(TRIP_BATCH_MAX_SIZE=1):
+            trips = [{"origin_id": "JFK", "destination_id": "LHR", "departure_time": "2025-05-01T10:00:00"}] * 2
+            response = self.client.post("/api/compute_trips/", json.dumps({"trips": trips}), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class TimetableTests(SimpleTestCase):
+    def setUp(self):
+        # stops 1 -> 2 -> 3, with a direct but late 1 -> 3
+        self.timetable = Timetable()
+        self.timetable.add([
+            (10, 1, 2, 1000, 2000),
+            (11, 2, 3, 2600, 3600),
+            (12, 2, 3, 2100, 3100),
+            (13, 1, 3, 1000, 5000),
+        ])
+
+    def test_earliest_arrival_respects_min_connection(self):
+        self.assertEqual(self.timetable.earliest_arrival(1, 3, 900).flight_ids, [10, 12])
+        self.assertEqual(self.timetable.earliest_arrival(1, 3, 900, min_connection=300).flight_ids, [10, 11])
+        self.assertEqual(self.timetable.earliest_arrival(1, 3, 900, min_connection=900).flight_ids, [13])
+        self.assertIsNone(self.timetable.earliest_arrival(1, 3, 1001).flight_ids)
+        self.assertIsNone(self.timetable.earliest_arrival(3, 1, 0).flight_ids)
+
+    def test_incremental_add_keeps_departure_order(self):
+        self.timetable.add([(14, 1, 3, 1500, 2500)])
+        self.assertEqual(list(self.timetable.departures), sorted(self.timetable.departures))
+        self.assertEqual(self.timetable.earliest_arrival(1, 3, 1001).flight_ids, [14])
+        self.assertEqual(self.timetable.high_water, 14)
+
+    def test_with_rows_shares_main_arrays_and_matches_a_rebuild(self):
+        rng = random.Random(3)
+        rows = []
+        for flight_id in range(1, 401):
+            departure = rng.randrange(0, 20000)
+            rows.append((flight_id, rng.randrange(8), rng.randrange(8), departure, departure + rng.randrange(100, 3000)))
+        timetable = Timetable()
+        timetable.add(rows[:300])
+
+        updated, folds = timetable, 0
+        for start in range(300, 400, 10):
+            previous, updated = updated, updated.with_rows(rows[start:start + 10])
+            if updated.recent is not None:
+                self.assertIs(updated.flight_ids, previous.flight_ids)
+            else:
+                folds += 1
+        self.assertGreater(folds, 0)
+        self.assertEqual(len(timetable), 300)
+        self.assertEqual((len(updated), updated.high_water), (400, 400))
+
+        rebuilt = Timetable()
+        rebuilt.add(rows)
+        for _ in range(200):
+            origin, destination, departure = rng.randrange(8), rng.randrange(8), rng.randrange(0, 20000)
+            expected = rebuilt.earliest_arrival(origin, destination, departure, 60)
+            journey = updated.earliest_arrival(origin, destination, departure, 60)
+            self.assertEqual(journey.arrival, expected.arrival)
+            self.assertEqual(journey.scanned, expected.scanned)
+
+
+class ScheduledTripTests(TestCase):
+    def setUp(self):
+        airports = create_network()
+        start = datetime(2025, 5, 1, 8, tzinfo=timezone.utc)
+
+        def flight(number, origin, destination, departs, hours):
+            return Flight.objects.create(
+                flight_number=number,
+                origin=airports[origin],
+                destination=airports[destination],
+                departure_time=start + timedelta(hours=departs),
+                arrival_time=start + timedelta(hours=departs + hours),
+                status=Flight.Statuses.scheduled,
+            )
+
+        flight("BA1", "JFK", "LHR", 2, 7)
+        flight("AF1", "LHR", "CDG", 9.25, 1)  # too tight for a 30 minute connection
+        flight("AF2", "LHR", "CDG", 10, 1)
+        flight("AF3", "JFK", "CDG", 1, 12)
+
+    def test_books_existing_flights(self):
+        body = {"origin_id": "JFK", "destination_id": "CDG", "departure_time": "2025-05-01T08:00:00Z", "mode": "schedule"}
+        response = self.client.post("/api/compute_trip/", json.dumps(body), content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([leg["flight_number"] for leg in response.json()["route"]], ["BA1", "AF2"])
+        self.assertEqual(response.json()["total_duration_minutes"], 11 * 60)
+        self.assertEqual(Flight.objects.count(), 4)
+
+    def test_picks_up_new_flights(self):
+        get_timetable()
+        Flight.objects.create(
+            flight_number="AA1",
+            origin=Airport.objects.get(code="JFK"),
+            destination=Airport.objects.get(code="CDG"),
+            departure_time=datetime(2025, 5, 1, 9, tzinfo=timezone.utc),
+            arrival_time=datetime(2025, 5, 1, 16, tzinfo=timezone.utc),
+            status=Flight.Statuses.scheduled,
+        )
+        cdg = Airport.objects.get(code="CDG")
+        journey = get_timetable().earliest_arrival(
+            Airport.objects.get(code="JFK").id, cdg.id, int(datetime(2025, 5, 1, 8, tzinfo=timezone.utc).timestamp()), 1800
+        )
+        self.assertEqual(Flight.objects.get(id=journey.flight_ids[0]).flight_number, "AA1")
+
+    def test_flight_deleted_after_the_timetable_loaded(self):
+        stale = get_timetable()
+        Flight.objects.filter(flight_number="BA1").delete()
+        body = {"origin_id": "JFK", "destination_id": "CDG", "departure_time": "2025-05-01T08:00:00Z", "mode": "schedule"}
+
+        # Searched again on a reloaded timetable
+        calls = []
+
+        def stale_once():
+            calls.append(1)
+            return stale if len(calls) == 1 else get_timetable()
+
+        with mock.patch("flights.views.get_timetable", side_effect=stale_once):
+            response = self.client.post("/api/compute_trip/", json.dumps(body), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([leg["flight_number"] for leg in response.json()["route"]], ["AF3"])
+
+        with mock.patch("flights.views.get_timetable", return_value=stale):
+            response = self.client.post("/api/compute_trip/", json.dumps(body), content_type="application/json")
+        self.assertEqual(response.status_code, 409)
+
+
+class ContractionHierarchyTests(SimpleTestCase):
+    def test_matches_dijkstra(self):
+        for seed in range(3):
+            graph = random_graph(seed)
+            hierarchy = contract_graph(graph)
+            rng = random.Random(seed)
+
+            for _ in range(200):
+                start, goal = rng.randrange(len(graph)), rng.randrange(len(graph))
+                path, distance, _ = hierarchy.query(start, goal)
+                expected = dijkstra_distance(graph, start, goal)
+
+                if expected == inf:
+                    self.assertIsNone(path)
+                    continue
+                self.assertAlmostEqual(distance, expected, places=6)
+                self.assertEqual((path[0], path[-1]), (start, goal))
+                self.assertAlmostEqual(
+                    sum(graph.edge_weight(u, v) for u, v in zip(path, path[1:])), expected, places=6
+                )
+
+    def test_save_and_load(self):
+        graph = random_graph(7, nodes=50, edges=200)
+        hierarchy = contract_graph(graph)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "hierarchy.npz")
+            hierarchy.save(path)
+            loaded = ContractionHierarchy.load(path)
+
+        self.assertEqual(loaded.version, graph.version)
+        self.assertEqual(loaded.codes, graph.codes)
+        for start in range(0, 50, 7):
+            for goal in range(0, 50, 5):
+                self.assertEqual(loaded.query(start, goal)[:2], hierarchy.query(start, goal)[:2])
+
+
+class ReachabilityTests(TestCase):
+    def test_matches_dijkstra(self):
+        for seed in range(3):
+            # Sparse enough to leave several components
+            graph = random_graph(seed, nodes=150, edges=160)
+            index = ReachabilityIndex(graph)
+
+            for start in range(0, len(graph), 7):
+                expected = [dijkstra_distance(graph, start, goal) < inf for goal in range(len(graph))]
+                self.assertEqual([index.reachable(start, goal) for goal in range(len(graph))], expected)
+                self.assertEqual(index.reachable_count(start), sum(expected))
+                for goal in range(len(graph)):
+                    if expected[goal]:
+                        self.assertEqual(index.weak[start], index.weak[goal])
+
+            self.assertEqual(index.weak_sizes.sum(), len(graph))
+            self.assertEqual(index.strong_sizes.sum(), len(graph))
+
+    def test_unreachable_trip_skips_search(self):
+        create_network()
+        get_route_cache().clear()
+        cache.clear()
+
+        with mock.patch("flights.utils.routing.a_star_routing") as search:
+            response = self.client.post(
+                "/api/compute_trip/",
+                json.dumps({"origin_id": "JFK", "destination_id": "HNL", "departure_time": "2025-05-01T10:00:00"}),
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, 404)
+        search.assert_not_called()
+
+    def test_components_api(self):
+        create_network()
+
+        summary = self.client.get("/api/components/").json()
+        self.assertEqual(summary["weak"]["count"], 2)
+        self.assertEqual(summary["weak"]["largest"][0]["size"], 3)
+        self.assertEqual(summary["strong"]["count"], 2)
+
+        jfk = self.client.get("/api/airport/jfk/component/", {"to": "CDG"}).json()
+        self.assertEqual(jfk["strong"]["size"], 3)
+        self.assertEqual(jfk["reachable_airports"], 3)
+        self.assertTrue(jfk["reachable"])
+        self.assertFalse(self.client.get("/api/airport/JFK/component/", {"to": "HNL"}).json()["reachable"])
+
+        members = self.client.get("/api/components/strong/{}/".format(jfk["strong"]["id"])).json()
+        self.assertEqual(sorted(members["airports"]), ["CDG", "JFK", "LHR"])
+        self.assertEqual(self.client.get("/api/components/strong/99/").status_code, 404)
+        self.assertEqual(self.client.get("/api/components/other/0/").status_code, 404)
+
+    def test_rebuilt_after_route_reload(self):
+        airports = create_network()
+        self.assertFalse(self.client.get("/api/airport/JFK/component/", {"to": "HNL"}).json()["reachable"])
+
+        Route.objects.create(origin=airports["CDG"], destination=airports["HNL"], distance=12000.0)
+        self.assertTrue(self.client.get("/api/airport/JFK/component/", {"to": "HNL"}).json()["reachable"])
+        self.assertEqual(get_route_graph().reachability().version, get_route_graph().version)
+
+
+def bounded_hours(graph, start, max_hops):
+    """
+    Fastest arrival (hours, flights) at every airport over (airport, flights
+    taken) states, for checking isochrone.
+    """
+    best = {}
+    frontier = [(0.0, 0, start)]
+    settled = set()
+    while frontier:
+        cost, hops, node = heapq.heappop(frontier)
+        if (node, hops) in settled:
+            continue
+        settled.add((node, hops))
+        best.setdefault(node, (max(cost - 0.5, 0.0), hops))
+        if hops == max_hops:
+            continue
+        neighbors, weights = graph.out_edges(node)
+        for neighbor, weight in zip(neighbors.tolist(), weights.tolist()):
+            heapq.heappush(frontier, (cost + weight / 800 + 0.5, hops + 1, neighbor))
+    return best
+
+
+class IsochroneTests(TestCase):
+    def test_matches_bounded_search(self):
+        graph = random_graph(3, nodes=60, edges=240)
+        for max_hours, max_hops in [(6, None), (12, 2), (20, 4), (0, None)]:
+            expected = {
+                node: value for node, value in bounded_hours(graph, 0, max_hops or len(graph)).items()
+                if value[0] <= max_hours
+            }
+            reached = isochrone(graph.codes[0], graph, max_hours, max_hops)
+
+            self.assertEqual(set(reached.nodes.tolist()), set(expected))
+            self.assertEqual(list(reached.hours), sorted(reached.hours))
+            for node, hours, hops in zip(reached.nodes.tolist(), reached.hours.tolist(), reached.hops.tolist()):
+                self.assertAlmostEqual(hours, expected[node][0], places=9)
+                if max_hops:
+                    self.assertLessEqual(hops, max_hops)
+
+    def test_predecessor_tree(self):
+        graph = random_graph(4, nodes=60, edges=240)
+        reached = isochrone(graph.codes[0], graph, 24)
+        hours = dict(zip(reached.nodes.tolist(), reached.hours.tolist()))
+
+        for node, hops, parent in zip(reached.nodes.tolist(), reached.hops.tolist(), reached.parent.tolist()):
+            if node == 0:
+                self.assertEqual((parent, hops), (-1, 0))
+                continue
+            leg = graph.edge_weight(parent, node) / 800
+            layover = 0.5 if parent != 0 else 0.0
+            self.assertAlmostEqual(hours[node], hours[parent] + layover + leg, places=9)
+
+    def test_endpoint(self):
+        create_network()
+
+        response = self.client.get("/api/airport/jfk/isochrone/", {"hours": 12})
+        airports = {airport["code"]: airport for airport in response.json()["airports"]}
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(airports), {"JFK", "LHR", "CDG"})
+        self.assertAlmostEqual(airports["LHR"]["hours"], 5540 / 800, places=3)
+        # JFK -> LHR -> CDG (6.925 + 0.5 + 0.435 h) beats the 11.25 h direct route
+        self.assertEqual(airports["CDG"]["via"], "LHR")
+        self.assertEqual(airports["CDG"]["hops"], 2)
+
+        one_flight = self.client.get("/api/airport/JFK/isochrone/", {"hours": 12, "hops": 1}).json()
+        self.assertEqual({a["code"]: a["via"] for a in one_flight["airports"]}, {"JFK": None, "LHR": "JFK", "CDG": "JFK"})
+
+        self.assertEqual(len(self.client.get("/api/airport/JFK/isochrone/", {"hours": 6}).json()["airports"]), 1)
+        self.assertEqual(self.client.get("/api/airport/ZZZ/isochrone/").status_code, 404)
+        self.assertEqual(self.client.get("/api/airport/JFK/isochrone/", {"hours": "soon"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/airport/JFK/isochrone/", {"hours": 1000}).status_code, 400)
+
+
+class BenchmarkTests(TestCase):
+    def test_runs_against_small_network(self):
+        create_network()
+        graph = get_route_graph()
+        pairs = od_pairs(graph, 5, seed=0)
+
+        self.assertEqual(len(pairs), 5)
+        self.assertTrue(all(graph.reachability().reachable(graph.index[a], graph.index[b]) for a, b in pairs))
+        self.assertEqual(pairs, od_pairs(graph, 5, seed=0))
+
+        results = {**bench_routing(graph, pairs, ["astar", "bidirectional"], rounds=1), **bench_api(pairs, repeat=2)}
+        self.assertEqual(set(results), {
+            "routing.astar", "routing.bidirectional", "routing.isochrone",
+            "api.compute_trip", "api.globe_data", "api.trip_list", "api.airport_detail",
+        })
+        self.assertEqual(results["api.compute_trip"]["queries"], 7)
+        self.assertEqual(results["api.compute_trip"]["runs"], 5)
+        self.assertEqual(Trip.objects.count(), 5)
+
+    def test_find_regressions(self):
+        baseline = {
+            "routing.astar": {"median_ms": 10.0, "expanded": 100},
+            "api.trip_list": {"median_ms": 0.2, "queries": 1},
+            "api.removed": {"median_ms": 1.0},
+        }
+        self.assertEqual(find_regressions({
+            "routing.astar": {"median_ms": 14.0, "expanded": 100},
+            "api.trip_list": {"median_ms": 0.6, "queries": 1},
+        }, baseline), [])
+
+        regressions = find_regressions({
+            "routing.astar": {"median_ms": 16.0, "expanded": 120},
+            "api.trip_list": {"median_ms": 0.2, "queries": 2},
+        }, baseline)
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(regressions[0].startswith("api.trip_list: queries"))
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        create_network()
+        get_route_cache().clear()
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def post_trip(self):
+        body = {"origin_id": "JFK", "destination_id": "CDG", "departure_time": "2025-05-01T10:00:00"}
+        return self.client.post("/api/compute_trip/", json.dumps(body), content_type="application/json")
+
+    def test_disabled_by_default(self):
+        self.assertNotIn("Server-Timing", self.post_trip())
+
+    @override_settings(REQUEST_PROFILING=True, REQUEST_PROFILE_SAMPLE_RATE=0)
+    def test_reports_phases_and_queries(self):
+        with self.assertLogs("flights.profiling", "INFO") as logs:
+            response = self.post_trip()
+
+        timing = response["Server-Timing"]
+        for name in ("graph_version", "route_cache", "search", "plan", "write", "total"):
+            self.assertIn(name + ";dur=", timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["path"], "/api/compute_trip/")
+        self.assertEqual(record["status"], 200)
+        # The version check plus the trip's SAVEPOINT/INSERTs, counted from the sync_to_async thread
+        self.assertEqual(record["db_queries"], 7)
+        self.assertIn('desc="7 queries"', timing)
+        self.assertIsNone(record["profile"])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_writes_stack_samples_for_slow_requests(self):
+        with self.settings(
+            REQUEST_PROFILING=True, REQUEST_PROFILE_SAMPLE_RATE=1, REQUEST_PROFILE_SLOW_MS=0,
+            REQUEST_PROFILE_INTERVAL_MS=1, REQUEST_PROFILE_DIR=self.directory,
+        ), self.assertLogs("flights.profiling", "INFO") as logs:
+            self.client.get("/api/trips/")
+
+        [name] = os.listdir(self.directory)
+        self.assertRegex(name, r"-GET-api-trips-\d+ms\.folded$")
+        self.assertEqual(json.loads(logs.records[0].getMessage())["profile"], os.path.join(self.directory, name))
+        with open(os.path.join(self.directory, name)) as f:
+            stack, count = f.readline().rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+
+
+class MetricsTests(TestCase):
+    def test_merges_worker_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = MetricsStore(directory, flush_interval=60)
+            store.inc("flights_route_cache_requests_total", result="hit")
+            store.inc("flights_route_cache_requests_total", 2, result="hit")
+            store.set("flights_route_graph_airports", 4)
+            store.observe("flights_routing_expanded_nodes", 50, engine="astar")
+
+            # A worker that has since exited and an earlier process that had
+            # this one's pid: their counts stay, their gauges go
+            exited = subprocess.Popen([sys.executable, "-c", ""])
+            exited.wait()
+            for pid, token, hits in [(exited.pid, 1, 4), (os.getpid(), 2, 5)]:
+                with open(os.path.join(directory, "{}-{}.json".format(pid, token)), "w") as f:
+                    json.dump({"pid": pid, "token": token, "samples": [
+                        ["flights_route_cache_requests_total", {"result": "hit"}, hits],
+                        ["flights_route_graph_airports", {}, 99],
+                        ["flights_routing_expanded_nodes", {"engine": "astar"}, [[1, 0, 0, 0, 0, 0, 0], 1.0]],
+                    ]}, f)
+
+            for _ in range(2):
+                samples = store.collect()
+                self.assertEqual(samples["flights_route_cache_requests_total", (("result", "hit"),)], 12)
+                self.assertEqual(samples["flights_route_graph_airports", ()], 4)
+            # Folded into the archive
+            self.assertEqual(
+                sorted(name for name in os.listdir(directory) if name.endswith(".json")),
+                sorted(["archive.json", "{}-{}.json".format(os.getpid(), store._token)]),
+            )
+
+            text = exposition(samples)
+            self.assertIn("# TYPE flights_routing_expanded_nodes histogram", text)
+            self.assertIn('flights_routing_expanded_nodes_bucket{engine="astar",le="1"} 2', text)
+            self.assertIn('flights_routing_expanded_nodes_bucket{engine="astar",le="100"} 3', text)
+            self.assertIn('flights_routing_expanded_nodes_bucket{engine="astar",le="+Inf"} 3', text)
+            self.assertIn('flights_routing_expanded_nodes_sum{engine="astar"} 52.0', text)
+
+    def test_only_serving_processes_record(self):
+        get_metrics().clear()
+        inc("flights_route_cache_requests_total", result="hit")
+        self.assertEqual(get_metrics().collect(), {})
+
+    @mock.patch("flights.utils.metrics.serving_requests", return_value=True)
+    def test_endpoint(self, serving):
+        create_network()
+        get_route_cache().clear()
+        cache.clear()
+        get_metrics().clear()
+        bootstrap_route_graph()
+        body = {"origin_id": "JFK", "destination_id": "CDG", "departure_time": "2025-05-01T10:00:00"}
+        self.client.post("/api/compute_trip/", json.dumps(body), content_type="application/json")
+
+        response = self.client.get("/metrics")
+        text = response.content.decode()
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('flights_http_requests_total{endpoint="compute-trip",method="POST",status="200"} 1', text)
+        self.assertIn('flights_db_queries_per_request_count{endpoint="compute-trip"} 1', text)
+        self.assertIn('flights_routing_expanded_nodes_count{engine="astar"} 1', text)
+        self.assertIn('flights_route_cache_requests_total{result="miss"} 1', text)
+        self.assertIn("flights_route_graph_airports 4", text)
+        self.assertIn('flights_route_graph_load_seconds_count{source="snapshot"} 1', text)
+
+        with self.settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.location = os.path.join(self.directory.name, "cache.sqlite3")
+
+    def backend(self, **options):
+        return TieredCache(self.location, {"OPTIONS": {"L1_TIMEOUT": 60, **options}})
+
+    def test_workers_share_entries(self):
+        first, second = self.backend(), self.backend()
+        first.set("key", {"value": 1})
+        self.assertEqual(second.get("key"), {"value": 1})
+        self.assertFalse(second.add("key", "other"))
+        # L1 copies go when deleted through the same backend; others keep theirs for L1_TIMEOUT
+        second.delete("key")
+        self.assertIsNone(second.get("key"))
+        self.assertTrue(first.add("key", "other"))
+        self.assertEqual(second.get("key"), "other")
+
+        first.set("short", 1, timeout=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(second.get("short"))
+        self.assertIsNone(first.get("short"))
+
+    def test_get_or_set_serves_stale_while_refreshing(self):
+        first, second = self.backend(L1_TIMEOUT=0), self.backend(L1_TIMEOUT=0)
+        self.assertEqual(first.get_or_set("key", lambda: "old", timeout=0.05), "old")
+        time.sleep(0.1)
+        # Past its timeout: a plain get misses, get_or_set refreshes it
+        self.assertIsNone(first.get("key"))
+
+        refreshing, release = threading.Event(), threading.Event()
+
+        def refresh():
+            refreshing.set()
+            release.wait(5)
+            return "new"
+
+        worker = threading.Thread(target=first.get_or_set, args=("key", refresh))
+        worker.start()
+        refreshing.wait(5)
+        calls = []
+        self.assertEqual(second.get_or_set("key", lambda: calls.append(1) or "other"), "old")
+        release.set()
+        worker.join()
+        self.assertEqual(calls, [])
+        self.assertEqual(second.get("key"), "new")
+
+
+class DatabaseTests(SimpleTestCase):
+    def test_router_sends_reads_to_replica(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Trip), "default")
+        with mock.patch.dict(connections.settings, {"replica": connections.settings["default"]}):
+            self.assertEqual(router.db_for_read(Trip), "replica")
+            self.assertEqual(router.db_for_write(Trip), "default")
+            self.assertFalse(router.allow_migrate("replica", "flights"))
+            # Reads inside a write transaction see its uncommitted rows
+            with mock.patch.object(connections["default"], "in_atomic_block", True):
+                self.assertEqual(router.db_for_read(Trip), "default")
+
+    def test_concurrent_writes_wait_and_reads_do_not(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # The configured SQLite options, on a file (the test database lives in memory)
+        config = {**settings.DATABASES["default"], "NAME": os.path.join(directory.name, "db.sqlite3")}
+        config = connections.configure_settings({"default": config})["default"]
+
+        def connect():
+            # A connection for the calling thread, which transaction.atomic() finds by alias
+            connections["concurrency"] = load_backend(config["ENGINE"]).DatabaseWrapper(config, "concurrency")
+
+        def disconnect():
+            connections["concurrency"].close()
+            del connections["concurrency"]
+
+        def run(sql, params=()):
+            with connections["concurrency"].cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+
+        connect()
+        self.addCleanup(disconnect)
+        run("CREATE TABLE trips (id INTEGER PRIMARY KEY, note TEXT)")
+        self.assertEqual(run("PRAGMA journal_mode"), [("wal",)])
+        locked, release, errors = threading.Event(), threading.Event(), []
+
+        def first_writer():
+            connect()
+            try:
+                with transaction.atomic(using="concurrency"):
+                    run("INSERT INTO trips (note) VALUES ('first')")
+                    locked.set()
+                    release.wait(5)
+            except OperationalError as e:
+                errors.append(e)
+            finally:
+                disconnect()
+
+        def second_writer():
+            # Reading before writing in a deferred transaction would fail with
+            # "database is locked" once the first writer commits
+            connect()
+            try:
+                with transaction.atomic(using="concurrency"):
+                    (count,), = run("SELECT COUNT(*) FROM trips")
+                    run("INSERT INTO trips (note) VALUES (?)", ["after {}".format(count)])
+            except OperationalError as e:
+                errors.append(e)
+            finally:
+                disconnect()
+
+        threads = [threading.Thread(target=first_writer), threading.Thread(target=second_writer)]
+        threads[0].start()
+        locked.wait(5)
+        threads[1].start()
+        started = time.perf_counter()
+        self.assertEqual(run("SELECT COUNT(*) FROM trips"), [(0,)])
+        self.assertLess(time.perf_counter() - started, 1)
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(run("SELECT note FROM trips ORDER BY id"), [("first",), ("after 1",)])
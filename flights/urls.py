@@ -3,8 +3,20 @@ from flights import views
 
 urlpatterns = [
     path("api/globe-data/", views.globe_data, name="globe-data"),
+    path("api/globe-lod/", views.globe_lod, name="globe-lod"),
     path("api/airport/<str:code>/", views.airport_detail, name="airport-detail"),
+    path("api/airport/<str:code>/departures/", views.airport_board, {"board": "departures"}, name="airport-departures"),
+    path("api/airport/<str:code>/arrivals/", views.airport_board, {"board": "arrivals"}, name="airport-arrivals"),
+    path("api/airport/<str:code>/isochrone/", views.airport_isochrone, name="airport-isochrone"),
+    path("api/airport/<str:code>/component/", views.airport_component, name="airport-component"),
+    path("api/airports/nearest/", views.nearest_airports, name="airports-nearest"),
+    path("api/airports/within/", views.airports_within, name="airports-within"),
+    path("api/airports/distances/", views.airport_distances, name="airport-distances"),
+    path("api/components/", views.component_summary, name="components"),
+    path("api/components/<str:kind>/<int:component_id>/", views.component_members, name="component-members"),
     path("api/compute_trip/", views.compute_trip, name="compute-trip"),
+    path("api/compute_trips/", views.compute_trips, name="compute-trips"),
     path("api/trips/", views.trip_list, name="trip-list"), 
     path("api/trips/<int:trip_id>/", views.trip_detail, name="trip-detail"),
+    path("metrics", views.metrics, name="metrics"),
 ]
\ No newline at end of file
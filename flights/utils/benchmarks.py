@@ -0,0 +1,155 @@
+import json
+import random
+import statistics
+import time
+
+import numpy as np
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from flights.utils.hierarchy import contract_graph
+from flights.utils.route_cache import get_route_cache
+from flights.utils.routing import a_star_routing, isochrone
+
+ENGINES = ("astar", "bidirectional", "ch")
+
+# Metrics that are deterministic for a given dataset and seed, so any increase is a regression
+EXACT_METRICS = ("queries", "expanded")
+
+
+def summarize(samples):
+    """
+    Median and 95th percentile of ``samples`` (seconds), in milliseconds.
+    """
+    return {
+        "runs": len(samples),
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "p95_ms": round(float(np.percentile(samples, 95)) * 1000, 4),
+    }
+
+
+def od_pairs(graph, count, seed):
+    """
+    ``count`` seeded origin/destination code pairs, each connected by some chain of routes.
+    """
+    rng = random.Random(seed)
+    reachability = graph.reachability()
+    candidates = [node for node in range(len(graph)) if graph.offsets[node + 1] > graph.offsets[node]]
+    pairs = []
+    for _ in range(count * 100):
+        if len(pairs) == count or len(candidates) < 2:
+            break
+        start, goal = rng.sample(candidates, 2)
+        if reachability.reachable(start, goal):
+            pairs.append((graph.codes[start], graph.codes[goal]))
+    return pairs
+
+
+def _best_of(rounds, calls):
+    """
+    Fastest of ``rounds`` timings of each call, which filters out scheduler noise.
+    """
+    best = [float("inf")] * len(calls)
+    for _ in range(rounds):
+        for i, call in enumerate(calls):
+            started = time.perf_counter()
+            call()
+            best[i] = min(best[i], time.perf_counter() - started)
+    return best
+
+
+def bench_routing(graph, pairs, engines=("astar", "bidirectional"), rounds=3):
+    """
+    Per-pair search time (best of ``rounds``) and mean expanded airports for
+    each engine, plus a 12 hour isochrone from every origin.
+    """
+    results = {}
+    for engine in engines:
+        if engine == "ch":
+            started = time.perf_counter()
+            hierarchy = contract_graph(graph)
+            results["routing.ch.build"] = summarize([time.perf_counter() - started])
+            search = hierarchy.route
+        else:
+            def search(start, goal, bidirectional=engine == "bidirectional"):
+                return a_star_routing(start, goal, graph, bidirectional=bidirectional)
+
+        expanded = sum(search(start, goal).expanded for start, goal in pairs)
+        samples = _best_of(rounds, [lambda start=start, goal=goal: search(start, goal) for start, goal in pairs])
+        results["routing." + engine] = {**summarize(samples), "expanded": round(expanded / len(pairs), 2)}
+
+    samples = _best_of(rounds, [lambda start=start: isochrone(start, graph, 12) for start, _ in pairs])
+    results["routing.isochrone"] = summarize(samples)
+    return results
+
+
+def _timed_request(send):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = send()
+        elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError("{} returned {}".format(response.request["PATH_INFO"], response.status_code))
+    return elapsed, len(queries)
+
+
+def _bench_endpoint(requests):
+    samples, queries = [], 0
+    for send in requests:
+        elapsed, count = _timed_request(send)
+        samples.append(elapsed)
+        queries = max(queries, count)
+    return {**summarize(samples), "queries": queries}
+
+
+def bench_api(pairs, repeat=20):
+    """
+    End-to-end latency and the most queries any single request made, through the test client.
+    """
+    client = Client()
+
+    def compute_trip(origin, destination):
+        # Cold route cache: time the search as well as the writes
+        get_route_cache().clear()
+        body = {"origin_id": origin, "destination_id": destination, "departure_time": "2025-05-01T10:00:00"}
+        return client.post("/api/compute_trip/", json.dumps(body), content_type="application/json")
+
+    # Untimed first requests load the graph, globe snapshot and URL resolvers
+    for path in ("/api/globe-data/", "/api/trips/", "/api/airport/{}/".format(pairs[0][0])):
+        client.get(path)
+
+    return {
+        "api.compute_trip": _bench_endpoint(
+            lambda origin=origin, destination=destination: compute_trip(origin, destination)
+            for origin, destination in pairs
+        ),
+        "api.globe_data": _bench_endpoint(lambda: client.get("/api/globe-data/") for _ in range(repeat)),
+        "api.trip_list": _bench_endpoint(lambda: client.get("/api/trips/") for _ in range(repeat)),
+        "api.airport_detail": _bench_endpoint(
+            lambda origin=origin: client.get("/api/airport/{}/".format(origin)) for origin, _ in pairs[:repeat]
+        ),
+    }
+
+
+def find_regressions(results, baseline, tolerance=0.5, min_delta_ms=0.5):
+    """
+    Compares ``results`` with a baseline of the same shape. A median that is
+    more than ``tolerance`` (and ``min_delta_ms``) slower, or any increase in
+    an exact metric, is a regression. Returns a list of messages.
+    """
+    regressions = []
+    for name, expected in sorted(baseline.items()):
+        actual = results.get(name)
+        if actual is None:
+            continue
+        if "median_ms" in expected:
+            limit = max(expected["median_ms"] * (1 + tolerance), expected["median_ms"] + min_delta_ms)
+            if actual["median_ms"] > limit:
+                regressions.append("{}: median {:.3f} ms, baseline {:.3f} ms".format(
+                    name, actual["median_ms"], expected["median_ms"]
+                ))
+        for metric in EXACT_METRICS:
+            if metric in expected and actual.get(metric, 0) > expected[metric] + 1e-9:
+                regressions.append("{}: {} {}, baseline {}".format(name, metric, actual[metric], expected[metric]))
+    return regressions
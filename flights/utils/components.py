@@ -0,0 +1,138 @@
+import numpy as np
+
+
+def weak_components(graph):
+    """
+    Labels every airport with its weakly connected component (route direction
+    ignored). Labels are the smallest airport id in each component.
+    """
+    labels = np.arange(len(graph), dtype=np.int64)
+    sources = np.repeat(np.arange(len(graph), dtype=np.int64), np.diff(graph.offsets))
+    targets = graph.neighbors.astype(np.int64)
+
+    # Min-label propagation along routes in both directions, plus pointer
+    # jumping so long chains collapse in a few rounds
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, sources, labels[targets])
+        np.minimum.at(updated, targets, labels[sources])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def strong_components(graph):
+    """
+    Iterative Tarjan. Returns (labels, count); component ids are numbered in
+    the order Tarjan completes them, which is a reverse topological order of
+    the condensation (every route out of component c leads to an id <= c).
+    """
+    offsets, neighbors, _ = graph.adjacency()
+    n = len(graph)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    labels = [-1] * n
+    stack = []
+    counter = 0
+    count = 0
+
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        work = [(root, offsets[root])]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+
+        while work:
+            node, edge = work[-1]
+            if edge < offsets[node + 1]:
+                work[-1] = (node, edge + 1)
+                child = neighbors[edge]
+                if index[child] == -1:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack[child] = True
+                    work.append((child, offsets[child]))
+                elif on_stack[child] and index[child] < low[node]:
+                    low[node] = index[child]
+                continue
+
+            work.pop()
+            if work and low[node] < low[work[-1][0]]:
+                low[work[-1][0]] = low[node]
+            if low[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    labels[member] = count
+                    if member == node:
+                        break
+                count += 1
+
+    return np.array(labels, dtype=np.int64), count
+
+
+class ReachabilityIndex:
+    """
+    Connected components of a RouteGraph and O(1) directed reachability.
+
+    ``weak``/``strong`` label each airport id with its weakly/strongly
+    connected component. ``reach`` holds one packed bit row per strong
+    component over the condensation DAG: bit d of row c is set when some
+    route chain leads from component c into component d.
+    """
+
+    def __init__(self, graph):
+        self.version = graph.version
+        self.weak = weak_components(graph)
+        self.strong, self.num_strong = strong_components(graph)
+        self.weak_sizes = np.bincount(self.weak, minlength=len(graph))
+        self.strong_sizes = np.bincount(self.strong, minlength=self.num_strong)
+
+        sources = np.repeat(self.strong[np.arange(len(graph))], np.diff(graph.offsets))
+        targets = self.strong[graph.neighbors]
+        crossing = sources != targets
+        edges = np.unique(np.stack([sources[crossing], targets[crossing]], axis=1), axis=0)
+        starts = np.searchsorted(edges[:, 0], np.arange(self.num_strong + 1))
+
+        # Successors always have smaller ids, so one pass in id order sees them complete
+        self.reach = np.zeros((self.num_strong, (self.num_strong + 7) // 8), dtype=np.uint8)
+        for component in range(self.num_strong):
+            row = self.reach[component]
+            row[component >> 3] |= 0x80 >> (component & 7)
+            for successor in edges[starts[component]:starts[component + 1], 1].tolist():
+                row |= self.reach[successor]
+        self.reach.flags.writeable = False
+
+    def reachable(self, start, goal):
+        """
+        True if some chain of routes leads from airport id ``start`` to ``goal``.
+        """
+        target = self.strong[goal]
+        return bool(self.reach[self.strong[start], target >> 3] & (0x80 >> (target & 7)))
+
+    def reachable_count(self, start):
+        """
+        Number of airports (including ``start``) some chain of routes leads to.
+        """
+        bits = np.unpackbits(self.reach[self.strong[start]], count=self.num_strong).astype(bool)
+        return int(self.strong_sizes[bits].sum())
+
+    def summary(self, limit=20):
+        def largest(sizes):
+            ids = np.flatnonzero(sizes)
+            ids = ids[np.lexsort((ids, -sizes[ids]))]
+            return {
+                "count": len(ids),
+                "largest": [{"id": int(i), "size": int(sizes[i])} for i in ids[:limit]],
+            }
+
+        return {
+            "weak": largest(self.weak_sizes),
+            "strong": largest(self.strong_sizes),
+        }
@@ -0,0 +1,152 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover threads of this process
+    fcntl = None
+
+
+class Overloaded(Exception):
+    """
+    Raised when the search pool already holds its maximum number of pending searches.
+    """
+
+
+class SearchPool:
+    """
+    Bounded executor for CPU-heavy searches (routing, spatial queries) called
+    from async views.
+
+    Searches submitted with the same ``key`` while one is still running share
+    that computation instead of starting another (single flight). At most
+    ``max_pending`` distinct searches may be queued or running; beyond that
+    ``submit`` raises Overloaded instead of queueing without bound.
+    """
+
+    def __init__(self, workers=4, max_pending=64):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        """
+        Returns a concurrent.futures.Future for ``fn(*args)``. A ``key`` of None is never coalesced.
+        """
+        with self._lock:
+            future = self._in_flight.get(key) if key is not None else None
+            if future is not None:
+                self.coalesced += 1
+                return future
+            if not self._slots.acquire(blocking=False):
+                self.rejected += 1
+                raise Overloaded()
+            self.submitted += 1
+            # Run in the submitter's context so per-request state (profiling) follows the search
+            future = self._executor.submit(contextvars.copy_context().run, fn, *args)
+            if key is not None:
+                self._in_flight[key] = future
+
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def _finish(self, key, future):
+        with self._lock:
+            if key is not None and self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        self._slots.release()
+
+    async def run(self, key, fn, *args):
+        # Each caller waits on a future of its own loop, so coalescing spans
+        # requests even when each runs in its own loop (async views under
+        # WSGI), and a cancelled caller (client gone) doesn't cancel the
+        # search the others are waiting on, as asyncio.wrap_future would
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+
+        def deliver(source):
+            try:
+                loop.call_soon_threadsafe(_copy_outcome, source, waiter)
+            except RuntimeError:
+                # The caller's loop already closed
+                pass
+
+        self.submit(key, fn, *args).add_done_callback(deliver)
+        return await waiter
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": len(self._in_flight),
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
+
+
+def _copy_outcome(source, waiter):
+    if waiter.done():
+        return
+    if source.cancelled():
+        waiter.cancel()
+    elif source.exception() is not None:
+        waiter.set_exception(source.exception())
+    else:
+        waiter.set_result(source.result())
+
+
+_search_pool = None
+_search_pool_lock = threading.Lock()
+
+
+def get_search_pool():
+    global _search_pool
+
+    with _search_pool_lock:
+        if _search_pool is None:
+            _search_pool = SearchPool(
+                workers=getattr(settings, "SEARCH_POOL_WORKERS", 4),
+                max_pending=getattr(settings, "SEARCH_POOL_MAX_PENDING", 64),
+            )
+        return _search_pool
+
+
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive lock around rebuilding a shared artifact: held by one thread of
+    this process and, where flock is available, one process at a time.
+    """
+    path = str(path)
+    with _file_locks_guard:
+        thread_lock = _file_locks.setdefault(path, threading.Lock())
+
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,55 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in km between points given in degrees. Accepts
+    scalars or NumPy arrays and broadcasts them against each other.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    """
+    Initial great-circle bearing in degrees clockwise from north (0-360) when
+    leaving point 1 for point 2. Broadcasts like ``haversine``.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+
+    delta_lon = lon2 - lon1
+    y = np.sin(delta_lon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(delta_lon)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def pairwise_distances(graph, sources, targets):
+    """
+    Distance in km from ``sources[i]`` to ``targets[i]`` (arrays of airport ids in ``graph``).
+    """
+    sources, targets = np.asarray(sources), np.asarray(targets)
+    return haversine(graph.lat[sources], graph.lon[sources], graph.lat[targets], graph.lon[targets])
+
+
+def distance_matrix(graph, sources, targets):
+    """
+    N x M matrix of distances in km from every airport id in ``sources`` to every one in ``targets``.
+    """
+    sources, targets = np.asarray(sources), np.asarray(targets)
+    return haversine(
+        graph.lat[sources][:, None], graph.lon[sources][:, None], graph.lat[targets][None, :], graph.lon[targets][None, :]
+    )
+
+
+def bearing_matrix(graph, sources, targets):
+    """
+    N x M matrix of initial bearings in degrees, laid out like ``distance_matrix``.
+    """
+    sources, targets = np.asarray(sources), np.asarray(targets)
+    return initial_bearing(
+        graph.lat[sources][:, None], graph.lon[sources][:, None], graph.lat[targets][None, :], graph.lon[targets][None, :]
+    )
@@ -0,0 +1,138 @@
+import gzip
+import hashlib
+import json
+import os
+import random
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+
+from flights.cache import cache_ttl
+from flights.models import Airport, Route
+from flights.utils.concurrency import file_lock
+from flights.utils.metrics import inc
+
+try:
+    import brotli
+except ImportError:  # optional: serve gzip only
+    brotli = None
+
+CACHE_KEY = "globe_snapshot"
+
+# Limited dataset for development
+SAMPLE_SIZE = 800
+
+# Good seed for graph
+SAMPLE_SEED = 31
+
+
+class GlobeSnapshot:
+    """
+    The /api/globe-data/ payload, pre-serialized and pre-compressed, with its ETag.
+    """
+
+    def __init__(self, body, gzipped=None):
+        self.body = body
+        self.gzip = gzipped if gzipped is not None else gzip.compress(body, compresslevel=9, mtime=0)
+        self.brotli = brotli.compress(body) if brotli is not None else None
+        self.etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+
+    def encoded(self, accept_encoding):
+        """
+        Returns (bytes, content encoding or None) for an Accept-Encoding header.
+        """
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.split(",")}
+        if self.brotli is not None and "br" in accepted:
+            return self.brotli, "br"
+        if "gzip" in accepted:
+            return self.gzip, "gzip"
+        return self.body, None
+
+
+def build_globe_payload():
+    route_ids = list(Route.objects.order_by("id").values_list("id", flat=True))
+    sampled_ids = random.Random(SAMPLE_SEED).sample(route_ids, min(SAMPLE_SIZE, len(route_ids)))
+
+    routes = list(
+        Route.objects.filter(id__in=sampled_ids)
+        .order_by("id")
+        .values_list("origin__code", "destination__code", "distance")
+    )
+    airport_codes = {code for origin, destination, _ in routes for code in (origin, destination)}
+    airports = Airport.objects.filter(code__in=airport_codes).order_by("id").values_list(
+        "code", "name", "latitude", "longitude"
+    )
+
+    return {
+        "nodes": [
+            {"id": code, "name": name, "lat": lat, "lon": lon}
+            for code, name, lat, lon in airports
+        ],
+        "links": [
+            {"source": origin, "target": destination, "distance": distance}
+            for origin, destination, distance in routes
+        ],
+    }
+
+
+def snapshot_path():
+    return str(getattr(settings, "GLOBE_SNAPSHOT_PATH", settings.BASE_DIR / "data" / "globe.json.gz"))
+
+
+def publish_globe_snapshot():
+    """
+    Rebuilds the snapshot from the database, writes it to disk and refreshes this process's cache.
+    """
+    body = json.dumps(build_globe_payload(), separators=(",", ":")).encode()
+    snapshot = GlobeSnapshot(body)
+
+    path = snapshot_path()
+    # A temporary name of its own, so processes publishing at once don't write the same file
+    fd, tmp_path = tempfile.mkstemp(prefix=".globe-", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(snapshot.gzip)
+        # mkstemp creates it owner-only; workers may run as another user
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    cache.set(snapshot_cache_key(os.stat(path).st_mtime_ns), snapshot, timeout=cache_ttl("globe"))
+    return snapshot
+
+
+def snapshot_cache_key(mtime_ns):
+    # Versioned by the file, so every worker moves to a newly published snapshot at once
+    return "{}:{}".format(CACHE_KEY, mtime_ns)
+
+
+def read_globe_snapshot(path):
+    with open(path, "rb") as f:
+        gzipped = f.read()
+    return GlobeSnapshot(gzip.decompress(gzipped), gzipped)
+
+
+def get_globe_snapshot():
+    """
+    Cache first, then the published file; the database is only touched if neither exists.
+    """
+    path = snapshot_path()
+    try:
+        key = snapshot_cache_key(os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        # One process (and thread) builds it; the others wait and then read the file
+        with file_lock(path + ".lock"):
+            if not os.path.exists(path):
+                return publish_globe_snapshot()
+        return get_globe_snapshot()
+
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        inc("flights_globe_cache_requests_total", result="hit")
+        return snapshot
+    inc("flights_globe_cache_requests_total", result="miss")
+    return cache.get_or_set(key, lambda: read_globe_snapshot(path), timeout=cache_ttl("globe"))
@@ -0,0 +1,394 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Subquery
+
+from flights.models import Airport, DataImport, Route
+from flights.utils.components import ReachabilityIndex
+from flights.utils.concurrency import file_lock
+from flights.utils.metrics import observe, set_gauge
+from flights.utils.profiling import phase
+
+logger = logging.getLogger(__name__)
+
+
+class RouteGraph:
+    """
+    Compact, read-only routing graph built from the Route and Airport tables.
+
+    Airport codes are interned to integer ids (their position in ``codes``).
+    ``airport_ids`` holds each airport's primary key, when built from the
+    database. Outgoing routes of airport ``i`` live in
+    ``neighbors[offsets[i]:offsets[i + 1]]`` with matching ``weights`` (km);
+    the ``reverse_*`` arrays hold the same layout for incoming routes.
+
+    ``save``/``load`` store the arrays as .npy files that ``load`` memory-maps
+    read-only, so every worker process shares one copy in the page cache.
+    """
+
+    ARRAYS = (
+        "airport_ids", "lat", "lon", "offsets", "neighbors", "weights",
+        "reverse_offsets", "reverse_neighbors", "reverse_weights",
+    )
+
+    def __init__(self, codes, latitudes, longitudes, offsets, neighbors, weights, version, airport_ids=None, reverse=None):
+        self.codes = tuple(codes)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.airport_ids = None if airport_ids is None else _frozen(airport_ids, np.int64)
+        self.lat = _frozen(latitudes, np.float64)
+        self.lon = _frozen(longitudes, np.float64)
+        self.offsets = _frozen(offsets, np.int64)
+        self.neighbors = _frozen(neighbors, np.int32)
+        self.weights = _frozen(weights, np.float64)
+        self.version = version
+
+        # Incoming routes, used by backward searches
+        if reverse is None:
+            sources = np.repeat(np.arange(len(self.codes), dtype=np.int32), np.diff(self.offsets))
+            order = np.argsort(self.neighbors, kind="stable")
+            counts = np.bincount(self.neighbors, minlength=len(self.codes))
+            reverse_offsets = np.zeros(len(self.codes) + 1, dtype=np.int64)
+            np.cumsum(counts, out=reverse_offsets[1:])
+            reverse = (reverse_offsets, sources[order], self.weights[order])
+        self.reverse_offsets = _frozen(reverse[0], np.int64)
+        self.reverse_neighbors = _frozen(reverse[1], np.int32)
+        self.reverse_weights = _frozen(reverse[2], np.float64)
+
+        self._adjacency = {}
+        self._pks = None
+        self._reachability = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.index
+
+    @property
+    def num_edges(self):
+        return len(self.neighbors)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def out_edges(self, node):
+        start, end = self.offsets[node], self.offsets[node + 1]
+        return self.neighbors[start:end], self.weights[start:end]
+
+    def airport_pks(self):
+        """
+        Returns the {code: Airport pk} map, so callers can write foreign keys without a lookup query.
+        """
+        if self._pks is None:
+            self._pks = dict(zip(self.codes, self.airport_ids.tolist()))
+        return self._pks
+
+    def adjacency(self, reverse=False):
+        """
+        Returns (offsets, neighbors, weights) as Python lists, which are much
+        faster than NumPy scalars to index from pure-Python search loops.
+        """
+        if reverse not in self._adjacency:
+            if reverse:
+                arrays = (self.reverse_offsets, self.reverse_neighbors, self.reverse_weights)
+            else:
+                arrays = (self.offsets, self.neighbors, self.weights)
+            self._adjacency[reverse] = tuple(array.tolist() for array in arrays)
+        return self._adjacency[reverse]
+
+    def reachability(self):
+        """
+        Returns the graph's connected components and reachability index, built on first use.
+        """
+        if self._reachability is None:
+            self._reachability = ReachabilityIndex(self)
+        return self._reachability
+
+    def edge_weight(self, source, target):
+        """
+        Returns the distance of the shortest source -> target route (ids), or None.
+        """
+        neighbors, weights = self.out_edges(source)
+        hits = weights[neighbors == target]
+        if len(hits) == 0:
+            return None
+        return float(hits.min())
+
+    def save(self, directory):
+        """
+        Writes the graph as one .npy file per array into ``directory``, which must not exist yet.
+        The files are written to a sibling temporary directory that is renamed into place.
+        """
+        directory = str(directory)
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        tmp_directory = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+        try:
+            np.save(os.path.join(tmp_directory, "codes.npy"), np.array(self.codes, dtype=str))
+            for name in self.ARRAYS:
+                if getattr(self, name) is not None:
+                    np.save(os.path.join(tmp_directory, name + ".npy"), getattr(self, name))
+            with open(os.path.join(tmp_directory, "VERSION"), "w") as f:
+                f.write(self.version or "")
+            # mkdtemp creates it owner-only; workers may run as another user
+            os.chmod(tmp_directory, 0o755)
+            os.rename(tmp_directory, directory)
+        except BaseException:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Memory-maps a graph written by ``save``. The arrays are read-only views of
+        the files, so loading copies nothing but the airport codes.
+        """
+        directory = str(directory)
+        arrays = {}
+        for name in cls.ARRAYS:
+            path = os.path.join(directory, name + ".npy")
+            arrays[name] = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        with open(os.path.join(directory, "VERSION")) as f:
+            version = f.read()
+
+        return cls(
+            np.load(os.path.join(directory, "codes.npy")).tolist(),
+            arrays["lat"],
+            arrays["lon"],
+            arrays["offsets"],
+            arrays["neighbors"],
+            arrays["weights"],
+            version,
+            airport_ids=arrays["airport_ids"],
+            reverse=(arrays["reverse_offsets"], arrays["reverse_neighbors"], arrays["reverse_weights"]),
+        )
+
+    @classmethod
+    def from_edges(cls, codes, latitudes, longitudes, sources, targets, weights, version=None, airport_ids=None):
+        """
+        Builds the CSR arrays from parallel edge lists of airport ids.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        order = np.argsort(sources, kind="stable")
+        counts = np.bincount(sources, minlength=len(codes))
+        offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        return cls(
+            codes,
+            latitudes,
+            longitudes,
+            offsets,
+            np.asarray(targets, dtype=np.int32)[order],
+            np.asarray(weights, dtype=np.float64)[order],
+            version,
+            airport_ids,
+        )
+
+
+def _frozen(values, dtype):
+    array = np.ascontiguousarray(values, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+def dataset_version():
+    """
+    Cheap signature of the route data; changes whenever routes or airports are
+    reloaded, or an incremental import edits rows in place.
+    """
+    routes = Route.objects.aggregate(count=Count("id"), last=Max("id"))
+    airports = Airport.objects.aggregate(
+        count=Count("id"),
+        last=Max("id"),
+        # Folded into the same query: latest import revision
+        revision=Max(Subquery(DataImport.objects.order_by("-revision").values("revision")[:1])),
+    )
+    return "{}:{}:{}:{}:{}".format(
+        airports["count"],
+        airports["last"] or 0,
+        routes["count"],
+        routes["last"] or 0,
+        airports["revision"] or 0,
+    )
+
+
+def build_route_graph(version=None):
+    started = time.perf_counter()
+    airports = list(Airport.objects.order_by("id").values_list("id", "code", "latitude", "longitude"))
+    pk_to_node = {pk: node for node, (pk, _, _, _) in enumerate(airports)}
+
+    routes = Route.objects.values_list("origin_id", "destination_id", "distance")
+    sources, targets, weights = [], [], []
+    for origin_id, destination_id, distance in routes.iterator(chunk_size=10000):
+        sources.append(pk_to_node[origin_id])
+        targets.append(pk_to_node[destination_id])
+        weights.append(distance)
+
+    graph = RouteGraph.from_edges(
+        [code for _, code, _, _ in airports],
+        [lat for _, _, lat, _ in airports],
+        [lon for _, _, _, lon in airports],
+        sources,
+        targets,
+        weights,
+        version=version if version is not None else dataset_version(),
+        airport_ids=[pk for pk, _, _, _ in airports],
+    )
+    observe("flights_route_graph_load_seconds", time.perf_counter() - started, source="build")
+    return graph
+
+
+def snapshot_root():
+    return str(getattr(settings, "ROUTE_GRAPH_DIR", settings.BASE_DIR / "data" / "graph"))
+
+
+def _snapshot_name(version):
+    return "v" + "".join(char if char.isalnum() else "-" for char in version)
+
+
+def current_snapshot():
+    """
+    Returns the directory of the published graph snapshot, or None if none was published.
+    """
+    root = snapshot_root()
+    try:
+        with open(os.path.join(root, "CURRENT")) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, name) if name else None
+
+
+def publish_route_graph(graph=None):
+    """
+    Saves ``graph`` (default: built from the database) as a versioned snapshot
+    and atomically points CURRENT at it; workers pick it up on their next
+    version check. The previously current snapshot is kept for workers still
+    mapping it, older ones are removed.
+    """
+    graph = graph if graph is not None else build_route_graph()
+    root = snapshot_root()
+    name = _snapshot_name(graph.version)
+    directory = os.path.join(root, name)
+
+    if not os.path.isdir(directory):
+        try:
+            graph.save(directory)
+        except OSError:
+            # Another process published the same version first
+            if not os.path.isdir(directory):
+                raise
+
+    previous = current_snapshot()
+    tmp_path = os.path.join(root, "CURRENT.tmp.{}".format(os.getpid()))
+    with open(tmp_path, "w") as f:
+        f.write(name)
+    os.replace(tmp_path, os.path.join(root, "CURRENT"))
+
+    keep = {name, os.path.basename(previous) if previous else None}
+    for entry in os.scandir(root):
+        if entry.is_dir() and entry.name.startswith("v") and entry.name not in keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    return directory
+
+
+def load_route_graph_snapshot():
+    """
+    Maps the published snapshot, or returns None if there is none or it can't be read.
+    """
+    directory = current_snapshot()
+    if directory is None:
+        return None
+    started = time.perf_counter()
+    try:
+        graph = RouteGraph.load(directory)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not load route graph snapshot %s: %s", directory, e)
+        return None
+    observe("flights_route_graph_load_seconds", time.perf_counter() - started, source="snapshot")
+    return graph
+
+
+def _record_graph(graph):
+    if graph is not None:
+        set_gauge("flights_route_graph_airports", len(graph))
+        set_gauge("flights_route_graph_routes", graph.num_edges)
+        set_gauge("flights_route_graph_bytes", graph.nbytes)
+    return graph
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def preload_route_graph():
+    """
+    Maps the published snapshot at worker startup, without touching the
+    database; the first request's version check confirms it is current.
+    """
+    global _graph
+
+    with _graph_lock:
+        if _graph is None:
+            _graph = _record_graph(load_route_graph_snapshot())
+        return _graph
+
+
+def bootstrap_route_graph():
+    """
+    Publishes a snapshot for the current data if the published one is
+    missing or stale, then maps it as this process's graph. Workers starting
+    together take turns on a file lock, so only the first builds from the tables.
+    """
+    global _graph
+
+    version = dataset_version()
+    graph = load_route_graph_snapshot()
+    if graph is None or graph.version != version:
+        try:
+            with file_lock(os.path.join(snapshot_root(), ".publish.lock")):
+                graph = load_route_graph_snapshot()
+                if graph is None or graph.version != version:
+                    publish_route_graph(build_route_graph(version))
+                    graph = load_route_graph_snapshot()
+        except OSError as e:
+            logger.warning("Could not publish route graph snapshot: %s", e)
+            return get_route_graph()
+
+    with _graph_lock:
+        _graph = _record_graph(graph)
+    return graph
+
+
+def get_route_graph():
+    """
+    Returns the process-wide route graph, reloading it only when the route
+    data has changed. Uses the published snapshot when it matches the
+    database, and only falls back to a private build from the tables when it
+    doesn't (e.g. routes edited without running the loaders).
+    """
+    global _graph
+
+    with phase("graph_version"):
+        version = dataset_version()
+    graph = _graph
+    if graph is not None and graph.version == version:
+        return graph
+
+    with phase("graph_load"), _graph_lock:
+        if _graph is None or _graph.version != version:
+            graph = load_route_graph_snapshot()
+            if graph is None or graph.version != version:
+                if current_snapshot() is not None:
+                    logger.warning("Route graph snapshot is stale, building graph %s in this process", version)
+                graph = build_route_graph(version)
+            _graph = _record_graph(graph)
+        return _graph
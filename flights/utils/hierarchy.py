@@ -0,0 +1,365 @@
+import heapq
+import logging
+import os
+import tempfile
+import threading
+from math import inf
+
+import numpy as np
+
+from flights.utils.concurrency import file_lock
+from flights.utils.routing import RoutingResult
+
+logger = logging.getLogger(__name__)
+
+# Witness searches give up after settling this many nodes; a truncated search
+# only adds a redundant shortcut, it never breaks correctness.
+WITNESS_SETTLE_LIMIT = 60
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over a RouteGraph.
+
+    ``up_*`` is a CSR graph of edges u -> v with rank[u] < rank[v] (forward
+    search); ``down_*`` holds edges u -> v with rank[u] > rank[v], stored
+    reversed at v so the backward search also only climbs in rank. ``*_middle``
+    is the contracted node a shortcut bypasses, or -1 for an original route.
+    """
+
+    ARRAYS = (
+        "rank",
+        "up_offsets", "up_neighbors", "up_weights", "up_middle",
+        "down_offsets", "down_neighbors", "down_weights", "down_middle",
+    )
+
+    def __init__(self, codes, version, **arrays):
+        self.codes = tuple(codes)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.version = version
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+        self._up = (self.up_offsets.tolist(), self.up_neighbors.tolist(), self.up_weights.tolist())
+        self._down = (self.down_offsets.tolist(), self.down_neighbors.tolist(), self.down_weights.tolist())
+
+        # (u, v) -> bypassed node, used to unpack shortcuts into original routes
+        self._middles = {}
+        for offsets, neighbors, middles, reverse in (
+            (self.up_offsets, self.up_neighbors, self.up_middle, False),
+            (self.down_offsets, self.down_neighbors, self.down_middle, True),
+        ):
+            sources = np.repeat(np.arange(len(self.codes)), np.diff(offsets))
+            for source, target, middle in zip(sources.tolist(), neighbors.tolist(), middles.tolist()):
+                if middle != -1:
+                    key = (target, source) if reverse else (source, target)
+                    self._middles[key] = middle
+
+    @property
+    def num_edges(self):
+        return len(self.up_neighbors) + len(self.down_neighbors)
+
+    def save(self, path):
+        """
+        Writes the hierarchy to ``path`` (.npz), replacing any previous file atomically.
+        """
+        path = str(path)
+        # A temporary name of its own, so processes saving at once don't write the same file
+        fd, tmp_path = tempfile.mkstemp(prefix=".hierarchy-", suffix=".tmp.npz", dir=os.path.dirname(path) or ".")
+        os.close(fd)
+        try:
+            np.savez(
+                tmp_path,
+                codes=np.array(self.codes),
+                version=np.array(self.version or ""),
+                **{name: getattr(self, name) for name in self.ARRAYS},
+            )
+            # mkstemp creates it owner-only; workers may run as another user
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data["codes"].tolist(),
+                str(data["version"]),
+                **{name: data[name] for name in cls.ARRAYS},
+            )
+
+    def _unpack(self, source, target, path):
+        middle = self._middles.get((source, target))
+        if middle is None:
+            path.append(target)
+        else:
+            self._unpack(source, middle, path)
+            self._unpack(middle, target, path)
+
+    def query(self, start, goal):
+        """
+        Bidirectional upward Dijkstra between two airport ids.
+
+        Returns (path of ids or None, distance, expanded nodes).
+        """
+        if start == goal:
+            return [start], 0.0, 0
+
+        up_offsets, up_neighbors, up_weights = self._up
+        down_offsets, down_neighbors, down_weights = self._down
+        forward_dist, forward_parent, forward_frontier = {start: 0.0}, {start: -1}, [(0.0, start)]
+        backward_dist, backward_parent, backward_frontier = {goal: 0.0}, {goal: -1}, [(0.0, goal)]
+        best, meeting, expanded = inf, -1, 0
+
+        while True:
+            forward_top = forward_frontier[0][0] if forward_frontier else inf
+            backward_top = backward_frontier[0][0] if backward_frontier else inf
+            if min(forward_top, backward_top) >= best:
+                break
+
+            # Advance the side whose frontier is cheaper
+            if forward_top <= backward_top:
+                offsets, neighbors, weights = up_offsets, up_neighbors, up_weights
+                stall_offsets, stall_neighbors, stall_weights = down_offsets, down_neighbors, down_weights
+                dist, parent, frontier, other_dist = forward_dist, forward_parent, forward_frontier, backward_dist
+            else:
+                offsets, neighbors, weights = down_offsets, down_neighbors, down_weights
+                stall_offsets, stall_neighbors, stall_weights = up_offsets, up_neighbors, up_weights
+                dist, parent, frontier, other_dist = backward_dist, backward_parent, backward_frontier, forward_dist
+
+            cost, current = heapq.heappop(frontier)
+            if cost > dist[current]:
+                continue
+            expanded += 1
+
+            if current in other_dist:
+                through = cost + other_dist[current]
+                if through < best:
+                    best, meeting = through, current
+
+            # Stall-on-demand: a higher-ranked node already reaches this one
+            # more cheaply, so nothing settled from here can be on a shortest path.
+            stalled = False
+            for i in range(stall_offsets[current], stall_offsets[current + 1]):
+                if dist.get(stall_neighbors[i], inf) + stall_weights[i] < cost:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+
+            for i in range(offsets[current], offsets[current + 1]):
+                neighbor = neighbors[i]
+                new_cost = cost + weights[i]
+                if new_cost < dist.get(neighbor, inf):
+                    dist[neighbor] = new_cost
+                    parent[neighbor] = current
+                    heapq.heappush(frontier, (new_cost, neighbor))
+
+        if meeting == -1:
+            return None, inf, expanded
+
+        hops = []
+        node = meeting
+        while node != -1:
+            hops.append(node)
+            node = forward_parent[node]
+        hops.reverse()
+        node = backward_parent[meeting]
+        while node != -1:
+            hops.append(node)
+            node = backward_parent[node]
+
+        path = [hops[0]]
+        for source, target in zip(hops, hops[1:]):
+            self._unpack(source, target, path)
+        return path, best, expanded
+
+    def route(self, start, goal):
+        """
+        Same contract as a_star_routing: airport codes in, RoutingResult out.
+        """
+        if start not in self.index or goal not in self.index:
+            return RoutingResult(None, inf, 0)
+        path, distance, expanded = self.query(self.index[start], self.index[goal])
+        if path is None:
+            return RoutingResult(None, inf, expanded)
+        return RoutingResult([self.codes[node] for node in path], distance, expanded)
+
+
+def _witness_distances(out, source, skip, limit):
+    """
+    Bounded Dijkstra from ``source`` in the remaining graph, ignoring ``skip``.
+    """
+    dist = {source: 0.0}
+    frontier = [(0.0, source)]
+    settled = 0
+    while frontier and settled < WITNESS_SETTLE_LIMIT:
+        cost, current = heapq.heappop(frontier)
+        if cost > dist[current]:
+            continue
+        if cost > limit:
+            break
+        settled += 1
+        for neighbor, weight in out[current].items():
+            if neighbor == skip:
+                continue
+            new_cost = cost + weight
+            if new_cost < dist.get(neighbor, inf):
+                dist[neighbor] = new_cost
+                heapq.heappush(frontier, (new_cost, neighbor))
+    return dist
+
+
+def _shortcuts(out, inc, node):
+    """
+    Lists the (u, x, weight) shortcuts needed to contract ``node``.
+    """
+    shortcuts = []
+    targets = out[node]
+    if not targets:
+        return shortcuts
+    max_out = max(targets.values())
+
+    for u, w_in in inc[node].items():
+        witness = _witness_distances(out, u, node, w_in + max_out)
+        for x, w_out in targets.items():
+            if x == u:
+                continue
+            through = w_in + w_out
+            if witness.get(x, inf) > through:
+                shortcuts.append((u, x, through))
+    return shortcuts
+
+
+def contract_graph(graph):
+    """
+    Builds a ContractionHierarchy by contracting nodes in edge-difference order.
+    """
+    n = len(graph)
+    offsets, neighbors, weights = graph.adjacency()
+
+    # Remaining (uncontracted) graph, keeping only the lightest parallel edge
+    out = [dict() for _ in range(n)]
+    inc = [dict() for _ in range(n)]
+    for u in range(n):
+        for i in range(offsets[u], offsets[u + 1]):
+            v, w = neighbors[i], weights[i]
+            if u != v and w < out[u].get(v, inf):
+                out[u][v] = w
+                inc[v][u] = w
+
+    deleted_neighbors = [0] * n
+    level = [0] * n
+
+    def priority(node):
+        edge_difference = len(_shortcuts(out, inc, node)) - len(out[node]) - len(inc[node])
+        return 2 * edge_difference + deleted_neighbors[node] + level[node]
+
+    queue = [(priority(node), node) for node in range(n)]
+    heapq.heapify(queue)
+
+    rank = np.zeros(n, dtype=np.int64)
+    edges = []  # (u, v, weight, middle) for every original edge and shortcut
+    for u in range(n):
+        for v, w in out[u].items():
+            edges.append((u, v, w, -1))
+
+    next_rank = 0
+    while queue:
+        _, node = heapq.heappop(queue)
+
+        # Lazy update: re-queue if the priority went up since it was pushed
+        current = priority(node)
+        if queue and current > queue[0][0]:
+            heapq.heappush(queue, (current, node))
+            continue
+
+        for u, x, w in _shortcuts(out, inc, node):
+            if w < out[u].get(x, inf):
+                out[u][x] = w
+                inc[x][u] = w
+                edges.append((u, x, w, node))
+
+        for x in out[node]:
+            del inc[x][node]
+            deleted_neighbors[x] += 1
+            level[x] = max(level[x], level[node] + 1)
+        for u in inc[node]:
+            del out[u][node]
+            deleted_neighbors[u] += 1
+            level[u] = max(level[u], level[node] + 1)
+        out[node] = {}
+        inc[node] = {}
+
+        rank[node] = next_rank
+        next_rank += 1
+
+    # Keep only the lightest edge per (u, v); a shortcut may have been superseded
+    lightest = {}
+    for u, v, w, m in edges:
+        if w < lightest.get((u, v), (inf,))[0]:
+            lightest[(u, v)] = (w, m)
+
+    up = [(u, v, w, m) for (u, v), (w, m) in lightest.items() if rank[u] < rank[v]]
+    down = [(v, u, w, m) for (u, v), (w, m) in lightest.items() if rank[u] > rank[v]]
+
+    arrays = {"rank": rank}
+    for prefix, rows in (("up", up), ("down", down)):
+        rows.sort(key=lambda row: row[0])
+        sources = np.array([row[0] for row in rows], dtype=np.int64)
+        counts = np.bincount(sources, minlength=n) if len(rows) else np.zeros(n, dtype=np.int64)
+        prefix_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=prefix_offsets[1:])
+        arrays[prefix + "_offsets"] = prefix_offsets
+        arrays[prefix + "_neighbors"] = np.array([row[1] for row in rows], dtype=np.int32)
+        arrays[prefix + "_weights"] = np.array([row[2] for row in rows], dtype=np.float64)
+        arrays[prefix + "_middle"] = np.array([row[3] for row in rows], dtype=np.int32)
+
+    return ContractionHierarchy(graph.codes, graph.version, **arrays)
+
+
+_hierarchy = None
+_hierarchy_mtime = None
+_hierarchy_lock = threading.Lock()
+
+
+def get_hierarchy(graph, path):
+    """
+    Returns the hierarchy saved at ``path`` if it was built for ``graph``'s version, else None.
+    """
+    global _hierarchy, _hierarchy_mtime
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    with _hierarchy_lock:
+        if _hierarchy is None or _hierarchy_mtime != mtime:
+            _hierarchy = ContractionHierarchy.load(path)
+            _hierarchy_mtime = mtime
+
+    if _hierarchy.version != graph.version:
+        logger.warning("Route hierarchy at %s is stale (built for %s, graph is %s)", path, _hierarchy.version, graph.version)
+        return None
+    return _hierarchy
+
+
+def bootstrap_hierarchy(graph, path):
+    """
+    Returns the hierarchy for ``graph``, contracting and saving it first if the
+    file at ``path`` is missing or stale. Slow (tens of seconds on the full
+    dataset), so callers run it in the background; the file lock keeps
+    workers from contracting the same graph side by side.
+    """
+    hierarchy = get_hierarchy(graph, path)
+    if hierarchy is None:
+        with file_lock(str(path) + ".lock"):
+            hierarchy = get_hierarchy(graph, path)
+            if hierarchy is None:
+                contract_graph(graph).save(path)
+                hierarchy = get_hierarchy(graph, path)
+    return hierarchy
@@ -0,0 +1,32 @@
+import hashlib
+
+from django.db.models import Max
+
+from flights.models import DataImport
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_import(name):
+    """
+    Returns the DataImport record for an import command, or an unsaved one if it never ran.
+    """
+    return DataImport.objects.filter(name=name).first() or DataImport(name=name, checksum="")
+
+
+def record_import(state, checksum, changed):
+    """
+    Stores the checksum of the imported data. When the import changed any rows, the
+    record also takes a new revision, which moves ``dataset_version()`` even when
+    counts and primary keys stay the same.
+    """
+    state.checksum = checksum
+    if changed:
+        state.revision = (DataImport.objects.aggregate(last=Max("revision"))["last"] or 0) + 1
+    state.save()
@@ -0,0 +1,266 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from flights.apps import serving_requests
+from flights.utils.concurrency import file_lock
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, histogram buckets). Gauges hold the current state of
+# one process; exposition reports the largest value among live workers.
+METRICS = {
+    "flights_http_requests_total": ("counter", "Requests served, by endpoint, method and status.", None),
+    "flights_http_request_duration_seconds": ("histogram", "Request latency by endpoint.", LATENCY_BUCKETS),
+    "flights_db_queries_per_request": (
+        "histogram", "SQL queries issued per request, by endpoint.", (0, 1, 2, 5, 10, 20, 50, 100),
+    ),
+    "flights_routing_expanded_nodes": (
+        "histogram", "Airports expanded per route search, by engine.", (1, 10, 100, 1000, 10000, 100000),
+    ),
+    "flights_route_cache_requests_total": ("counter", "Route cache lookups, by result (hit or miss).", None),
+    "flights_globe_cache_requests_total": ("counter", "Globe snapshot cache lookups, by result (hit or miss).", None),
+    "flights_route_graph_load_seconds": (
+        "histogram", "Time to load the route graph, by source (snapshot or build).", LATENCY_BUCKETS,
+    ),
+    "flights_route_graph_airports": ("gauge", "Airports in the loaded route graph.", None),
+    "flights_route_graph_routes": ("gauge", "Routes in the loaded route graph.", None),
+    "flights_route_graph_bytes": ("gauge", "Size of the loaded route graph arrays.", None),
+}
+
+
+class MetricsStore:
+    """
+    Per-process counters, gauges and histograms, written to
+    ``<directory>/<pid>-<token>.json`` by a background thread every
+    ``flush_interval`` seconds (when they changed) so any worker can serve
+    totals for all of them. The token tells apart processes that got the
+    same pid. Counters and histograms of exited workers are folded into
+    ``archive.json``, so totals never go backwards; gauges only count while
+    their worker is alive.
+    """
+
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = str(directory)
+        self.flush_interval = flush_interval
+        self._values = {}
+        self._pid = os.getpid()
+        self._token = time.time_ns()
+        self._dirty = False
+        self._flusher = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _check_fork(self):
+        # A forked worker must not report what its parent counted before the
+        # fork, and has to start its own flusher. Callers hold the lock.
+        if os.getpid() != self._pid:
+            self._pid, self._token = os.getpid(), time.time_ns()
+            self._values = {key: value for key, value in self._values.items() if METRICS[key[0]][0] == "gauge"}
+            self._flusher = None
+        self._dirty = True
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            self._values[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][2]
+        with self._lock:
+            self._check_fork()
+            counts, total = self._values.get(key) or ([0] * (len(buckets) + 1), 0.0)
+            counts[bisect_left(buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if os.getpid() != self._pid:
+                    self._check_fork()
+                self._dirty = False
+                samples = [[name, dict(labels), value] for (name, labels), value in self._values.items()]
+                pid, token = self._pid, self._token
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, "{}-{}.json".format(pid, token))
+            _write_json(path, {"pid": pid, "token": token, "samples": samples})
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def collect(self):
+        """
+        Flushes this process, archives the files of exited workers and merges
+        the rest. Returns {(name, labels): value}.
+        """
+        self.flush()
+        with file_lock(os.path.join(self.directory, ".archive.lock")):
+            archive_path = os.path.join(self.directory, "archive.json")
+            archive = _read_json(archive_path) or {"samples": []}
+            live, dead = [], []
+            # Also picks up <pid>.json files from before tokens, which get archived once their worker exits
+            for path in glob.glob(os.path.join(self.directory, "*.json")):
+                if path == archive_path:
+                    continue
+                data = _read_json(path)
+                if data is not None:
+                    (live if self._alive(data) else dead).append((path, data))
+
+            if dead:
+                merged = _merge([archive] + [data for _, data in dead], gauges=False)
+                archive = {"samples": [[name, dict(labels), value] for (name, labels), value in merged.items()]}
+                _write_json(archive_path, archive)
+                for path, _ in dead:
+                    os.remove(path)
+
+            return _merge([archive] + [data for _, data in live], gauges=True)
+
+    def _alive(self, data):
+        if data["pid"] == self._pid:
+            # Same pid, other token: an earlier process this pid was reused from
+            return data.get("token") == self._token
+        return _pid_alive(data["pid"])
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def _merge(files, gauges):
+    """
+    Sums counters and histograms over metrics files; gauges (when asked for) take the largest value.
+    """
+    merged = {}
+    for data in files:
+        for name, labels, value in data["samples"]:
+            if name not in METRICS:
+                continue
+            kind = METRICS[name][0]
+            key = (name, tuple(sorted(labels.items())))
+            if kind == "counter":
+                merged[key] = merged.get(key, 0) + value
+            elif kind == "gauge":
+                if gauges:
+                    merged[key] = max(merged.get(key, value), value)
+            else:
+                counts, total = merged.get(key) or ([0] * len(value[0]), 0.0)
+                merged[key] = ([a + b for a, b in zip(counts, value[0])], total + value[1])
+    return merged
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to someone else
+        return True
+    return True
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join('{}="{}"'.format(name, value) for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(samples):
+    """
+    Renders collected samples in the Prometheus text format (version 0.0.4).
+    """
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted((labels, value) for (sample_name, labels), value in samples.items() if sample_name == name)
+        if not series:
+            continue
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} {}".format(name, kind))
+        for labels, value in series:
+            if kind != "histogram":
+                lines.append("{}{} {}".format(name, _format_labels(labels), _format_value(value)))
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(list(buckets) + [float("inf")], counts):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(name, _format_labels(labels, le=_format_value(bound)), cumulative))
+            lines.append("{}_sum{} {}".format(name, _format_labels(labels), _format_value(total)))
+            lines.append("{}_count{} {}".format(name, _format_labels(labels), cumulative))
+    return "\n".join(lines) + "\n"
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_metrics():
+    global _store
+
+    with _store_lock:
+        if _store is None or _store.directory != str(settings.METRICS_DIR):
+            _store = MetricsStore(settings.METRICS_DIR, getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0))
+            atexit.register(_store.flush)
+        return _store
+
+
+def recording():
+    # Management commands and scripts share METRICS_DIR with the server but aren't part of it
+    return getattr(settings, "METRICS_ENABLED", True) and serving_requests()
+
+
+def inc(name, amount=1, **labels):
+    if recording():
+        get_metrics().inc(name, amount, **labels)
+
+
+def set_gauge(name, value, **labels):
+    if recording():
+        get_metrics().set(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    if recording():
+        get_metrics().observe(name, value, **labels)
@@ -0,0 +1,146 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_current = contextvars.ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    """
+    Timings collected while serving one request: named phases (seconds,
+    summed over repeats) plus the number and total time of SQL queries.
+    """
+
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.queries = 0
+        self.query_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        # Phases may finish on search pool threads while the view records others
+        with self._lock:
+            self.phases[name] += seconds
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+
+
+def current_profile():
+    return _current.get()
+
+
+@contextmanager
+def profile_request(profile):
+    """
+    Makes ``profile`` the one phase() and the query counter record into for
+    the current context (and the threads it hands work to).
+    """
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """
+    Times the enclosed block as phase ``name`` of the request being profiled;
+    a no-op outside profiled requests.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started)
+
+
+def _count_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(time.perf_counter() - started)
+
+
+def _install_on(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def install_query_counter():
+    """
+    Counts queries on every database connection, in any thread, towards the
+    profiled request whose context issued them. Safe to call repeatedly.
+    """
+    connection_created.connect(_install_on, dispatch_uid="flights.profiling.count_queries")
+    for connection in connections.all(initialized_only=True):
+        _install_on(connection)
+
+
+class StackSampler:
+    """
+    Samples the stacks of every thread but its own each ``interval`` seconds,
+    so work handed to sync_to_async and the search pool shows up too (along
+    with whatever else the process is doing at the time).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        names = {}
+        while True:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == self._thread.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+            if self._stop.wait(self.interval):
+                return
+
+    def write(self, path):
+        """
+        Saves the samples in folded-stack format ("frame;frame;frame count"),
+        which flamegraph.pl and speedscope read.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write("{} {}\n".format(stack, count))
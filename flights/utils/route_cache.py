@@ -0,0 +1,184 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from flights.cache import cache_ttl
+from flights.utils.concurrency import get_search_pool
+from flights.utils.metrics import inc
+from flights.utils.profiling import phase
+from flights.utils.routing import RoutingResult, find_route
+
+
+class RouteCache:
+    """
+    Memoizes routing results by (origin, destination, engine, graph version).
+
+    A bounded in-process LRU sits in front of an optional shared Django cache
+    (``backend``), so workers can reuse each other's searches. Keys embed the
+    graph version, so a route reload makes every older entry unreachable.
+    """
+
+    def __init__(self, max_size=10000, backend=None, timeout=3600):
+        self.max_size = max_size
+        self.backend = backend
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _shared_key(key):
+        origin, destination, engine, version = key
+        return "route:{}:{}:{}:{}".format(version, engine, origin, destination)
+
+    def _check_version(self, version):
+        # Graph changed: drop everything computed on the old one. Callers hold the lock.
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get_local(self, key):
+        """
+        Looks up the in-process LRU only, so it never does I/O. Misses aren't counted.
+        """
+        with self._lock:
+            self._check_version(key[3])
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                inc("flights_route_cache_requests_total", result="hit")
+            return result
+
+    def get(self, key):
+        result = self.get_local(key)
+        if result is not None:
+            return result
+
+        if self.backend is not None:
+            cached = self.backend.get(self._shared_key(key))
+            if cached is not None:
+                result = RoutingResult(*cached)
+                self._remember(key, result)
+                with self._lock:
+                    self.hits += 1
+                inc("flights_route_cache_requests_total", result="hit")
+                return result
+
+        self.record_miss()
+        return None
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+        inc("flights_route_cache_requests_total", result="miss")
+
+    def set(self, key, result):
+        self._remember(key, result)
+        if self.backend is not None:
+            self.backend.set(self._shared_key(key), tuple(result), timeout=self.timeout)
+
+    def get_many(self, keys):
+        return {key: self.get(key) for key in keys}
+
+    def set_many(self, results):
+        for key, result in results.items():
+            self.set(key, result)
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._check_version(key[3])
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache():
+    global _route_cache
+
+    with _route_cache_lock:
+        if _route_cache is None:
+            alias = getattr(settings, "ROUTE_CACHE_BACKEND", None)
+            _route_cache = RouteCache(
+                max_size=getattr(settings, "ROUTE_CACHE_SIZE", 10000),
+                backend=caches[alias] if alias else None,
+                timeout=cache_ttl("routes"),
+            )
+        return _route_cache
+
+
+def cached_find_route(start, goal, graph, engine=None):
+    """
+    find_route, answered from the route cache when the same search was already done.
+    """
+    engine = engine or getattr(settings, "ROUTING_ENGINE", "astar")
+    key = (start, goal, engine, graph.version)
+
+    route_cache = get_route_cache()
+    with phase("route_cache"):
+        result = route_cache.get(key)
+    if result is None:
+        with phase("search"):
+            result = find_route(start, goal, graph, engine=engine)
+        with phase("route_cache"):
+            route_cache.set(key, result)
+    return result
+
+
+def _search_and_store(key, graph):
+    start, goal, engine, _ = key
+    with phase("search"):
+        result = find_route(start, goal, graph, engine=engine)
+    with phase("route_cache"):
+        get_route_cache().set(key, result)
+    return result
+
+
+async def async_cached_find_route(start, goal, graph, engine=None):
+    """
+    cached_find_route for async views. Misses run on the search pool, where
+    concurrent requests for the same search share one computation; raises
+    Overloaded when the pool is full.
+    """
+    engine = engine or getattr(settings, "ROUTING_ENGINE", "astar")
+    key = (start, goal, engine, graph.version)
+
+    route_cache = get_route_cache()
+    with phase("route_cache"):
+        result = route_cache.get_local(key)
+    if result is not None:
+        return result
+    if route_cache.backend is not None:
+        # The shared backend does file or network I/O, so it's checked off the event loop
+        return await get_search_pool().run(key, cached_find_route, start, goal, graph, engine)
+    route_cache.record_miss()
+    return await get_search_pool().run(key, _search_and_store, key, graph)
@@ -1,31 +1,302 @@
 import heapq
-from collections import defaultdict
-
-def a_star_routing(start, goal, graph, airports_data):
-    def heuristic(a_code, b_code):
-        # Euclidean distance as heuristic
-        ax, ay = airports_data[a_code]['latitude'], airports_data[a_code]['longitude']
-        bx, by = airports_data[b_code]['latitude'], airports_data[b_code]['longitude']
-        return ((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5
-    
-    frontier = [(0, start, [])]  # (priority, current_airport, path_so_far)
-    visited = set()
-    
+from collections import namedtuple
+from math import inf
+
+import numpy as np
+from django.conf import settings
+
+from flights.utils.geodesy import haversine
+from flights.utils.metrics import observe
+from flights.utils.trips import FLIGHT_SPEED_KMH, LAYOVER
+
+# Route distances come from the same haversine kernel (flights.utils.geodesy), so
+# the great-circle heuristic can only exceed them through rounding; shrink it a
+# hair to keep it admissible.
+HEURISTIC_SCALE = 1 - 1e-9
+
+RoutingResult = namedtuple("RoutingResult", ["path", "distance", "expanded"])
+
+# Airport ids reached, hours after departure, flights taken and the previous airport id (-1 for the origin)
+Isochrone = namedtuple("Isochrone", ["nodes", "hours", "hops", "parent"])
+
+
+def great_circle_heuristic(graph, target):
+    """
+    Returns the great-circle distance in km from every airport to ``target`` (an id).
+    """
+    distances = haversine(graph.lat, graph.lon, graph.lat[target], graph.lon[target])
+    return (distances * HEURISTIC_SCALE).tolist()
+
+
+def _unwind(parent, node):
+    path = []
+    while node != -1:
+        path.append(node)
+        node = parent[node]
+    path.reverse()
+    return path
+
+
+def _a_star(graph, start, goal):
+    offsets, neighbors, weights = graph.adjacency()
+    h = great_circle_heuristic(graph, goal)
+
+    dist = [inf] * len(graph)
+    parent = [-1] * len(graph)
+    closed = bytearray(len(graph))
+    dist[start] = 0.0
+    frontier = [(h[start], start)]
+    expanded = 0
+
     while frontier:
-        cost, current, path = heapq.heappop(frontier)
-        
-        if current in visited:
+        _, current = heapq.heappop(frontier)
+        if closed[current]:
             continue
-        visited.add(current)
-        
-        path = path + [current]
-        
+        closed[current] = 1
+        expanded += 1
+
         if current == goal:
-            return path
-        
-        for neighbor, dist in graph[current]:
-            if neighbor not in visited:
-                priority = cost + dist + heuristic(neighbor, goal)
-                heapq.heappush(frontier, (priority, neighbor, path))
-    
-    return None  # No path found   
\ No newline at end of file
+            return _unwind(parent, goal), dist[goal], expanded
+
+        cost = dist[current]
+        for i in range(offsets[current], offsets[current + 1]):
+            neighbor = neighbors[i]
+            new_cost = cost + weights[i]
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                parent[neighbor] = current
+                heapq.heappush(frontier, (new_cost + h[neighbor], neighbor))
+
+    return None, inf, expanded
+
+
+def _bidirectional_a_star(graph, start, goal):
+    """
+    Bidirectional A* with average potentials: both searches use
+    p(v) = (h_goal(v) - h_start(v)) / 2, which keeps reduced edge costs
+    non-negative and makes ``top_forward + top_backward >= best`` a valid stop test.
+    """
+    to_goal = great_circle_heuristic(graph, goal)
+    to_start = great_circle_heuristic(graph, start)
+    potential = [(g - s) / 2 for g, s in zip(to_goal, to_start)]
+
+    n = len(graph)
+    sides = []
+    for reverse, source, sign in ((False, start, 1), (True, goal, -1)):
+        sides.append({
+            "adjacency": graph.adjacency(reverse=reverse),
+            "dist": [inf] * n,
+            "parent": [-1] * n,
+            "closed": bytearray(n),
+            "frontier": [(sign * potential[source], source)],
+            "sign": sign,
+        })
+        sides[-1]["dist"][source] = 0.0
+
+    best, meeting, expanded = inf, -1, 0
+    forward, backward = sides
+
+    while forward["frontier"] and backward["frontier"]:
+        if forward["frontier"][0][0] + backward["frontier"][0][0] >= best:
+            break
+
+        # Advance the side with the smaller frontier
+        if len(forward["frontier"]) <= len(backward["frontier"]):
+            side, other = forward, backward
+        else:
+            side, other = backward, forward
+
+        _, current = heapq.heappop(side["frontier"])
+        if side["closed"][current]:
+            continue
+        side["closed"][current] = 1
+        expanded += 1
+
+        offsets, neighbors, weights = side["adjacency"]
+        dist, parent, sign = side["dist"], side["parent"], side["sign"]
+        other_dist = other["dist"]
+        cost = dist[current]
+
+        for i in range(offsets[current], offsets[current + 1]):
+            neighbor = neighbors[i]
+            new_cost = cost + weights[i]
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                parent[neighbor] = current
+                heapq.heappush(side["frontier"], (new_cost + sign * potential[neighbor], neighbor))
+            through = dist[neighbor] + other_dist[neighbor]
+            if through < best:
+                best, meeting = through, neighbor
+
+    if meeting == -1:
+        return None, inf, expanded
+
+    path = _unwind(forward["parent"], meeting)
+    node = backward["parent"][meeting]
+    while node != -1:
+        path.append(node)
+        node = backward["parent"][node]
+    return path, best, expanded
+
+
+def a_star_routing(start, goal, graph, bidirectional=False):
+    """
+    Finds the shortest path (by route distance) between two airport codes over a RouteGraph.
+
+    Returns a RoutingResult of (path of codes or None, total km, expanded nodes).
+    """
+    if start not in graph or goal not in graph:
+        return RoutingResult(None, inf, 0)
+
+    start_node = graph.index[start]
+    goal_node = graph.index[goal]
+    if start_node == goal_node:
+        return RoutingResult([start], 0.0, 0)
+
+    search = _bidirectional_a_star if bidirectional else _a_star
+    path, distance, expanded = search(graph, start_node, goal_node)
+
+    if path is None:
+        return RoutingResult(None, inf, expanded)
+    return RoutingResult([graph.codes[node] for node in path], distance, expanded)
+
+
+def one_to_many_routing(start, goals, graph):
+    """
+    Shortest paths from one airport code to many, in a single Dijkstra pass
+    that stops once every reachable goal is settled.
+
+    Returns {goal code: RoutingResult}; ``expanded`` is shared by the whole search.
+    """
+    results = {goal: RoutingResult(None, inf, 0) for goal in goals}
+    if start not in graph:
+        return results
+
+    start_node = graph.index[start]
+    # Unreachable goals would otherwise keep the search going until it has settled everything
+    reachability = graph.reachability()
+    remaining = {
+        graph.index[goal] for goal in goals
+        if goal in graph and reachability.reachable(start_node, graph.index[goal])
+    }
+    offsets, neighbors, weights = graph.adjacency()
+
+    dist = [inf] * len(graph)
+    parent = [-1] * len(graph)
+    closed = bytearray(len(graph))
+    dist[start_node] = 0.0
+    frontier = [(0.0, start_node)]
+    expanded = 0
+
+    while frontier and remaining:
+        cost, current = heapq.heappop(frontier)
+        if closed[current]:
+            continue
+        closed[current] = 1
+        expanded += 1
+        remaining.discard(current)
+
+        for i in range(offsets[current], offsets[current + 1]):
+            neighbor = neighbors[i]
+            new_cost = cost + weights[i]
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                parent[neighbor] = current
+                heapq.heappush(frontier, (new_cost, neighbor))
+
+    observe("flights_routing_expanded_nodes", expanded, engine="dijkstra")
+    for goal in results:
+        node = graph.index.get(goal)
+        if node is not None and closed[node]:
+            path = [graph.codes[hop] for hop in _unwind(parent, node)]
+            results[goal] = RoutingResult(path, dist[node], expanded)
+    return results
+
+
+def isochrone(start, graph, max_hours, max_hops=None):
+    """
+    Every airport reachable from ``start`` (a code) within ``max_hours`` and
+    at most ``max_hops`` flights, under the trip time model of plan_legs
+    (FLIGHT_SPEED_KMH plus a LAYOVER before each onward flight).
+
+    Runs hop-bounded Bellman-Ford, one vectorized relaxation of the routes
+    leaving the previous round's improved airports per flight, so round k
+    holds the fastest arrivals using at most k flights. When ``max_hops``
+    cuts the search short an airport's ``parent`` is where its fastest
+    hop-limited route came from, which may not lie on the parent's own
+    fastest route.
+
+    Returns an Isochrone sorted by arrival time, or None if ``start`` is unknown.
+    """
+    if start not in graph:
+        return None
+
+    layover = LAYOVER.total_seconds() / 3600
+    # Each flight costs its air time plus the layover before the next one, so
+    # an airport's arrival time is its cost minus one layover
+    edge_hours = graph.weights / FLIGHT_SPEED_KMH + layover
+    budget = max_hours + layover
+    max_hops = len(graph) if max_hops is None else max_hops
+
+    cost = np.full(len(graph), inf)
+    hops = np.zeros(len(graph), dtype=np.int64)
+    parent = np.full(len(graph), -1, dtype=np.int64)
+    start_node = graph.index[start]
+    cost[start_node] = 0.0
+    frontier = np.array([start_node])
+
+    for hop in range(1, max_hops + 1):
+        if not len(frontier):
+            break
+        # Routes leaving the airports improved in the previous round
+        counts = graph.offsets[frontier + 1] - graph.offsets[frontier]
+        edges = np.repeat(graph.offsets[frontier] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        sources = np.repeat(frontier, counts)
+        targets = graph.neighbors[edges].astype(np.int64)
+        candidates = cost[sources] + edge_hours[edges]
+
+        keep = (candidates <= budget) & (candidates < cost[targets])
+        sources, targets, candidates = sources[keep], targets[keep], candidates[keep]
+        if not len(targets):
+            break
+
+        # Compare against the previous round's costs only, so round k never chains k + 1 flights
+        best = np.full(len(graph), inf)
+        np.minimum.at(best, targets, candidates)
+        winners = candidates == best[targets]
+        cost[targets[winners]] = candidates[winners]
+        parent[targets[winners]] = sources[winners]
+        hops[targets[winners]] = hop
+        frontier = np.unique(targets[winners])
+
+    nodes = np.flatnonzero(cost <= budget)
+    nodes = nodes[np.argsort(cost[nodes], kind="stable")]
+    hours = np.maximum(cost[nodes] - layover, 0.0)
+    return Isochrone(nodes, hours, hops[nodes], parent[nodes])
+
+
+def find_route(start, goal, graph, engine=None):
+    """
+    Routes with the engine named by ``engine`` or settings.ROUTING_ENGINE:
+    "astar", "bidirectional" or "ch" (contraction hierarchy, falling back to
+    A* while no up-to-date hierarchy has been built).
+    """
+    engine = engine or getattr(settings, "ROUTING_ENGINE", "astar")
+    result = _find_route(start, goal, graph, engine)
+    observe("flights_routing_expanded_nodes", result.expanded, engine=engine)
+    return result
+
+
+def _find_route(start, goal, graph, engine):
+    # Answer "no route" without searching everything reachable from start
+    if start in graph and goal in graph and not graph.reachability().reachable(graph.index[start], graph.index[goal]):
+        return RoutingResult(None, inf, 0)
+
+    if engine == "ch":
+        from flights.utils.hierarchy import get_hierarchy
+
+        hierarchy = get_hierarchy(graph, settings.ROUTE_HIERARCHY_PATH)
+        if hierarchy is not None:
+            return hierarchy.route(start, goal)
+
+    return a_star_routing(start, goal, graph, bidirectional=engine == "bidirectional")
@@ -0,0 +1,230 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from math import inf
+
+from django.db.models import Count, Max
+
+from flights.models import Flight
+
+Journey = namedtuple("Journey", ["flight_ids", "arrival", "scanned"])
+
+
+class Timetable:
+    """
+    In-memory Connection Scan timetable: every Flight as a connection, kept
+    sorted by departure in compact parallel arrays. Stops are Airport pks and
+    times are UNIX seconds.
+
+    Flights added with ``with_rows`` go to a small sorted ``recent`` part
+    that the scan merges in, so picking up new flights doesn't copy the
+    main arrays; ``recent`` is folded into them once it outgrows
+    1/REBUILD_FRACTION of the timetable.
+    """
+
+    # Batches larger than this fraction of the timetable are merged by
+    # re-sorting instead of inserting one by one.
+    REBUILD_FRACTION = 8
+
+    def __init__(self):
+        self.departures = array("q")
+        self.arrivals = array("q")
+        self.origins = array("q")
+        self.destinations = array("q")
+        self.flight_ids = array("q")
+        self.recent = None  # Timetable of flights added since the last merge
+        self.high_water = 0  # largest Flight id loaded
+
+    def __len__(self):
+        return len(self.flight_ids) + (len(self.recent) if self.recent is not None else 0)
+
+    def copy(self):
+        timetable = Timetable()
+        for column, values in zip(timetable._columns(), self._columns()):
+            column.extend(values)
+        timetable.recent = self.recent.copy() if self.recent is not None else None
+        timetable.high_water = self.high_water
+        return timetable
+
+    def _columns(self):
+        return (self.departures, self.arrivals, self.origins, self.destinations, self.flight_ids)
+
+    def add(self, rows):
+        """
+        Adds (flight_id, origin_id, destination_id, departure_ts, arrival_ts) rows.
+        """
+        rows = [(departure, arrival, origin, destination, flight_id)
+                for flight_id, origin, destination, departure, arrival in rows]
+        if not rows:
+            return
+
+        if len(rows) * self.REBUILD_FRACTION > len(self.flight_ids):
+            rows.extend(zip(*self._columns()))
+            rows.sort()
+            for column, values in zip(self._columns(), zip(*rows)):
+                column[:] = array("q", values)
+        else:
+            for row in rows:
+                position = bisect_right(self.departures, row[0])
+                for column, value in zip(self._columns(), row):
+                    column.insert(position, value)
+
+        self.high_water = max(self.high_water, max(row[4] for row in rows))
+
+    def with_rows(self, rows):
+        """
+        Returns a new timetable with ``rows`` added, leaving this one untouched.
+        It shares this timetable's main arrays; only the recent part is copied.
+        """
+        rows = list(rows)
+        recent = self.recent.copy() if self.recent is not None else Timetable()
+        recent.add(rows)
+
+        timetable = Timetable()
+        if len(recent) * self.REBUILD_FRACTION > len(self.flight_ids):
+            # Fold the recent flights into new main arrays
+            for column, values in zip(timetable._columns(), self._columns()):
+                column.extend(values)
+            timetable.add(zip(recent.flight_ids, recent.origins, recent.destinations, recent.departures, recent.arrivals))
+        else:
+            timetable.departures, timetable.arrivals, timetable.origins, timetable.destinations, timetable.flight_ids = (
+                self._columns()
+            )
+            timetable.recent = recent
+        timetable.high_water = max(self.high_water, recent.high_water)
+        return timetable
+
+    def earliest_arrival(self, origin, destination, departure_ts, min_connection=0):
+        """
+        Connection Scan for the earliest arrival at ``destination`` leaving
+        ``origin`` no earlier than ``departure_ts``. Changing flights needs at
+        least ``min_connection`` seconds on the ground.
+        """
+        if origin == destination:
+            return Journey([], departure_ts, 0)
+
+        departures, arrivals = self.departures, self.arrivals
+        origins, destinations = self.origins, self.destinations
+        main = self._columns()
+
+        # Seeding the origin one connection time early lets the first flight
+        # leave at departure_ts without a minimum connection.
+        earliest = {origin: departure_ts - min_connection}
+        ready_at = earliest.get
+        via = {}
+        target_arrival = inf
+
+        def relax(columns, k):
+            # The loop below inlined, for connections of the recent part
+            nonlocal target_arrival
+            ready = ready_at(columns[2][k])
+            if ready is None or ready + min_connection > columns[0][k]:
+                return
+            stop, arrival = columns[3][k], columns[1][k]
+            if arrival < ready_at(stop, inf):
+                earliest[stop] = arrival
+                via[stop] = (columns, k)
+                if stop == destination:
+                    target_arrival = arrival
+
+        # Recent connections are merged in by departure, just before the
+        # first main one that leaves no earlier
+        recent = self.recent._columns() if self.recent is not None else (array("q"),)
+        j = bisect_left(recent[0], departure_ts)
+        next_recent = recent[0][j] if j < len(recent[0]) else inf
+        first = bisect_left(departures, departure_ts)
+        last = len(departures)
+        scanned = 0  # recent connections; main ones are counted from first/last
+
+        for i in range(first, len(departures)):
+            departure = departures[i]
+            while next_recent <= departure and next_recent < target_arrival:
+                relax(recent, j)
+                scanned += 1
+                j += 1
+                next_recent = recent[0][j] if j < len(recent[0]) else inf
+            if departure >= target_arrival:
+                last = i
+                break
+
+            ready = ready_at(origins[i])
+            if ready is None or ready + min_connection > departure:
+                continue
+
+            stop, arrival = destinations[i], arrivals[i]
+            if arrival < ready_at(stop, inf):
+                earliest[stop] = arrival
+                via[stop] = (main, i)
+                if stop == destination:
+                    target_arrival = arrival
+
+        # Recent connections leaving after the last main one
+        while next_recent < target_arrival:
+            relax(recent, j)
+            scanned += 1
+            j += 1
+            next_recent = recent[0][j] if j < len(recent[0]) else inf
+
+        scanned += last - first
+        if destination not in via:
+            return Journey(None, inf, scanned)
+
+        flight_ids = []
+        stop = destination
+        while stop != origin:
+            columns, k = via[stop]
+            flight_ids.append(columns[4][k])
+            stop = columns[2][k]
+        flight_ids.reverse()
+        return Journey(flight_ids, target_arrival, scanned)
+
+
+def _flight_rows(queryset):
+    for flight_id, origin_id, destination_id, departure, arrival in queryset.values_list(
+        "id", "origin_id", "destination_id", "departure_time", "arrival_time"
+    ).iterator(chunk_size=10000):
+        yield flight_id, origin_id, destination_id, int(departure.timestamp()), int(arrival.timestamp())
+
+
+_timetable = None
+_timetable_lock = threading.Lock()
+
+
+def get_timetable():
+    """
+    Returns the process-wide timetable, appending flights created since the
+    last call. Falls back to a full reload if flights were deleted.
+
+    Timetables handed out are never mutated; updates go into a new one that
+    shares their main arrays (see Timetable.with_rows).
+    """
+    global _timetable
+
+    stats = Flight.objects.aggregate(count=Count("id"), last=Max("id"))
+    with _timetable_lock:
+        timetable = _timetable
+        if timetable is not None and stats["count"] == len(timetable) and (stats["last"] or 0) == timetable.high_water:
+            return timetable
+
+        if timetable is not None:
+            new_rows = list(_flight_rows(Flight.objects.filter(id__gt=timetable.high_water)))
+            if len(timetable) + len(new_rows) == stats["count"]:
+                timetable = timetable.with_rows(new_rows)
+                _timetable = timetable
+                return timetable
+
+        timetable = Timetable()
+        timetable.add(_flight_rows(Flight.objects.all()))
+        _timetable = timetable
+        return timetable
+
+
+def invalidate_timetable():
+    """
+    Drops the process-wide timetable, so the next get_timetable() reloads every flight.
+    """
+    global _timetable
+
+    with _timetable_lock:
+        _timetable = None
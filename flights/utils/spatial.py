@@ -0,0 +1,309 @@
+import heapq
+import threading
+
+import numpy as np
+
+from flights.models import Airport
+from flights.utils.geodesy import EARTH_RADIUS_KM
+
+
+def unit_vectors(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+class CellGrid:
+    """
+    Multi-level lat/lon grid over airport ids. Level ``L`` splits the globe
+    into cells of 180 / 2**L degrees; each cell lists its airports by
+    descending rank, keeping at most ``per_cell`` of them.
+    """
+
+    MAX_LEVEL = 10
+
+    def __init__(self, lat, lon, rank, max_level=MAX_LEVEL, per_cell=64):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.rank = np.asarray(rank, dtype=np.int64)
+        self.max_level = max_level
+        self.levels = []
+
+        # Highest rank first, ties broken by id, so cells come out pre-sorted
+        by_rank = np.lexsort((np.arange(len(self.rank)), -self.rank))
+        for level in range(max_level + 1):
+            cells = self.cell_ids(level, self.lat[by_rank], self.lon[by_rank])
+            order = np.argsort(cells, kind="stable")
+            cells, members = cells[order], by_rank[order]
+            keys, starts, counts = np.unique(cells, return_index=True, return_counts=True)
+            self.levels.append({
+                int(key): members[start:start + min(count, per_cell)]
+                for key, start, count in zip(keys, starts, counts)
+            })
+
+    @staticmethod
+    def cell_size(level):
+        return 180.0 / 2 ** level
+
+    @classmethod
+    def cell_ids(cls, level, lat, lon):
+        size = cls.cell_size(level)
+        lat_cells, lon_cells = 2 ** level, 2 ** (level + 1)
+        rows = np.clip(((np.asarray(lat) + 90) // size).astype(np.int64), 0, lat_cells - 1)
+        cols = np.clip(((np.asarray(lon) + 180) // size).astype(np.int64), 0, lon_cells - 1)
+        return rows * lon_cells + cols
+
+    def query(self, min_lat, min_lon, max_lat, max_lon, level, limit, max_cells=512):
+        """
+        Airport ids inside the box, highest rank first. A box with
+        min_lon > max_lon wraps across the antimeridian. Coarsens the level
+        until the box covers at most ``max_cells`` cells. Raises ValueError
+        for NaN or infinite coordinates.
+        """
+        if not np.all(np.isfinite([min_lat, min_lon, max_lat, max_lon])):
+            raise ValueError("Box coordinates must be finite")
+        level = max(0, min(level, self.max_level))
+        lon_ranges = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+
+        while True:
+            size = self.cell_size(level)
+            lat_cells, lon_cells = 2 ** level, 2 ** (level + 1)
+            rows = range(max(0, int((min_lat + 90) // size)), min(lat_cells - 1, int((max_lat + 90) // size)) + 1)
+            cols = []
+            for low, high in lon_ranges:
+                cols.extend(range(max(0, int((low + 180) // size)), min(lon_cells - 1, int((high + 180) // size)) + 1))
+            if len(rows) * len(cols) <= max_cells or level == 0:
+                break
+            level -= 1
+
+        cells = self.levels[level]
+        found = [cells[key] for key in (row * lon_cells + col for row in rows for col in cols) if key in cells]
+        if not found:
+            return np.zeros(0, dtype=np.int64), level
+
+        candidates = np.concatenate(found)
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        inside = (lat >= min_lat) & (lat <= max_lat)
+        if min_lon <= max_lon:
+            inside &= (lon >= min_lon) & (lon <= max_lon)
+        else:
+            inside &= (lon >= min_lon) | (lon <= max_lon)
+        candidates = candidates[inside]
+
+        order = np.lexsort((candidates, -self.rank[candidates]))
+        return candidates[order][:limit], level
+
+
+class SphericalKDTree:
+    """
+    KD-tree over points on the unit sphere (airports as 3D unit vectors).
+    Straight-line chord length is monotonic in great-circle distance, so
+    ordinary Euclidean pruning gives exact nearest and radius results.
+
+    Nodes are stored in flat arrays; node ``i`` covers
+    ``order[starts[i]:ends[i]]`` inside the box ``lows[i]``..``highs[i]``.
+    """
+
+    def __init__(self, lat, lon, leaf_size=16):
+        self.points = unit_vectors(lat, lon)
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(self.points))
+        self.starts, self.ends, self.lefts, self.rights, self.lows, self.highs = [], [], [], [], [], []
+        if len(self.points):
+            self._build(0, len(self.points))
+        self.lows = np.array(self.lows).reshape(-1, 3)
+        self.highs = np.array(self.highs).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _build(self, start, end):
+        node = len(self.starts)
+        members = self.order[start:end]
+        points = self.points[members]
+        low, high = points.min(axis=0), points.max(axis=0)
+        for values, value in ((self.starts, start), (self.ends, end), (self.lows, low), (self.highs, high)):
+            values.append(value)
+        self.lefts.append(-1)
+        self.rights.append(-1)
+
+        if end - start > self.leaf_size:
+            axis = int(np.argmax(high - low))
+            middle = (start + end) // 2
+            self.order[start:end] = members[np.argpartition(points[:, axis], middle - start)]
+            self.lefts[node] = self._build(start, middle)
+            self.rights[node] = self._build(middle, end)
+        return node
+
+    def _box_distance(self, node, point):
+        gap = np.maximum(0, np.maximum(self.lows[node] - point, point - self.highs[node]))
+        return float(gap @ gap)
+
+    def _leaf(self, node, point):
+        members = self.order[self.starts[node]:self.ends[node]]
+        offsets = self.points[members] - point
+        return members, np.einsum("ij,ij->i", offsets, offsets)
+
+    def nearest(self, lat, lon, k):
+        """
+        Returns (ids, distances in km) of the ``k`` points closest to (lat, lon), nearest first.
+        """
+        if not len(self) or k < 1:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        point = unit_vectors(lat, lon)
+        best = []  # max-heap of (-squared chord, id)
+        frontier = [(0.0, 0)]
+
+        while frontier:
+            distance, node = heapq.heappop(frontier)
+            if len(best) == k and distance >= -best[0][0]:
+                break
+            if self.lefts[node] == -1:
+                members, distances = self._leaf(node, point)
+                for member, squared in zip(members.tolist(), distances.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-squared, member))
+                    elif squared < -best[0][0]:
+                        heapq.heapreplace(best, (-squared, member))
+            else:
+                for child in (self.lefts[node], self.rights[node]):
+                    heapq.heappush(frontier, (self._box_distance(child, point), child))
+
+        best.sort(key=lambda entry: (-entry[0], entry[1]))
+        ids = np.array([member for _, member in best], dtype=np.int64)
+        return ids, chord_to_km(np.sqrt([-squared for squared, _ in best]))
+
+    def within(self, lat, lon, radius_km):
+        """
+        Returns (ids, distances in km) of every point within ``radius_km`` of (lat, lon), nearest first.
+        Raises ValueError for a negative or non-finite radius.
+        """
+        if not (np.isfinite(radius_km) and radius_km >= 0):
+            raise ValueError("Radius must be finite and at least 0")
+        if not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        point = unit_vectors(lat, lon)
+        limit = float(km_to_chord(radius_km)) ** 2
+        found_ids, found_distances = [], []
+        stack = [0]
+
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, point) > limit:
+                continue
+            if self.lefts[node] == -1:
+                members, distances = self._leaf(node, point)
+                inside = distances <= limit
+                found_ids.append(members[inside])
+                found_distances.append(distances[inside])
+            else:
+                stack.extend((self.lefts[node], self.rights[node]))
+
+        if not found_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        ids, distances = np.concatenate(found_ids), np.concatenate(found_distances)
+        order = np.lexsort((ids, distances))
+        return ids[order], chord_to_km(np.sqrt(distances[order]))
+
+
+class AirportIndex:
+    """
+    Spatial indexes over every airport in a RouteGraph: a CellGrid ranked by
+    total connections (the outbound + inbound counts load_routes stores on
+    Airport) for level-of-detail views, and a SphericalKDTree for nearest and
+    radius searches.
+    """
+
+    # Query a few levels finer than the zoom so a view spans several cells
+    # and each region can contribute its own busiest airports.
+    LEVEL_OFFSET = 2
+
+    def __init__(self, graph, names):
+        self.graph = graph
+        self.version = graph.version
+        self.names = names
+        self.rank = np.diff(graph.offsets) + np.diff(graph.reverse_offsets)
+        self.grid = CellGrid(graph.lat, graph.lon, self.rank)
+        self.tree = SphericalKDTree(graph.lat, graph.lon)
+        self.edge_sources = np.repeat(np.arange(len(graph), dtype=np.int32), np.diff(graph.offsets))
+
+    def view(self, min_lat, min_lon, max_lat, max_lon, zoom, max_airports, max_routes):
+        graph = self.graph
+        nodes, level = self.grid.query(min_lat, min_lon, max_lat, max_lon, zoom + self.LEVEL_OFFSET, max_airports)
+
+        selected = np.zeros(len(graph), dtype=bool)
+        selected[nodes] = True
+        edges = np.flatnonzero(selected[self.edge_sources] & selected[graph.neighbors])
+
+        # One link per airport pair, busiest pairs first
+        sources, targets = self.edge_sources[edges], graph.neighbors[edges]
+        pairs = np.minimum(sources, targets).astype(np.int64) * len(graph) + np.maximum(sources, targets)
+        _, first = np.unique(pairs, return_index=True)
+        edges = edges[first]
+        weight = self.rank[self.edge_sources[edges]] + self.rank[graph.neighbors[edges]]
+        edges = edges[np.lexsort((edges, -weight))][:max_routes]
+
+        return {
+            "level": level,
+            "nodes": [
+                {
+                    "id": graph.codes[node],
+                    "name": self.names[node],
+                    "lat": float(graph.lat[node]),
+                    "lon": float(graph.lon[node]),
+                    "connections": int(self.rank[node]),
+                }
+                for node in nodes.tolist()
+            ],
+            "links": [
+                {
+                    "source": graph.codes[source],
+                    "target": graph.codes[target],
+                    "distance": distance,
+                }
+                for source, target, distance in zip(
+                    self.edge_sources[edges].tolist(),
+                    graph.neighbors[edges].tolist(),
+                    graph.weights[edges].tolist(),
+                )
+            ],
+        }
+
+    def airports(self, ids, distances):
+        graph = self.graph
+        return [
+            {
+                "code": graph.codes[node],
+                "name": self.names[node],
+                "lat": float(graph.lat[node]),
+                "lon": float(graph.lon[node]),
+                "distance_km": round(distance, 3),
+            }
+            for node, distance in zip(ids.tolist(), np.asarray(distances).tolist())
+        ]
+
+
+_airport_index = None
+_airport_index_lock = threading.Lock()
+
+
+def get_airport_index(graph):
+    """
+    Returns the spatial indexes for ``graph``, rebuilding them whenever
+    airports or routes are reloaded (i.e. the graph version changes).
+    """
+    global _airport_index
+
+    with _airport_index_lock:
+        if _airport_index is None or _airport_index.version != graph.version:
+            names = dict(Airport.objects.values_list("code", "name"))
+            _airport_index = AirportIndex(graph, [names.get(code, code) for code in graph.codes])
+        return _airport_index
@@ -0,0 +1,104 @@
+import random
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils.timezone import is_naive, localtime, make_aware
+
+from flights.models import Airport, Flight, Trip, TripFlight
+
+FLIGHT_SPEED_KMH = 800
+LAYOVER = timedelta(minutes=30)
+
+
+def normalize_departure(departure_time):
+    if is_naive(departure_time):
+        departure_time = make_aware(departure_time)
+    return localtime(departure_time)
+
+
+def plan_legs(path, graph, departure_time):
+    """
+    Schedules one flight per hop of ``path`` at FLIGHT_SPEED_KMH with a
+    LAYOVER between flights.
+
+    Returns (legs, time_cursor) where each leg is (origin, destination,
+    departure, arrival) and time_cursor is the time after the final layover.
+    """
+    legs = []
+    time_cursor = departure_time
+    for segment_origin, segment_destination in zip(path, path[1:]):
+        distance = graph.edge_weight(graph.index[segment_origin], graph.index[segment_destination])
+        arrival_time = time_cursor + timedelta(hours=distance / FLIGHT_SPEED_KMH)
+        legs.append((segment_origin, segment_destination, time_cursor, arrival_time))
+        time_cursor = arrival_time + LAYOVER
+    return legs, time_cursor
+
+
+def persist_trips(planned, airport_ids=None):
+    """
+    Saves planned trips atomically with one bulk INSERT per table, however many legs they have.
+
+    ``planned`` is a list of (origin code, destination code, departure time, legs)
+    as produced by plan_legs. ``airport_ids`` maps codes to Airport pks (see
+    RouteGraph.airport_pks); without it one extra query resolves them.
+    Returns a list of (Trip, [Flight, ...]) in the same order.
+    """
+    # Don't take the write lock for a batch with nothing to save
+    if not planned:
+        return []
+
+    if airport_ids is None:
+        codes = set()
+        for origin, destination, _, legs in planned:
+            codes.update((origin, destination))
+            for leg_origin, leg_destination, _, _ in legs:
+                codes.update((leg_origin, leg_destination))
+        airport_ids = dict(Airport.objects.filter(code__in=codes).values_list("code", "id"))
+
+    with transaction.atomic():
+        trips = Trip.objects.bulk_create([
+            Trip(
+                origin_id=airport_ids[origin],
+                destination_id=airport_ids[destination],
+                departure_time=departure_time,
+                first_departure_time=legs[0][2] if legs else None,
+                arrival_time=legs[-1][3] if legs else None,
+                num_flights=len(legs),
+            )
+            for origin, destination, departure_time, legs in planned
+        ])
+
+        flights = Flight.objects.bulk_create([
+            Flight(
+                flight_number="AS" + str(random.randint(1000, 9999)),
+                origin_id=airport_ids[leg_origin],
+                destination_id=airport_ids[leg_destination],
+                departure_time=leg_departure,
+                arrival_time=leg_arrival,
+                status=Flight.Statuses.scheduled,
+            )
+            for _, _, _, legs in planned
+            for leg_origin, leg_destination, leg_departure, leg_arrival in legs
+        ])
+
+        trip_flights = []
+        saved = []
+        position = 0
+        for trip, (_, _, _, legs) in zip(trips, planned):
+            trip_legs = flights[position:position + len(legs)]
+            position += len(legs)
+            trip_flights.extend(TripFlight(trip=trip, flight=flight) for flight in trip_legs)
+            saved.append((trip, trip_legs))
+        TripFlight.objects.bulk_create(trip_flights)
+
+    return saved
+
+
+def flight_summary(flight, origin_code, destination_code):
+    return {
+        "flight_number": flight.flight_number,
+        "origin": origin_code,
+        "destination": destination_code,
+        "departure_time": flight.departure_time.isoformat(),
+        "arrival_time": flight.arrival_time.isoformat(),
+    }
@@ -0,0 +1,101 @@
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+
+from flights.utils.globe import get_globe_snapshot
+from flights.utils.graph import bootstrap_route_graph, get_route_graph
+from flights.utils.schedule import get_timetable
+from flights.utils.spatial import get_airport_index
+
+logger = logging.getLogger(__name__)
+
+
+def _route_hierarchy():
+    if getattr(settings, "ROUTING_ENGINE", "astar") != "ch":
+        return None
+    from flights.utils.hierarchy import bootstrap_hierarchy
+
+    return bootstrap_hierarchy(get_route_graph(), settings.ROUTE_HIERARCHY_PATH)
+
+
+# In dependency order: reachability, the spatial index and hierarchy are built from the graph
+ARTIFACTS = {
+    "route_graph": bootstrap_route_graph,
+    "reachability": lambda: get_route_graph().reachability(),
+    "globe_snapshot": get_globe_snapshot,
+    "airport_index": lambda: get_airport_index(get_route_graph()),
+    "timetable": get_timetable,
+    "route_hierarchy": _route_hierarchy,
+}
+
+
+def warm_caches(only=None, trace_memory=False):
+    """
+    Builds, loads or maps every artifact requests depend on, rebuilding any
+    that are missing, and logs the time each took. Returns [(name, seconds,
+    bytes)]; with ``trace_memory``, bytes is the memory each allocated in
+    this process (memory-mapped files don't count), otherwise None.
+
+    Tracing slows every thread in the process several times over, so only
+    the warm_caches command turns it on.
+    """
+    timings = []
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        for name, build in ARTIFACTS.items():
+            if only and name not in only:
+                continue
+            before = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+            started = time.perf_counter()
+            if build() is None:
+                continue
+            seconds = time.perf_counter() - started
+            if trace_memory:
+                allocated = max(tracemalloc.get_traced_memory()[0] - before, 0)
+                logger.info("Warmed %s in %.3fs (%.1f MiB allocated)", name, seconds, allocated / 2**20)
+            else:
+                allocated = None
+                logger.info("Warmed %s in %.3fs", name, seconds)
+            timings.append((name, seconds, allocated))
+    finally:
+        if tracing:
+            tracemalloc.stop()
+    return timings
+
+
+_warmup_thread = None
+_warmup_pid = None
+_warmup_lock = threading.Lock()
+
+
+def _warm_in_background():
+    started = time.perf_counter()
+    try:
+        warm_caches()
+    except Exception:
+        # Requests still build what they need on demand
+        logger.exception("Cache warm-up failed")
+    else:
+        logger.info("Caches warm after %.3fs", time.perf_counter() - started)
+
+
+def start_background_warmup():
+    """
+    Warms the caches on a daemon thread, once per process, so the server
+    starts accepting requests straight away.
+    """
+    global _warmup_thread, _warmup_pid
+
+    with _warmup_lock:
+        # A forked child inherits the parent's thread object but not the thread
+        if _warmup_thread is None or _warmup_pid != os.getpid():
+            _warmup_thread = threading.Thread(target=_warm_in_background, name="warm-caches", daemon=True)
+            _warmup_pid = os.getpid()
+            _warmup_thread.start()
+        return _warmup_thread
@@ -1,41 +1,108 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponseNotFound
+from django.http import HttpResponse, HttpResponseNotFound, HttpResponseNotModified, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.dateparse import parse_datetime
-from django.utils.timezone import now, make_aware, is_naive, get_current_timezone, localtime
+from django.utils.timezone import now, get_current_timezone
+from django.db import transaction
+from django.db.models import Q
 from django.core.cache import cache
+from asgiref.sync import sync_to_async
 
-from flights.models import Airport, Route, Flight, Trip, TripFlight
-from flights.utils.routing import a_star_routing
+from flights.cache import cache_ttl
+from flights.models import Airport, Flight, Trip, TripFlight
+from flights.utils.concurrency import Overloaded, get_search_pool
+from flights.utils.geodesy import bearing_matrix, distance_matrix
+from flights.utils.globe import get_globe_snapshot
+from flights.utils.graph import get_route_graph
+from flights.utils.metrics import exposition, get_metrics
+from flights.utils.profiling import phase
+from flights.utils.route_cache import async_cached_find_route, get_route_cache
+from flights.utils.routing import isochrone, one_to_many_routing
+from flights.utils.schedule import get_timetable, invalidate_timetable
+from flights.utils.spatial import CellGrid, get_airport_index
+from flights.utils.trips import flight_summary, normalize_departure, persist_trips, plan_legs
 
-import random
 import json
-import heapq
-from datetime import timedelta
+import base64
+import asyncio
+import binascii
 from collections import defaultdict
+from datetime import timedelta
+from math import isfinite
+
+import numpy as np
+
+def overloaded():
+    response = JsonResponse({"error": "Server busy, try again shortly"}, status=503)
+    response["Retry-After"] = "1"
+    return response
+
+async def offload(fn, *args):
+    """
+    Runs fn(*args) on the search pool; concurrent calls with equal (hashable)
+    arguments share one run. Raises Overloaded when the pool is full.
+    """
+    return await get_search_pool().run((fn, *args), fn, *args)
+
+def current_airport_index():
+    return get_airport_index(get_route_graph())
+
+def encode_cursor(moment, pk):
+    raw = f"{moment.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    moment, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    moment = parse_datetime(moment)
+    if moment is None:
+        raise ValueError("Invalid cursor")
+    return moment, int(pk)
 
 def trip_list(request):
-    trips = Trip.objects.select_related('origin', 'destination').order_by('-created_at')[:20]  # Limit to 20 most recent trips
+    """
+    Newest trips first, paginated by an opaque (created_at, id) cursor so every
+    page costs one indexed query however deep the client scrolls.
+    """
+    try:
+        limit = min(int(request.GET.get("limit", 20)), getattr(settings, "TRIP_LIST_MAX_PAGE_SIZE", 100))
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    if limit < 1:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+
+    trips = (
+        Trip.objects.select_related('origin', 'destination')
+        .filter(num_flights__gt=0)
+        .order_by('-created_at', '-id')
+    )
+
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            created_at, trip_id = decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+        trips = trips.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=trip_id))
+
+    # Fetch one extra row to know whether another page exists
+    trips = list(trips[:limit + 1])
+    next_cursor = encode_cursor(trips[limit - 1].created_at, trips[limit - 1].id) if len(trips) > limit else None
     
     result = []
-    for trip in trips:
-        # Get first and last flight for arrival time
-        first_flight = TripFlight.objects.filter(trip=trip).order_by('flight__departure_time').first()
-        last_flight = TripFlight.objects.filter(trip=trip).order_by('flight__arrival_time').last()
-        
-        if first_flight and last_flight:
-            result.append({
-                "id": trip.id,
-                "origin_code": trip.origin.code,
-                "origin_name": trip.origin.name,
-                "destination_code": trip.destination.code,
-                "destination_name": trip.destination.name,
-                "departure_time": first_flight.flight.departure_time.isoformat(),
-                "arrival_time": last_flight.flight.arrival_time.isoformat(),
-                "num_flights": TripFlight.objects.filter(trip=trip).count()
-            })
+    for trip in trips[:limit]:
+        result.append({
+            "id": trip.id,
+            "origin_code": trip.origin.code,
+            "origin_name": trip.origin.name,
+            "destination_code": trip.destination.code,
+            "destination_name": trip.destination.name,
+            "departure_time": trip.first_departure_time.isoformat(),
+            "arrival_time": trip.arrival_time.isoformat(),
+            "num_flights": trip.num_flights
+        })
     
-    return JsonResponse({"trips": result})
+    return JsonResponse({"trips": result, "next_cursor": next_cursor})
 
 def trip_detail(request, trip_id): 
     try:
@@ -84,24 +151,49 @@ def trip_detail(request, trip_id):
     
     return JsonResponse(result)
 
+BOARDS = {
+    # board: (airport field, time field)
+    "departures": ("origin", "departure_time"),
+    "arrivals": ("destination", "arrival_time"),
+}
+
+def board_flights(airport, board, start, end=None, limit=5, after=None):
+    """
+    An airport's flights on a board from ``start`` (up to ``end``), soonest first.
+    ``after`` is a (time, id) keyset position to continue from. Each call is one
+    query on the board's (airport, time) index.
+    """
+    airport_field, time_field = BOARDS[board]
+    flights = Flight.objects.select_related("origin", "destination").filter(
+        **{airport_field: airport, f"{time_field}__gte": start}
+    )
+    if end is not None:
+        flights = flights.filter(**{f"{time_field}__lt": end})
+    if after is not None:
+        moment, flight_id = after
+        flights = flights.filter(Q(**{f"{time_field}__gt": moment}) | Q(**{time_field: moment, "id__gt": flight_id}))
+    return list(flights.order_by(time_field, "id")[:limit])
+
+def flight_to_dict(flight):
+    return {
+        "id": flight.id,
+        "flight_number": flight.flight_number,
+        "origin": flight.origin.code,
+        "destination": flight.destination.code,
+        "departure_time": flight.departure_time.isoformat(),
+        "arrival_time": flight.arrival_time.isoformat(),
+        "status": flight.get_status_display()
+    }
+
 def airport_detail(request, code): 
     try: 
         airport = Airport.objects.get(code=code.upper())
     except Airport.DoesNotExist: 
         return HttpResponseNotFound("Airport not found")
     
-    upcoming_departures = Flight.objects.filter(origin=airport).order_by("departure_time")[:5]
-    upcoming_arrivals = Flight.objects.filter(destination=airport).order_by("arrival_time")[:5]
-
-    def flight_to_dict(flight):
-        return {
-            "flight_number": flight.flight_number,
-            "origin": flight.origin.code,
-            "destination": flight.destination.code,
-            "departure_time": flight.departure_time.isoformat(),
-            "arrival_time": flight.arrival_time.isoformat(),
-            "status": flight.get_status_display()
-        }
+    current_time = now()
+    upcoming_departures = board_flights(airport, "departures", current_time)
+    upcoming_arrivals = board_flights(airport, "arrivals", current_time)
 
     return JsonResponse({
         "code": airport.code,
@@ -113,9 +205,111 @@ def airport_detail(request, code):
         "departures": [flight_to_dict(f) for f in upcoming_departures],
         "arrivals": [flight_to_dict(f) for f in upcoming_arrivals],
     })
+
+def board_page(code, board, start, end, limit, after):
+    """
+    One page of an airport board as a JSON-ready dict, or None for an unknown airport.
+    """
+    try:
+        airport = Airport.objects.only("id", "code").get(code=code)
+    except Airport.DoesNotExist:
+        return None
+
+    # Fetch one extra row to know whether another page exists
+    flights = board_flights(airport, board, start, end, limit + 1, after)
+    next_cursor = None
+    if len(flights) > limit:
+        last = flights[limit - 1]
+        next_cursor = encode_cursor(getattr(last, BOARDS[board][1]), last.id)
+
+    return {
+        "code": airport.code,
+        "board": board,
+        "from": start.isoformat(),
+        "until": end.isoformat(),
+        "flights": [flight_to_dict(f) for f in flights[:limit]],
+        "next_cursor": next_cursor,
+    }
+
+def airport_board(request, code, board):
+    """
+    Upcoming departures or arrivals at an airport, soonest first, within a time
+    window (?from=, default the current minute, plus ?hours=) and paginated
+    by an opaque (time, id) cursor. Pages are cached for CACHE_TTLS["boards"]
+    seconds, so new flights can take that long to show up.
+    """
+    try:
+        limit = min(int(request.GET.get("limit", 20)), getattr(settings, "AIRPORT_BOARD_MAX_PAGE_SIZE", 100))
+        hours = min(float(request.GET.get("hours", 24)), getattr(settings, "AIRPORT_BOARD_MAX_HOURS", 168))
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit or hours"}, status=400)
+    if limit < 1 or not hours > 0:
+        return JsonResponse({"error": "Invalid limit or hours"}, status=400)
+
+    # Whole minutes, so requests within the same minute share cache entries
+    start = now().replace(second=0, microsecond=0)
+    if "from" in request.GET:
+        start = parse_datetime(request.GET["from"])
+        if start is None:
+            return JsonResponse({"error": "Invalid from"}, status=400)
+        start = normalize_departure(start)
+
+    after = None
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    code = code.upper()
+    end = start + timedelta(hours=hours)
+    key = "board:{}:{}:{}:{}:{}:{}".format(code, board, start.isoformat(), hours, limit, cursor or "")
+    page = cache.get_or_set(key, lambda: board_page(code, board, start, end, limit, after), timeout=cache_ttl("boards"))
+    if page is None:
+        return HttpResponseNotFound("Airport not found")
+    return JsonResponse(page)
         
+def scheduled_trip(origin_id, destination_id, departure_time):
+    """
+    Books the earliest-arriving chain of existing scheduled flights instead of inventing new ones.
+    """
+    min_connection = getattr(settings, "MIN_CONNECTION_MINUTES", 30) * 60
+    for _ in range(2):
+        journey = get_timetable().earliest_arrival(
+            origin_id, destination_id, int(departure_time.timestamp()), min_connection
+        )
+        if not journey.flight_ids:
+            return JsonResponse({"error": "No route found"}, status=404)
+
+        flights = Flight.objects.select_related("origin", "destination").in_bulk(journey.flight_ids)
+        if len(flights) == len(journey.flight_ids):
+            break
+        # A flight was deleted after the timetable was loaded: search again on a fresh one
+        invalidate_timetable()
+    else:
+        return JsonResponse({"error": "Scheduled flights changed while booking, try again"}, status=409)
+    legs = [flights[flight_id] for flight_id in journey.flight_ids]
+
+    with transaction.atomic():
+        trip = Trip.objects.create(
+            origin_id=origin_id,
+            destination_id=destination_id,
+            departure_time=departure_time,
+            first_departure_time=legs[0].departure_time,
+            arrival_time=legs[-1].arrival_time,
+            num_flights=len(legs),
+        )
+        TripFlight.objects.bulk_create([TripFlight(trip=trip, flight=flight) for flight in legs])
+
+    return JsonResponse({
+        "trip_id": trip.id,
+        "route": [flight_summary(flight, flight.origin.code, flight.destination.code) for flight in legs],
+        "total_duration_minutes": (legs[-1].arrival_time - departure_time).total_seconds() / 60
+    })
+
 @csrf_exempt
-def compute_trip(request):
+async def compute_trip(request):
     if request.method != "POST":
         return JsonResponse({"error": "Only POST method allowed"}, status=405)
 
@@ -124,154 +318,443 @@ def compute_trip(request):
         start_code = data["origin_id"].upper()
         destination_code = data["destination_id"].upper()
         departure_time = parse_datetime(data["departure_time"])
+        if departure_time is None:
+            return JsonResponse({"error": "Invalid departure_time"}, status=400)
+        departure_time = normalize_departure(departure_time)
 
-        try:
-            origin = Airport.objects.get(code=start_code)
-            destination = Airport.objects.get(code=destination_code)
-        except Airport.DoesNotExist:
+        # The graph holds every airport, so it doubles as the code -> pk map
+        graph = await sync_to_async(get_route_graph)()
+        if start_code not in graph or destination_code not in graph:
             return JsonResponse({"error": "Invalid airport code"}, status=404)
+        airport_ids = graph.airport_pks()
         
-        globe_data_cache = cache.get('globe_data')
-        if not globe_data_cache:
-            return JsonResponse({"error": "Globe data not available"}, status=500)
-        
-        graph = defaultdict(list)
-        airports_cache = {}
-        
-        for node in globe_data_cache['nodes']:
-            airports_cache[node['id']] = {
-                'code': node['id'],
-                'latitude': node['lat'],
-                'longitude': node['lon']
-            }
+        if data.get("mode") == "schedule":
+            return await sync_to_async(scheduled_trip)(airport_ids[start_code], airport_ids[destination_code], departure_time)
         
-        for link in globe_data_cache['links']:
-            source = link['source']
-            target = link['target']
-            distance = link['distance']
-            
-            graph[source].append((target, distance))
-            graph[target].append((source, distance))
-        
-        # Use our custom A* function with cached data
-        path = a_star_routing(origin.code, destination.code, graph, airports_cache)
+        # Airports in different components: answer without searching
+        if not graph.reachability().reachable(graph.index[start_code], graph.index[destination_code]):
+            return JsonResponse({"error": "No route found"}, status=404)
+
+        path = (await async_cached_find_route(start_code, destination_code, graph)).path
         
         if not path or len(path) < 2:
             return JsonResponse({"error": "No route found"}, status=404)
         
-        departure_time = parse_datetime(data["departure_time"])
-        if is_naive(departure_time):
-            departure_time = make_aware(departure_time)
-        departure_time = localtime(departure_time)
-        trip = Trip.objects.create(origin=origin, destination=destination, departure_time=departure_time)
-        
-        flights_created = []
-        time_cursor = departure_time
-        
-        for i in range(len(path) - 1):
-            segment_origin_code = path[i]
-            segment_destination_code = path[i + 1]
-            
-            segment_origin = Airport.objects.get(code=segment_origin_code)
-            segment_destination = Airport.objects.get(code=segment_destination_code)
-            
-            distance = next((dist for neighbor, dist in graph[segment_origin_code] 
-                           if neighbor == segment_destination_code), None)
-            
-            if distance is None:
-                route = Route.objects.filter(
-                    origin=segment_origin, 
-                    destination=segment_destination
-                ).order_by('distance').first()
-                
-                if route is None:
-                    return JsonResponse({"error": f"No route found between {segment_origin_code} and {segment_destination_code}"}, status=404)
-                
-                distance = route.distance
-            
-            # Calculate flight time based on distance
-            flight_duration = timedelta(hours=distance / 800)  # Assuming 800km/hr flight speed
-            arrival_time = time_cursor + flight_duration
-            
-            if is_naive(time_cursor):
-                time_cursor = make_aware(time_cursor)
-            if is_naive(arrival_time):
-                arrival_time = make_aware(arrival_time)
-
-            time_cursor = localtime(time_cursor)
-            arrival_time = localtime(arrival_time)
-
-            flight = Flight.objects.create(
-                flight_number="AS" + str(random.randint(1000, 9999)),
-                origin=segment_origin,
-                destination=segment_destination,
-                departure_time=time_cursor,
-                arrival_time=arrival_time,
-                status=Flight.Statuses.scheduled
-            )
-
-            TripFlight.objects.create(trip=trip, flight=flight)
-            flights_created.append({
-                "flight_number": flight.flight_number,
-                "origin": segment_origin.code,
-                "destination": segment_destination.code,
-                "departure_time": flight.departure_time.isoformat(),
-                "arrival_time": flight.arrival_time.isoformat()
-            })
-
-            time_cursor = arrival_time + timedelta(minutes=30)  # Assume 30 min layover
+        with phase("plan"):
+            legs, time_cursor = plan_legs(path, graph, departure_time)
+        with phase("write"):
+            [(trip, flights)] = await sync_to_async(persist_trips)([(start_code, destination_code, departure_time, legs)], airport_ids)
 
         return JsonResponse({
             "trip_id": trip.id,
-            "route": flights_created,
+            "route": [flight_summary(flight, leg[0], leg[1]) for flight, leg in zip(flights, legs)],
             "total_duration_minutes": (time_cursor - departure_time).total_seconds() / 60
         })
 
+    except Overloaded:
+        return overloaded()
     except KeyError as e:
         return JsonResponse({"error": f"Missing parameter: {str(e)}"}, status=400)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+@csrf_exempt
+async def compute_trips(request):
+    """
+    Batch version of compute_trip: {"trips": [{origin_id, destination_id, departure_time}, ...]}.
+
+    Pairs sharing an origin are routed with one one-to-many search and all
+    trips are saved in a single transaction. Results come back in request
+    order, each either a trip or {"error", "status"}.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST method allowed"}, status=405)
+
+    try:
+        items = json.loads(request.body)["trips"]
+    except (ValueError, TypeError):
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    except KeyError as e:
+        return JsonResponse({"error": f"Missing parameter: {str(e)}"}, status=400)
+
+    max_batch = getattr(settings, "TRIP_BATCH_MAX_SIZE", 500)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({"error": "trips must be a non-empty list"}, status=400)
+    if len(items) > max_batch:
+        return JsonResponse({"error": f"At most {max_batch} trips per batch"}, status=400)
+
+    graph = await sync_to_async(get_route_graph)()
+    results = [None] * len(items)
+    by_origin = defaultdict(list)
+
+    for i, item in enumerate(items):
+        try:
+            start_code = item["origin_id"].upper()
+            destination_code = item["destination_id"].upper()
+            departure_time = parse_datetime(item["departure_time"])
+        except KeyError as e:
+            results[i] = {"error": f"Missing parameter: {str(e)}", "status": 400}
+            continue
+        except (AttributeError, TypeError, ValueError):
+            results[i] = {"error": "Invalid trip parameters", "status": 400}
+            continue
+
+        if departure_time is None:
+            results[i] = {"error": "Invalid departure_time", "status": 400}
+        elif start_code not in graph or destination_code not in graph:
+            results[i] = {"error": "Invalid airport code", "status": 404}
+        elif not graph.reachability().reachable(graph.index[start_code], graph.index[destination_code]):
+            results[i] = {"error": "No route found", "status": 404}
+        else:
+            by_origin[start_code].append((i, destination_code, normalize_departure(departure_time)))
+
+    route_cache = get_route_cache()
+    # The shared cache does file I/O, so lookups and stores run off the event loop
+    with phase("route_cache"):
+        cached = await sync_to_async(route_cache.get_many)([
+            (start_code, destination_code, "dijkstra", graph.version)
+            for start_code, pairs in by_origin.items()
+            for _, destination_code, _ in pairs
+        ])
+    routes = {(start_code, destination_code): result for (start_code, destination_code, _, _), result in cached.items()}
+    searches = {}
+    for start_code, pairs in by_origin.items():
+        missing = frozenset(destination_code for _, destination_code, _ in pairs if routes[start_code, destination_code] is None)
+        if missing:
+            searches[start_code] = offload(one_to_many_routing, start_code, missing, graph)
+
+    # One one-to-many search per origin, run side by side on the search pool
+    try:
+        with phase("search"):
+            found = await asyncio.gather(*searches.values())
+    except Overloaded:
+        return overloaded()
+    searched = {}
+    for start_code, origin_routes in zip(searches, found):
+        for destination_code, result in origin_routes.items():
+            searched[start_code, destination_code, "dijkstra", graph.version] = result
+            routes[start_code, destination_code] = result
+    if searched:
+        with phase("route_cache"):
+            await sync_to_async(route_cache.set_many)(searched)
+
+    planned = []
+    planned_index = []
+    for start_code, pairs in by_origin.items():
+        for i, destination_code, departure_time in pairs:
+            path = routes[start_code, destination_code].path
+            if not path or len(path) < 2:
+                results[i] = {"error": "No route found", "status": 404}
+                continue
+            legs, time_cursor = plan_legs(path, graph, departure_time)
+            planned.append((start_code, destination_code, departure_time, legs))
+            planned_index.append((i, time_cursor))
+
+    with phase("write"):
+        saved = await sync_to_async(persist_trips)(planned, graph.airport_pks())
+    for (trip, flights), (_, _, departure_time, legs), (i, time_cursor) in zip(saved, planned, planned_index):
+        results[i] = {
+            "trip_id": trip.id,
+            "route": [
+                flight_summary(flight, leg[0], leg[1]) for flight, leg in zip(flights, legs)
+            ],
+            "total_duration_minutes": (time_cursor - departure_time).total_seconds() / 60,
+        }
+
+    return JsonResponse({"results": results})
+
 def globe_data(request): 
-    # Limited dataset for development
-    N = 800
+    """
+    Serves the published globe snapshot: one cache read, no queries, and a
+    304 when the client already has this version.
+    """
+    snapshot = get_globe_snapshot()
     
-    # Good seed for graph
-    random.seed(31)
+    if snapshot.etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        response = HttpResponseNotModified()
+    else:
+        body, encoding = snapshot.encoded(request.headers.get("Accept-Encoding", ""))
+        response = HttpResponse(body, content_type="application/json")
+        if encoding:
+            response["Content-Encoding"] = encoding
     
-    route_ids = list(Route.objects.values_list("id", flat=True))
-    sampled_ids = random.sample(route_ids, N)
+    response["ETag"] = snapshot.etag
+    response["Vary"] = "Accept-Encoding"
+    response["Cache-Control"] = "no-cache"
+    return response
 
-    routes = Route.objects.filter(id__in=sampled_ids)
 
-    airport_codes = set()
-    for route in routes:
-        airport_codes.add(route.origin.code)
-        airport_codes.add(route.destination.code)
+async def globe_lod(request):
+    """
+    Airports and routes for one view of the globe, busiest first.
 
-    airports = Airport.objects.filter(code__in=airport_codes)
-    
-    nodes = [
-        {
-            "id": airport.code, 
-            "name": airport.name, 
-            "lat": airport.latitude, 
-            "lon": airport.longitude
-        } for airport in airports
-    ]
-    
-    links = [
+    Takes ?bbox=min_lat,min_lon,max_lat,max_lon or ?lat=&lon= (view center)
+    plus ?zoom= (0 to CellGrid.MAX_LEVEL); at zoom z the view spans 180 / 2**z
+    degrees of latitude.
+    """
+    try:
+        zoom = max(0, min(int(request.GET.get("zoom", 0)), CellGrid.MAX_LEVEL))
+        if "bbox" in request.GET:
+            min_lat, min_lon, max_lat, max_lon = (float(v) for v in request.GET["bbox"].split(","))
+            if not all(isfinite(v) for v in (min_lat, min_lon, max_lat, max_lon)):
+                raise ValueError("bbox must be finite")
+        else:
+            lat, lon = float(request.GET["lat"]), float(request.GET["lon"])
+            if not (isfinite(lat) and isfinite(lon)):
+                raise ValueError("lat and lon must be finite")
+            half_lat, half_lon = 90.0 / 2 ** zoom, 180.0 / 2 ** zoom
+            min_lat, max_lat = lat - half_lat, lat + half_lat
+            min_lon, max_lon = lon - half_lon, lon + half_lon
+            if max_lon - min_lon >= 360:
+                min_lon, max_lon = -180.0, 180.0
+            else:
+                min_lon = (min_lon + 180) % 360 - 180
+                max_lon = (max_lon + 180) % 360 - 180
+        max_airports = min(int(request.GET.get("max_airports", 200)), getattr(settings, "GLOBE_LOD_MAX_AIRPORTS", 500))
+        max_routes = min(int(request.GET.get("max_routes", 800)), getattr(settings, "GLOBE_LOD_MAX_ROUTES", 2000))
+    except KeyError:
+        return JsonResponse({"error": "Provide bbox or lat and lon"}, status=400)
+    except ValueError:
+        return JsonResponse({"error": "Invalid viewport parameters"}, status=400)
+
+    index = await sync_to_async(current_airport_index)()
+    try:
+        view = await offload(
+            index.view, max(min_lat, -90.0), min_lon, min(max_lat, 90.0), max_lon, zoom, max(max_airports, 0), max(max_routes, 0)
+        )
+    except Overloaded:
+        return overloaded()
+    return JsonResponse(view)
+
+
+def isochrone_results(graph, origin, max_hours, max_hops):
+    reached = isochrone(origin, graph, max_hours, max_hops)
+    lat, lon = graph.lat[reached.nodes].tolist(), graph.lon[reached.nodes].tolist()
+    return [
         {
-            "source": route.origin.code, 
-            "target": route.destination.code,
-            "distance": route.distance
-        } for route in routes
+            "code": graph.codes[node],
+            "lat": lat[i],
+            "lon": lon[i],
+            "hours": round(hours, 3),
+            "hops": hops,
+            "via": graph.codes[parent] if parent != -1 else None,
+        }
+        for i, (node, hours, hops, parent) in enumerate(zip(
+            reached.nodes.tolist(), reached.hours.tolist(), reached.hops.tolist(), reached.parent.tolist()
+        ))
     ]
-    
-    globe_data = {"nodes": nodes, "links": links}
-    cache.set('globe_data', globe_data, timeout=3600)
-    
-    return JsonResponse(globe_data)
 
+async def airport_isochrone(request, code):
+    """
+    Every airport reachable from ``code`` within ?hours= (and at most ?hops=
+    flights), fastest first, with the airport each one is reached from.
+    Travel times follow compute_trip's flight speed and layovers.
+    """
+    try:
+        max_hours = float(request.GET.get("hours", 12))
+        max_hops = int(request.GET["hops"]) if "hops" in request.GET else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid hours or hops"}, status=400)
+    if not 0 <= max_hours <= getattr(settings, "ISOCHRONE_MAX_HOURS", 72):
+        return JsonResponse({"error": "Invalid hours"}, status=400)
+    if max_hops is not None and not 0 <= max_hops <= getattr(settings, "ISOCHRONE_MAX_HOPS", 12):
+        return JsonResponse({"error": "Invalid hops"}, status=400)
+
+    graph = await sync_to_async(get_route_graph)()
+    code = code.upper()
+    if code not in graph:
+        return HttpResponseNotFound("Airport not found")
+
+    try:
+        airports = await offload(isochrone_results, graph, code, max_hours, max_hops)
+    except Overloaded:
+        return overloaded()
+    return JsonResponse({"origin": code, "hours": max_hours, "hops": max_hops, "count": len(airports), "airports": airports})
+
+
+def search_points(request):
+    """
+    Reads query points for the airport search endpoints: ?lat=&lon= on GET,
+    or {"points": [[lat, lon], ...]} on POST. Returns (points, params, is_batch).
+    """
+    if request.method == "POST":
+        params = json.loads(request.body)
+        points = [(float(lat), float(lon)) for lat, lon in params["points"]]
+        if len(points) > getattr(settings, "AIRPORT_SEARCH_MAX_BATCH", 1000):
+            raise ValueError("Too many points")
+        is_batch = True
+    else:
+        params = request.GET
+        points = [(float(params["lat"]), float(params["lon"]))]
+        is_batch = False
+
+    if any(not -90 <= lat <= 90 or not -180 <= lon <= 180 for lat, lon in points):
+        raise ValueError("Coordinates out of range")
+    return points, params, is_batch
+
+def nearest_results(index, points, k):
+    return [index.airports(*index.tree.nearest(lat, lon, k)) for lat, lon in points]
+
+def within_results(index, points, radius_km, limit):
+    results = []
+    for lat, lon in points:
+        ids, distances = index.tree.within(lat, lon, radius_km)
+        results.append(index.airports(ids[:limit], distances[:limit]))
+    return results
+
+@csrf_exempt
+async def nearest_airports(request):
+    """
+    The k airports closest to each point, nearest first.
+    """
+    try:
+        points, params, is_batch = search_points(request)
+        k = min(int(params.get("k", 5)), getattr(settings, "AIRPORT_SEARCH_MAX_RESULTS", 500))
+        if k < 1:
+            raise ValueError("k must be at least 1")
+    except KeyError as e:
+        return JsonResponse({"error": f"Missing parameter: {str(e)}"}, status=400)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({"error": str(e) or "Invalid parameters"}, status=400)
+
+    index = await sync_to_async(current_airport_index)()
+    try:
+        results = await offload(nearest_results, index, tuple(points), k)
+    except Overloaded:
+        return overloaded()
+    return JsonResponse({"results": results} if is_batch else {"airports": results[0]})
+
+@csrf_exempt
+async def airports_within(request):
+    """
+    Every airport within radius_km of each point, nearest first (capped).
+    """
+    try:
+        points, params, is_batch = search_points(request)
+        radius_km = float(params["radius_km"])
+        if not (isfinite(radius_km) and radius_km >= 0):
+            raise ValueError("radius_km must be a finite number of at least 0")
+    except KeyError as e:
+        return JsonResponse({"error": f"Missing parameter: {str(e)}"}, status=400)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({"error": str(e) or "Invalid parameters"}, status=400)
+
+    index = await sync_to_async(current_airport_index)()
+    limit = getattr(settings, "AIRPORT_SEARCH_MAX_RESULTS", 500)
+    try:
+        results = await offload(within_results, index, tuple(points), radius_km, limit)
+    except Overloaded:
+        return overloaded()
+    return JsonResponse({"results": results} if is_batch else {"airports": results[0]})
+
+def distance_matrices(graph, origins, destinations):
+    sources = [graph.index[code] for code in origins]
+    targets = [graph.index[code] for code in destinations]
+    return {
+        "origins": list(origins),
+        "destinations": list(destinations),
+        "distances": distance_matrix(graph, sources, targets).round(3).tolist(),
+        "bearings": bearing_matrix(graph, sources, targets).round(3).tolist(),
+    }
+
+@csrf_exempt
+async def airport_distances(request):
+    """
+    Great-circle distance matrix (km) and initial bearings (degrees) between two
+    lists of airport codes: ?origins=JFK,LHR&destinations=CDG on GET, or
+    {"origins": [...], "destinations": [...]} on POST. Destinations default to the origins.
+    """
+    try:
+        if request.method == "POST":
+            params = json.loads(request.body)
+            origins = [str(code).upper() for code in params["origins"]]
+            destinations = [str(code).upper() for code in params.get("destinations", origins)]
+        else:
+            origins = [code.strip().upper() for code in request.GET["origins"].split(",") if code.strip()]
+            destinations = request.GET.get("destinations")
+            destinations = [code.strip().upper() for code in destinations.split(",") if code.strip()] if destinations else origins
+    except KeyError as e:
+        return JsonResponse({"error": f"Missing parameter: {str(e)}"}, status=400)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Invalid parameters"}, status=400)
+
+    if not origins or not destinations:
+        return JsonResponse({"error": "origins and destinations must be non-empty"}, status=400)
+    max_cells = getattr(settings, "DISTANCE_MATRIX_MAX_CELLS", 250000)
+    if len(origins) * len(destinations) > max_cells:
+        return JsonResponse({"error": f"At most {max_cells} origin/destination pairs"}, status=400)
+
+    graph = await sync_to_async(get_route_graph)()
+    unknown = sorted({code for code in origins + destinations if code not in graph})
+    if unknown:
+        return JsonResponse({"error": "Invalid airport code", "codes": unknown}, status=404)
+
+    try:
+        return JsonResponse(await offload(distance_matrices, graph, tuple(origins), tuple(destinations)))
+    except Overloaded:
+        return overloaded()
+
+def component_summary(request):
+    """
+    Counts and largest weakly/strongly connected components of the route network.
+    """
+    try:
+        limit = min(int(request.GET.get("limit", 20)), getattr(settings, "COMPONENTS_MAX_RESULTS", 1000))
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+
+    graph = get_route_graph()
+    return JsonResponse({"version": graph.version, **graph.reachability().summary(max(limit, 0))})
+
+def component_members(request, kind, component_id):
+    """
+    Airports in one weak or strong component (ids as listed by component_summary).
+    """
+    if kind not in ("weak", "strong"):
+        return HttpResponseNotFound("Unknown component kind")
+
+    graph = get_route_graph()
+    labels = getattr(graph.reachability(), kind)
+    members = [graph.codes[node] for node in np.flatnonzero(labels == component_id).tolist()]
+    if not members:
+        return HttpResponseNotFound("Component not found")
+
+    return JsonResponse({"kind": kind, "id": component_id, "size": len(members), "airports": members})
+
+def airport_component(request, code):
+    """
+    Which components an airport belongs to and how many airports its routes
+    lead to; ?to=CODE also answers whether that airport is reachable.
+    """
+    graph = get_route_graph()
+    code = code.upper()
+    if code not in graph:
+        return HttpResponseNotFound("Airport not found")
+
+    reachability = graph.reachability()
+    node = graph.index[code]
+    weak, strong = int(reachability.weak[node]), int(reachability.strong[node])
+    result = {
+        "code": code,
+        "weak": {"id": weak, "size": int(reachability.weak_sizes[weak])},
+        "strong": {"id": strong, "size": int(reachability.strong_sizes[strong])},
+        "reachable_airports": reachability.reachable_count(node),
+    }
+
+    if "to" in request.GET:
+        destination = request.GET["to"].upper()
+        if destination not in graph:
+            return HttpResponseNotFound("Airport not found")
+        result["to"] = destination
+        result["reachable"] = reachability.reachable(node, graph.index[destination])
+
+    return JsonResponse(result)
 
+def metrics(request):
+    """
+    Counters and histograms of every worker, in the Prometheus text format.
+    """
+    if not getattr(settings, "METRICS_ENABLED", True):
+        return HttpResponseNotFound("Metrics are disabled")
+    return HttpResponse(exposition(get_metrics().collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
 
@@ -0,0 +1,9 @@
+# Loaded by gunicorn from the working directory
+
+
+def post_worker_init(worker):
+    # Runs in each worker once the app is loaded, also under --preload,
+    # where anything the master started before forking wouldn't carry over
+    from flights.apps import start_serving
+
+    start_serving()